@@ -0,0 +1,118 @@
+from datetime import datetime, timezone
+from hashlib import sha256
+from typing import Callable
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from Library_service import versions
+
+
+class ConditionalGetMixin:
+    """
+    Add strong ETag & Last-Modified validators to list and retrieve actions
+    and return 304 Not Modified without serializing data when client's
+    copy is still valid. Validators are built from version scopes which
+    views bump when their data changed (see get_version_scopes)
+    """
+
+    def get_version_scopes(self) -> tuple[str, ...]:
+        """Return version scopes which representation of data depends on"""
+        raise NotImplementedError
+
+    def get_validators(self, request: Request) -> tuple[str, datetime]:
+        """Return strong ETag and last modification time of response"""
+        scope_versions = versions.get_versions(*self.get_version_scopes())
+        state = "|".join(
+            [
+                request.build_absolute_uri(),
+                str(request.accepted_media_type),
+                *(
+                    f"{scope}={version}"
+                    for scope, (version, _) in sorted(scope_versions.items())
+                ),
+            ]
+        )
+        etag = f'"{sha256(state.encode()).hexdigest()}"'
+        last_modified = max(
+            modified for _, modified in scope_versions.values()
+        )
+        return etag, datetime.fromtimestamp(int(last_modified), timezone.utc)
+
+    @staticmethod
+    def _is_not_modified(
+        request: Request, etag: str, last_modified: datetime
+    ) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return "*" in etags or etag in etags
+
+        if_modified_since = parse_http_date_safe(
+            request.headers.get("If-Modified-Since", "")
+        )
+        return bool(
+            if_modified_since
+            and last_modified.timestamp() <= if_modified_since
+        )
+
+    def _object_exists(self) -> bool:
+        """Check that object of retrieve action can be found"""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            return queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).exists()
+        except (TypeError, ValueError):
+            return False
+
+    def _conditional_response(
+        self,
+        handler: Callable,
+        request: Request,
+        *args,
+        exists: Callable[[], bool] = lambda: True,
+        **kwargs,
+    ) -> Response:
+        etag, last_modified = self.get_validators(request)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": http_date(last_modified.timestamp()),
+        }
+
+        # Validators are made without the object, so missing object is
+        # answered by handler with 404 instead of 304
+        if self._is_not_modified(request, etag, last_modified) and exists():
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers=headers
+            )
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            for header, value in headers.items():
+                response.headers[header] = value
+        return response
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        return self._conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        return self._conditional_response(
+            super().retrieve,
+            request,
+            *args,
+            exists=self._object_exists,
+            **kwargs,
+        )
+
+
+def user_scope(name: str, request: Request) -> str:
+    """Return scope of all rows for staff and only self rows for others"""
+    if request.user.is_staff:
+        return name
+    return f"{name}:user:{request.user.id}"
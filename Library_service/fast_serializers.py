@@ -0,0 +1,345 @@
+from collections import defaultdict
+from operator import itemgetter
+from typing import Any, Callable, Optional, Type
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import QuerySet
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from Library_service.fieldsets import get_fieldsets
+
+# Fields which representation is the database value itself
+PLAIN_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.EmailField,
+    serializers.IntegerField,
+    PrimaryKeyRelatedField,
+    serializers.SlugRelatedField,
+)
+# Fields which representation is made by to_representation of the value
+VALUE_FIELDS = (
+    serializers.ChoiceField,
+    serializers.DateField,
+    serializers.DateTimeField,
+    serializers.DecimalField,
+    serializers.FloatField,
+    serializers.TimeField,
+    serializers.UUIDField,
+    serializers.URLField,
+)
+
+
+class NotCompilable(Exception):
+    """Serializer has fields which can not be read from .values() rows"""
+
+
+def _model_field(model: Type[models.Model], name: str) -> Optional[Any]:
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _value_getter(column: str, field: serializers.Field) -> Callable:
+    """Return getter of field representation from values row"""
+    get = itemgetter(column)
+    if type(field) in PLAIN_FIELDS:
+        return lambda row, related: get(row)
+
+    convert = field.to_representation
+
+    def getter(row: dict, related: dict) -> Any:
+        value = get(row)
+        return None if value is None else convert(value)
+
+    return getter
+
+
+def _nested_getter(column: str, getters: list) -> Callable:
+    """Return getter of nested object or None if relation is empty"""
+
+    def getter(row: dict, related: dict) -> Optional[dict]:
+        if row[column] is None:
+            return None
+        return {name: get(row, related) for name, get in getters}
+
+    return getter
+
+
+def _relation_getter(name: str, pk_name: str) -> Callable:
+    def getter(row: dict, related: dict) -> list:
+        return related[name].get(row[pk_name], [])
+
+    return getter
+
+
+class FastSerializer:
+    """
+    Read-only representation of ModelSerializer compiled to getters over
+    .values() rows. Nested serializers of forward relations are read from
+    the same rows by joins, reverse relations of top level serializer
+    (ids or nested serializers) are read by one query per relation for
+    the whole page. Output is the same as serializer.data
+    """
+
+    def __init__(self, serializer_class: Type[serializers.Serializer]):
+        serializer = serializer_class(context={})
+        self.model = serializer.Meta.model
+        self.pk_name = self.model._meta.pk.attname
+        self.columns = [self.pk_name]
+        # (field name, related model, foreign key name, nested plan)
+        self.relations = []
+        # (field name, getter, annotation column or None)
+        self.getters = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            model_field = self._get_model_field(self.model, name, field)
+            if isinstance(
+                field, (serializers.ListSerializer, ManyRelatedField)
+            ):
+                self.getters.append(
+                    (name, self._compile_relation(field, model_field), None)
+                )
+            elif model_field is None:
+                if type(field) not in PLAIN_FIELDS + VALUE_FIELDS:
+                    raise NotCompilable(f"{name} is not a plain field")
+                # Annotation which is given only by some querysets
+                self.getters.append(
+                    (name, _value_getter(field.source, field), field.source)
+                )
+            else:
+                self.getters.append(
+                    (name, self._compile(field, model_field, ""), None)
+                )
+
+    @staticmethod
+    def _get_model_field(
+        model: Type[models.Model], name: str, field: serializers.Field
+    ) -> Optional[Any]:
+        if field.source == "*" or "." in field.source:
+            raise NotCompilable(f"{name} source is not a model field")
+        return _model_field(model, field.source)
+
+    def _compile(
+        self, field: serializers.Field, model_field: Any, prefix: str
+    ) -> Callable:
+        """Return getter of field from values row of model or relation"""
+        column = f"{prefix}{field.source}"
+
+        if isinstance(field, serializers.ModelSerializer):
+            if not (model_field.many_to_one or model_field.one_to_one):
+                raise NotCompilable(f"{column} is not forward relation")
+            self.columns.append(column)
+            getters = []
+            for name, nested in field.fields.items():
+                if nested.write_only:
+                    continue
+                nested_model_field = self._get_model_field(
+                    model_field.related_model, name, nested
+                )
+                if nested_model_field is None:
+                    # Nested instances do not have annotations
+                    continue
+                getters.append(
+                    (
+                        name,
+                        self._compile(
+                            nested, nested_model_field, f"{column}__"
+                        ),
+                    )
+                )
+            return _nested_getter(column, getters)
+
+        if isinstance(field, serializers.SlugRelatedField):
+            column = f"{column}__{field.slug_field}"
+        elif isinstance(field, PrimaryKeyRelatedField):
+            if field.pk_field is not None:
+                raise NotCompilable(f"{column} has pk_field")
+        elif type(field) not in PLAIN_FIELDS + VALUE_FIELDS:
+            raise NotCompilable(f"{column} is not a plain field")
+        elif model_field.is_relation:
+            raise NotCompilable(f"{column} is relation of plain field")
+
+        self.columns.append(column)
+        return _value_getter(column, field)
+
+    def _compile_relation(
+        self, field: serializers.Field, model_field: Optional[Any]
+    ) -> Callable:
+        """Compile reverse foreign key represented by ids or serializer"""
+        name = field.field_name
+        if model_field is None or not model_field.one_to_many:
+            raise NotCompilable(f"{name} is not reverse foreign key")
+
+        if isinstance(field, ManyRelatedField):
+            if type(field.child_relation) is not PrimaryKeyRelatedField:
+                raise NotCompilable(f"{name} is not list of ids")
+            plan = None
+        else:
+            plan = FastSerializer(type(field.child))
+            if plan.relations:
+                raise NotCompilable(f"{name} has nested many relations")
+
+        self.relations.append(
+            (name, model_field.related_model, model_field.field.name, plan)
+        )
+        return _relation_getter(name, self.pk_name)
+
+    def _get_annotations(self, queryset: QuerySet) -> set:
+        return {
+            column
+            for _, _, column in self.getters
+            if column is not None and column in queryset.query.annotations
+        }
+
+    def values(self, queryset: QuerySet) -> QuerySet:
+        """Return queryset of rows with all columns of representation"""
+        columns = self.columns + sorted(self._get_annotations(queryset))
+        # Ordering fields & annotations (ex. search rank) are used by
+        # keyset pagination
+        for name in queryset.query.order_by or self.model._meta.ordering:
+            if isinstance(name, str):
+                name = name.lstrip("-")
+                if (
+                    _model_field(self.model, name) is not None
+                    or name in queryset.query.annotations
+                ):
+                    columns.append(name)
+        return (
+            queryset.select_related(None)
+            .prefetch_related(None)
+            .values(*dict.fromkeys(columns))
+        )
+
+    def instance(self, row: dict, using: str) -> models.Model:
+        """
+        Return model instance of row for object permissions. Fields which
+        are not in row are deferred & loaded on access
+        """
+        names = [
+            field.attname
+            for field in self.model._meta.concrete_fields
+            if field.attname in row
+        ]
+        return self.model.from_db(using, names, [row[name] for name in names])
+
+    def _load_relations(self, rows: list) -> dict:
+        """Read reverse relations of all rows grouped by parent id"""
+        related = {}
+        if not self.relations:
+            return related
+
+        ids = [row[self.pk_name] for row in rows]
+        for name, model, foreign_key, plan in self.relations:
+            grouped = defaultdict(list)
+            queryset = model.objects.filter(**{f"{foreign_key}__in": ids})
+            if plan is None:
+                for parent_id, pk in queryset.values_list(foreign_key, "pk"):
+                    grouped[parent_id].append(pk)
+            else:
+                for row in queryset.values(
+                    *dict.fromkeys([foreign_key, *plan.columns])
+                ):
+                    grouped[row[foreign_key]].append(plan.to_dict(row))
+            related[name] = grouped
+        return related
+
+    def to_dict(self, row: dict) -> dict:
+        """Return representation of row without annotations"""
+        return {
+            name: get(row, {})
+            for name, get, column in self.getters
+            if column is None
+        }
+
+    def serialize(self, rows: list, queryset: QuerySet) -> list[dict]:
+        """Return representations of rows of values() queryset"""
+        rows = list(rows)
+        related = self._load_relations(rows)
+        annotations = frozenset(self._get_annotations(queryset))
+        getters = [
+            (name, get)
+            for name, get, column in self.getters
+            if column is None or column in annotations
+        ]
+        return [
+            {name: get(row, related) for name, get in getters} for row in rows
+        ]
+
+
+_compiled = {}
+
+
+def get_fast_serializer(
+    serializer_class: Type[serializers.Serializer],
+) -> Optional[FastSerializer]:
+    """
+    Return compiled serializer or None if serializer has fields which are
+    not supported by fast path
+    """
+    if serializer_class not in _compiled:
+        try:
+            _compiled[serializer_class] = FastSerializer(serializer_class)
+        except NotCompilable:
+            _compiled[serializer_class] = None
+    return _compiled[serializer_class]
+
+
+class FastReadMixin:
+    """
+    Serve list and retrieve actions by compiled serializers reading
+    .values() rows instead of building model instances and serializer
+    fields for every object. Requests with sparse fieldsets use serializers
+    """
+
+    fast_actions = ("list", "retrieve")
+
+    def get_fast_serializer(self) -> Optional[FastSerializer]:
+        if (
+            self.action not in self.fast_actions
+            or get_fieldsets(self.request) is not None
+        ):
+            return None
+        return get_fast_serializer(self.get_serializer_class())
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        fast_serializer = self.get_fast_serializer()
+        if fast_serializer is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = fast_serializer.values(queryset)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                fast_serializer.serialize(page, queryset)
+            )
+        return Response(fast_serializer.serialize(rows, queryset))
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        fast_serializer = self.get_fast_serializer()
+        if fast_serializer is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            row = fast_serializer.values(queryset).get(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (queryset.model.DoesNotExist, TypeError, ValueError):
+            raise Http404
+        self.check_object_permissions(
+            request, fast_serializer.instance(row, queryset.db)
+        )
+
+        return Response(fast_serializer.serialize([row], queryset)[0])
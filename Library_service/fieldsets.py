@@ -0,0 +1,136 @@
+from typing import Optional
+
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+
+FIELDS_QUERY_PARAM = "fields"
+OMIT_QUERY_PARAM = "omit"
+
+
+def _parse_paths(value: str) -> dict:
+    """
+    Convert comma separated dotted paths to tree of field names
+    (ex. "id,book.title" -> {"id": {}, "book": {"title": {}}})
+    """
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for name in path.strip().split("."):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def get_fieldsets(request: Optional[Request]) -> Optional[tuple[dict, dict]]:
+    """
+    Return (fields, omit) trees of sparse fieldset query params. Return
+    None if they are not given or request is not safe, because writable
+    fields can not be dropped
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    only = _parse_paths(request.query_params.get(FIELDS_QUERY_PARAM, ""))
+    omit = _parse_paths(request.query_params.get(OMIT_QUERY_PARAM, ""))
+    if not only and not omit:
+        return None
+    return only, omit
+
+
+def is_field_requested(fieldsets: Optional[tuple], name: str) -> bool:
+    """Check top level field is kept in response by sparse fieldsets"""
+    if fieldsets is None:
+        return True
+    only, omit = fieldsets
+    if only and name not in only:
+        return False
+    return omit.get(name) != {}
+
+
+def _flatten_lookups(tree: dict, prefix: str = "") -> list[str]:
+    """Convert select_related tree of query to list of lookups"""
+    lookups = []
+    for name, children in tree.items():
+        lookup = f"{prefix}{name}"
+        lookups.extend(_flatten_lookups(children, f"{lookup}__") or [lookup])
+    return lookups
+
+
+class SparseFieldsetsMixin:
+    """
+    Serializer mixin dropping fields by ?fields= and ?omit= query params
+    (ex. ?fields=id,book.title&omit=book.daily_fee). Nested serializers
+    with this mixin take their part of dotted paths
+    """
+
+    def _get_fieldsets(self) -> Optional[tuple[dict, dict]]:
+        if hasattr(self, "_sparse_fieldsets"):
+            return self._sparse_fieldsets
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return None
+        return get_fieldsets(self.context.get("request"))
+
+    def get_fields(self) -> dict:
+        fields = super().get_fields()
+        fieldsets = self._get_fieldsets()
+        if fieldsets is None:
+            return fields
+
+        only, omit = fieldsets
+        for name in list(fields):
+            if not is_field_requested(fieldsets, name):
+                del fields[name]
+                continue
+
+            nested = fields[name]
+            if isinstance(nested, serializers.ListSerializer):
+                nested = nested.child
+            if isinstance(nested, SparseFieldsetsMixin):
+                nested_fieldsets = (only.get(name, {}), omit.get(name, {}))
+                if any(nested_fieldsets):
+                    nested._sparse_fieldsets = nested_fieldsets
+        return fields
+
+
+class SparseFieldsetsViewMixin:
+    """
+    Drop select_related and prefetch_related lookups of relations which
+    are not requested by sparse fieldsets from view queryset
+    """
+
+    def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+        queryset = super().filter_queryset(queryset)
+        fieldsets = get_fieldsets(self.request)
+        if fieldsets is None:
+            return queryset
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            lookups = [
+                lookup
+                for lookup in _flatten_lookups(select_related)
+                if is_field_requested(fieldsets, lookup.split("__")[0])
+            ]
+            queryset = queryset.select_related(None)
+            if lookups:
+                queryset = queryset.select_related(*lookups)
+
+        prefetch_related = queryset._prefetch_related_lookups
+        if prefetch_related:
+            queryset = queryset.prefetch_related(None).prefetch_related(
+                *(
+                    lookup
+                    for lookup in prefetch_related
+                    if is_field_requested(
+                        fieldsets,
+                        getattr(lookup, "prefetch_through", lookup).split(
+                            "__"
+                        )[0],
+                    )
+                )
+            )
+        return queryset
@@ -0,0 +1,114 @@
+from functools import wraps
+from hashlib import sha256
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+RESPONSE_KEY = "idempotency:{key}"
+LOCK_KEY = "idempotency:{key}:lock"
+# Response headers replayed with stored response
+STORED_HEADERS = ("Location",)
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    IDEMPOTENCY_HEADER,
+    type=OpenApiTypes.STR,
+    location=OpenApiParameter.HEADER,
+    description="Unique key of request. Retries with the same key get "
+    "the first response without repeating the action",
+)
+
+
+def _scope_key(request: Request, key: str) -> str:
+    """Key is unique for user & endpoint, so it is hashed with them"""
+    scope = f"{request.user.pk}|{request.method}|{request.path}|{key}"
+    return sha256(scope.encode()).hexdigest()
+
+
+def _fingerprint(request: Request) -> str:
+    return sha256(request.body).hexdigest()
+
+
+def _replay(stored: dict, fingerprint: str) -> Response:
+    if stored["fingerprint"] != fingerprint:
+        return Response(
+            {"error": f"{IDEMPOTENCY_HEADER} is used by other request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        stored["data"],
+        status=stored["status"],
+        headers={**stored["headers"], REPLAYED_HEADER: "true"},
+    )
+
+
+def idempotent(handler: Callable) -> Callable:
+    """
+    Make view action idempotent by Idempotency-Key request header.
+    Successful response is stored for IDEMPOTENCY_KEY_TTL seconds and
+    replayed to retries with the same key, so action side effects are not
+    repeated. Concurrent retries get 409 while the first request is
+    handled. Lock of key is released by its request, IDEMPOTENCY_LOCK_TIMEOUT
+    only saves from dead workers
+    """
+
+    @wraps(handler)
+    def wrapper(view, request: Request, *args, **kwargs) -> Response:
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return handler(view, request, *args, **kwargs)
+
+        scope_key = _scope_key(request, key)
+        response_key = RESPONSE_KEY.format(key=scope_key)
+        lock_key = LOCK_KEY.format(key=scope_key)
+        fingerprint = _fingerprint(request)
+
+        stored = cache.get(response_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+        if not cache.add(
+            lock_key, 1, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT
+        ):
+            return Response(
+                {
+                    "error": f"Request with this {IDEMPOTENCY_HEADER} "
+                    "is in progress"
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            # Response could be stored by the previous lock owner
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            response = handler(view, request, *args, **kwargs)
+            # Failed requests have no side effects and can be retried
+            if status.is_success(response.status_code):
+                cache.set(
+                    response_key,
+                    {
+                        "fingerprint": fingerprint,
+                        "status": response.status_code,
+                        "data": response.data,
+                        "headers": {
+                            header: response[header]
+                            for header in STORED_HEADERS
+                            if response.has_header(header)
+                        },
+                    },
+                    timeout=settings.IDEMPOTENCY_KEY_TTL,
+                )
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    return wrapper
@@ -0,0 +1,62 @@
+from django.core.cache import cache
+
+METRICS_KEY_PREFIX = "metrics"
+
+
+def _metric_key(name: str) -> str:
+    return f"{METRICS_KEY_PREFIX}:{name}"
+
+
+def incr(name: str, delta: int = 1) -> None:
+    """Increase counter shared between all workers through cache"""
+    key = _metric_key(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def get_counters(*names: str) -> dict:
+    """Return current values of counters by their names"""
+    values = cache.get_many([_metric_key(name) for name in names])
+    return {name: values.get(_metric_key(name), 0) for name in names}
+
+
+# Upper bounds of latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def observe(
+    name: str, seconds: float, buckets: tuple = LATENCY_BUCKETS
+) -> None:
+    """
+    Count duration in histogram shared between all workers. Only the
+    bucket of the value is increased, cumulative counts are made on read
+    """
+    bucket = next(
+        (str(bound) for bound in buckets if seconds <= bound), "+Inf"
+    )
+    incr(f"{name}:bucket:{bucket}")
+    incr(f"{name}:count")
+    incr(f"{name}:sum_ms", round(seconds * 1000))
+
+
+def get_histogram(name: str, buckets: tuple = LATENCY_BUCKETS) -> dict:
+    """Return count, sum (seconds) & cumulative bucket counts of histogram"""
+    bounds = [str(bound) for bound in buckets] + ["+Inf"]
+    counters = get_counters(
+        f"{name}:count",
+        f"{name}:sum_ms",
+        *(f"{name}:bucket:{bound}" for bound in bounds),
+    )
+    cumulative = {}
+    total = 0
+    for bound in bounds:
+        total += counters[f"{name}:bucket:{bound}"]
+        cumulative[bound] = total
+    return {
+        "count": counters[f"{name}:count"],
+        "sum": counters[f"{name}:sum_ms"] / 1000,
+        "buckets": cumulative,
+    }
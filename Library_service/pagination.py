@@ -0,0 +1,227 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+from decimal import Decimal
+from typing import Any, Optional
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Field, Q, QuerySet
+from django.db.models.expressions import OrderBy
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value: Any) -> Any:
+    """Convert ordering field value to JSON compatible value"""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination for existing clients and keyset (cursor)
+    pagination when "cursor" query param is given (ex. ?cursor= for the
+    first page). Keyset pages are filtered by composite key of queryset
+    ordering fields plus id, so every page costs the same as the first one
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def _get_ordering(self, queryset: QuerySet) -> Optional[list]:
+        """
+        Return list of (field name, descending) pairs of queryset ordering
+        with primary key as tie-breaker. Return None if ordering contains
+        expressions which can not be used as key
+        """
+        if queryset.query.order_by:
+            order_by = queryset.query.order_by
+        elif queryset.query.default_ordering:
+            order_by = queryset.model._meta.ordering
+        else:
+            order_by = ()
+
+        pk_name = queryset.model._meta.pk.attname
+        ordering = []
+        for item in order_by:
+            if isinstance(item, str):
+                name, descending = item.lstrip("-"), item.startswith("-")
+            elif isinstance(item, OrderBy) and isinstance(item.expression, F):
+                name, descending = item.expression.name, item.descending
+            else:
+                return None
+            if "__" in name or name == "?":
+                return None
+            ordering.append((pk_name if name == "pk" else name, descending))
+
+        if pk_name not in (name for name, _ in ordering):
+            descending = ordering[0][1] if ordering else False
+            ordering.append((pk_name, descending))
+        return ordering
+
+    def _encode_cursor(self, position: list, reverse: bool) -> str:
+        cursor = json.dumps({"p": position, "r": reverse}, default=str)
+        return urlsafe_b64encode(cursor.encode()).decode()
+
+    def get_count(self, queryset: QuerySet) -> int:
+        """Count rows without annotations which are only selected"""
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.values("pk")
+        return super().get_count(queryset)
+
+    def _get_field(self, queryset: QuerySet, name: str) -> Field:
+        """Return model field or output field of annotation used in key"""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def _decode_cursor(
+        self, cursor: str, queryset: QuerySet
+    ) -> tuple[Optional[list], bool]:
+        """
+        Return position & direction of cursor. Position values are converted
+        by their ordering fields, so tampered cursor is not found instead of
+        failing the query
+        """
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(cursor.encode()))
+            position, reverse = data["p"], bool(data["r"])
+            if not isinstance(position, list) or len(position) != len(
+                self.ordering
+            ):
+                raise ValueError
+            position = [
+                self._get_field(queryset, name).to_python(value)
+                for (name, _), value in zip(self.ordering, position)
+            ]
+            if None in position:
+                raise ValueError
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _keyset_filter(self, position: list, reverse: bool) -> Q:
+        """
+        Build (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ... condition, where
+        comparison direction depends on field ordering and page direction
+        """
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, position):
+            lookup = "lt" if descending != reverse else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _get_position(self, row: Any) -> list:
+        if isinstance(row, dict):
+            return [_encode_value(row[name]) for name, _ in self.ordering]
+        return [_encode_value(getattr(row, name)) for name, _ in self.ordering]
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view=None
+    ) -> Optional[list]:
+        self.keyset = False
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.ordering = self._get_ordering(queryset)
+        if self.ordering is None:
+            # Pages are linked by offset, cursor is dropped from the links
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        self.request = request
+        self.limit = self.get_limit(request)
+        position, reverse = self._decode_cursor(
+            request.query_params[self.cursor_query_param], queryset
+        )
+
+        queryset = queryset.order_by(
+            *(
+                f"{'-' if descending != reverse else ''}{name}"
+                for name, descending in self.ordering
+            )
+        )
+        if position is not None:
+            queryset = queryset.filter(self._keyset_filter(position, reverse))
+
+        results = list(queryset[: self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[: self.limit]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results and (has_more or reverse):
+            self.next_position = self._get_position(results[-1])
+        if results and (has_more if reverse else position is not None):
+            self.previous_position = self._get_position(results[0])
+        return results
+
+    def _get_cursor_link(
+        self, position: Optional[list], reverse: bool
+    ) -> Optional[str]:
+        if position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self._encode_cursor(position, reverse),
+        )
+
+    def _get_offset_link(self, link: Optional[str]) -> Optional[str]:
+        if link is None:
+            return None
+        return remove_query_param(link, self.cursor_query_param)
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.keyset:
+            return self._get_offset_link(super().get_next_link())
+        return self._get_cursor_link(self.next_position, reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.keyset:
+            return self._get_offset_link(super().get_previous_link())
+        return self._get_cursor_link(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data: list) -> Response:
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["required"] = ["results"]
+        return response_schema
+
+    def get_schema_operation_parameters(self, view) -> list:
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append(
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Keyset pagination cursor. Pass empty value "
+                "for the first page and then follow next and previous links",
+                "schema": {"type": "string"},
+            }
+        )
+        return parameters
@@ -0,0 +1,47 @@
+import time
+
+from django.core.cache import cache
+
+RATE_LIMIT_KEY = "ratelimit:{name}:{window}"
+
+
+class RateLimitExceeded(Exception):
+    """No token is left in the bucket during allowed wait"""
+
+
+class TokenBucket:
+    """
+    Rate limit of calls shared by all workers through cache. Bucket holds
+    `rate` tokens and is refilled every second; tokens are taken by atomic
+    INCR of the counter of the current second
+    """
+
+    def __init__(self, name: str, rate: int, max_wait: float) -> None:
+        self.name = name
+        self.rate = rate
+        self.max_wait = max_wait
+
+    def _take(self, window: int) -> bool:
+        key = RATE_LIMIT_KEY.format(name=self.name, window=window)
+        cache.add(key, 0, timeout=2)
+        try:
+            return cache.incr(key) <= self.rate
+        except ValueError:
+            # Counter is expired between add and incr
+            cache.set(key, 1, timeout=2)
+            return True
+
+    def acquire(self) -> None:
+        """
+        Take a token, waiting for the next refills at most max_wait
+        seconds. Raise RateLimitExceeded if no token is taken
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            now = time.time()
+            if self._take(int(now)):
+                return
+            wait = int(now) + 1 - now
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"Rate limit of {self.name} exceeded")
+            time.sleep(wait)
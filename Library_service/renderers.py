@@ -0,0 +1,54 @@
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Dates and datetimes are passed to JSONEncoder to keep DRF formats
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def encode_default(obj):
+    """
+    Convert values which are not JSON types the same way as DRF JSON
+    encoder (ex. Decimal to float, datetime to ISO 8601 with "Z")
+    """
+    return JSONEncoder().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSON renderer by orjson. Output is the same as output of DRF
+    JSONRenderer with default settings (compact, not escaped unicode)
+    """
+
+    def render(
+        self, data, accepted_media_type=None, renderer_context=None
+    ) -> bytes:
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        option = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=encode_default, option=option)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack renderer for clients sending Accept: application/msgpack.
+    Values are converted like in JSON responses, so decimals and dates
+    have the same representation in both formats
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(
+        self, data, accepted_media_type=None, renderer_context=None
+    ) -> bytes:
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=encode_default, datetime=False)
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
+
 import os
 import sys
 from datetime import timedelta
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "django_q",
@@ -167,6 +169,17 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": (
+        "Library_service.renderers.ORJSONRenderer",
+        "Library_service.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "Library_service.parsers.ORJSONParser",
+        "Library_service.parsers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination."
     "LimitOffsetPagination",
     "PAGE_SIZE": 10,
@@ -183,7 +196,17 @@ SIMPLE_JWT = {
 # Telegram bot
 BOT_API = os.getenv("BOT_API")
 
+# Telegram outbox: messages sent by one task run, attempts of a message
+# and delay before the first retry (seconds), doubled by every attempt.
+# Messages are sent to chats by at most CONCURRENCY requests at once
+TELEGRAM_OUTBOX_BATCH_SIZE = 50
+TELEGRAM_OUTBOX_MAX_ATTEMPTS = 5
+TELEGRAM_OUTBOX_RETRY_DELAY = 60
+TELEGRAM_SEND_CONCURRENCY = 10
+
 # Redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis")
+
 Q_CLUSTER = {
     "name": "myproject",
     "workers": 4,
@@ -195,12 +218,80 @@ Q_CLUSTER = {
     "cpu_affinity": 1,
     "label": "Django Q",
     "retry": 120,
-    "redis": "redis://redis",
+    "redis": REDIS_URL,
+}
+
+# Cache shares Redis with Django-Q cluster
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "library",
+    }
 }
 
+if "test" in sys.argv:
+    CACHES["default"].update(
+        {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    )
+
+# Read-through cache of book list & detail responses (seconds)
+BOOK_CACHE_TIMEOUT = 60 * 60
+
+# How often autocomplete index checks that books are changed (seconds)
+AUTOCOMPLETE_CHECK_INTERVAL = 1
+
+# Rebuild autocomplete index of changed books by background thread instead
+# of request thread
+AUTOCOMPLETE_REBUILD_IN_BACKGROUND = True
+
 # STRIPE settings
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
 
+# Stripe client: connection pool size, timeouts (seconds), retries of
+# network & server errors and requests per second shared by all workers
+# with the longest wait for rate limit (seconds)
+STRIPE_POOL_SIZE = 10
+STRIPE_CONNECT_TIMEOUT = 3
+STRIPE_READ_TIMEOUT = 10
+STRIPE_MAX_RETRIES = 2
+STRIPE_RATE_LIMIT = 25
+STRIPE_RATE_LIMIT_WAIT = 2
+# Base URL of local fake Stripe API (ex. stripe-mock), real API if not set
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
+
+# Signing secret of Stripe webhook endpoint
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+
+# Checkout session polled by "is_success" is retrieved from Stripe by one
+# request at a time and cached for TTL seconds, concurrent polls do not
+# wait for it and return status saved by webhook
+STRIPE_SESSION_STATUS_TTL = 5
+
+# When checkout session of new payment is started: "eager" in request,
+# "lazy" on the first visit of payment "pay" endpoint or "background" by
+# Django-Q worker after commit (and by "pay" endpoint if worker is late)
+STRIPE_CHECKOUT_MODE = os.getenv("STRIPE_CHECKOUT_MODE", "eager")
+
+# Open payments older than session duration (hours) are expired by
+# batches of rows, their Stripe checkout sessions are expired if enabled
+PAYMENT_SESSION_DURATION = 24
+PAYMENT_EXPIRY_BATCH_SIZE = 5000
+PAYMENT_EXPIRY_STRIPE_SESSIONS = False
+
+# Responses of actions with Idempotency-Key are replayed to retries for
+# TTL seconds, concurrent retries get 409 while the first request holds
+# the lock. Lock outlives the request: it can make a Stripe call with
+# every retry (timeouts, rate limit wait & backoff of at most 2 seconds)
+# and database work of 30 seconds at most
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = (
+    (STRIPE_MAX_RETRIES + 1)
+    * (STRIPE_CONNECT_TIMEOUT + STRIPE_READ_TIMEOUT + STRIPE_RATE_LIMIT_WAIT)
+    + STRIPE_MAX_RETRIES * 2
+    + 30
+)
+
 HOST = os.getenv("HOST")
 
 SPECTACULAR_SETTINGS = {
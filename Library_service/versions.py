@@ -0,0 +1,69 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "version:{scope}"
+MODIFIED_KEY = "version:{scope}:modified"
+
+
+def _epoch() -> int:
+    """
+    Return first version of scope which has no version in cache. Versions
+    are kept only in cache, so after eviction or flush they start from
+    current time in nanoseconds instead of 1 and never repeat versions
+    which were given to clients before in ETags
+    """
+    return time.time_ns()
+
+
+def _bump(scopes: tuple[str, ...]) -> None:
+    now = time.time()
+    for scope in scopes:
+        key = VERSION_KEY.format(scope=scope)
+        cache.add(key, _epoch(), timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _epoch(), timeout=None)
+    cache.set_many(
+        {MODIFIED_KEY.format(scope=scope): now for scope in scopes},
+        timeout=None,
+    )
+
+
+def bump(*scopes: str) -> None:
+    """
+    Change versions of data scopes. Versions are changed at once and again
+    after commit, so data read concurrently from not committed state can
+    not be stored under new version
+    """
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def get_versions(*scopes: str) -> dict[str, tuple[int, float]]:
+    """Return (version, modification time) pairs of data scopes"""
+    keys = {}
+    for scope in scopes:
+        keys[scope] = (
+            VERSION_KEY.format(scope=scope),
+            MODIFIED_KEY.format(scope=scope),
+        )
+    values = cache.get_many([key for pair in keys.values() for key in pair])
+
+    versions = {}
+    for scope, (version_key, modified_key) in keys.items():
+        if version_key not in values or modified_key not in values:
+            cache.add(version_key, _epoch(), timeout=None)
+            cache.add(modified_key, time.time(), timeout=None)
+            values.update(cache.get_many([version_key, modified_key]))
+        versions[scope] = (
+            values.get(version_key) or _epoch(),
+            values.get(modified_key, time.time()),
+        )
+    return versions
+
+
+def get_version(scope: str) -> int:
+    return get_versions(scope)[scope][0]
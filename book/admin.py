@@ -1,5 +1,6 @@
 from django.contrib import admin
 
-from book.models import Book
+from book.models import Book, BookPopularity
 
 admin.site.register(Book)
+admin.site.register(BookPopularity)
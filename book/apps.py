@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_search_index(using: str, **kwargs) -> None:
+    """Create FTS5 search index when tables created in SQLite database"""
+    from django.db import connections
+
+    from book.search import create_sqlite_fts_index
+
+    if connections[using].vendor == "sqlite":
+        create_sqlite_fts_index(using)
 
 
 class BooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "book"
+
+    def ready(self) -> None:
+        from book import signals  # noqa: F401
+
+        post_migrate.connect(create_search_index, sender=self)
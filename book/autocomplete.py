@@ -0,0 +1,145 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+
+from Library_service import versions
+from book import cache as book_cache
+from book.models import Book
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def _word_keys(text: str) -> list[str]:
+    """Return text from every word start (ex. "a b" -> ["a b", "b"])"""
+    words = _normalize(text).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class AutocompleteIndex:
+    """
+    In-memory sorted prefix index of book titles and authors. Every word of
+    title or author is a key, so "ring" matches "The Lord of the Rings".
+    Lookup is a binary search over the keys
+    """
+
+    def __init__(self, rows: list[tuple[int, str, str]]) -> None:
+        self.labels = {}
+        title_keys = []
+        author_keys = []
+        for book_id, title, author in rows:
+            self.labels[book_id] = f"{title} ({author})"
+            title_keys.extend((key, book_id) for key in _word_keys(title))
+            author_keys.extend((key, book_id) for key in _word_keys(author))
+        title_keys.sort()
+        author_keys.sort()
+        self.title_keys = [key for key, _ in title_keys]
+        self.title_ids = [book_id for _, book_id in title_keys]
+        self.author_keys = [key for key, _ in author_keys]
+        self.author_ids = [book_id for _, book_id in author_keys]
+
+    @staticmethod
+    def _match(keys: list, ids: list, prefix: str, limit: int) -> list:
+        matched = []
+        position = bisect_left(keys, prefix)
+        while (
+            position < len(keys)
+            and keys[position].startswith(prefix)
+            and len(matched) < limit
+        ):
+            if ids[position] not in matched:
+                matched.append(ids[position])
+            position += 1
+        return matched
+
+    def search(self, query: str, limit: int) -> list[dict]:
+        """Return books matched by title and then by author prefix"""
+        prefix = _normalize(query)
+        if not prefix:
+            return []
+        book_ids = self._match(self.title_keys, self.title_ids, prefix, limit)
+        for book_id in self._match(
+            self.author_keys, self.author_ids, prefix, limit
+        ):
+            if len(book_ids) >= limit:
+                break
+            if book_id not in book_ids:
+                book_ids.append(book_id)
+        return [
+            {"id": book_id, "label": self.labels[book_id]}
+            for book_id in book_ids
+        ]
+
+
+_index: Optional[AutocompleteIndex] = None
+_index_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _get_version() -> tuple[int, float]:
+    """Version with modification time, which changes if cache is flushed"""
+    return versions.get_versions(book_cache.NAMES_SCOPE)[
+        book_cache.NAMES_SCOPE
+    ]
+
+
+def _build_index() -> None:
+    global _index, _index_version
+    version = _get_version()
+    _index = AutocompleteIndex(
+        list(Book.objects.order_by().values_list("id", "title", "author"))
+    )
+    _index_version = version
+
+
+def _rebuild_index() -> None:
+    """Rebuild index in background thread, which holds the lock"""
+    try:
+        _build_index()
+    finally:
+        _lock.release()
+        connection.close()
+
+
+def get_index() -> AutocompleteIndex:
+    """
+    Return index of this process. Version of book names is checked not
+    more often than AUTOCOMPLETE_CHECK_INTERVAL seconds. Only the first
+    index is built in request thread, changed books are indexed by
+    background thread while requests use the previous index (see
+    AUTOCOMPLETE_REBUILD_IN_BACKGROUND)
+    """
+    global _checked_at
+    now = time.monotonic()
+    if _index is not None and (
+        now - _checked_at < settings.AUTOCOMPLETE_CHECK_INTERVAL
+    ):
+        return _index
+
+    _checked_at = now
+    if _index is not None and _index_version == _get_version():
+        return _index
+
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _build_index()
+        return _index
+
+    if _lock.acquire(blocking=False):
+        if _index_version == _get_version():
+            _lock.release()
+        elif settings.AUTOCOMPLETE_REBUILD_IN_BACKGROUND:
+            threading.Thread(target=_rebuild_index, daemon=True).start()
+        else:
+            try:
+                _build_index()
+            finally:
+                _lock.release()
+    return _index
@@ -0,0 +1,89 @@
+from hashlib import sha256
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from Library_service import metrics, versions
+
+CATALOG_SCOPE = "book"
+BULK_SCOPE = "book:bulk"
+# Changed only by changes of book titles & authors (not by inventory)
+NAMES_SCOPE = "book:names"
+# Changed by rollup of book popularity, only lists ordered by it depend on it
+POPULARITY_SCOPE = "book:popularity"
+HIT_COUNTER = "book_cache:hits"
+MISS_COUNTER = "book_cache:misses"
+
+
+def book_scope(book_id: int) -> str:
+    """Version scope changed by changes of one book"""
+    return f"book:{book_id}"
+
+
+def list_scopes(by_popularity: bool = False) -> tuple[str, ...]:
+    """Book list changes with all books and with popularity it is ordered by"""
+    if by_popularity:
+        return CATALOG_SCOPE, POPULARITY_SCOPE
+    return (CATALOG_SCOPE,)
+
+
+def list_key(url: str, by_popularity: bool = False) -> str:
+    """Return key of book list page for current catalog version"""
+    scopes = list_scopes(by_popularity)
+    scope_versions = versions.get_versions(*scopes)
+    version = ".".join(str(scope_versions[scope][0]) for scope in scopes)
+    digest = sha256(url.encode()).hexdigest()
+    return f"book:list:{version}:{digest}"
+
+
+def detail_scopes(book_id: int) -> tuple[str, str]:
+    """Book detail changes with the book and with bulk catalog changes"""
+    return book_scope(book_id), BULK_SCOPE
+
+
+def detail_key(book_id: int, url: str) -> str:
+    """Return key of book detail for current book version"""
+    scope_versions = versions.get_versions(*detail_scopes(book_id))
+    version = ".".join(
+        str(scope_versions[scope][0]) for scope in detail_scopes(book_id)
+    )
+    digest = sha256(url.encode()).hexdigest()
+    return f"book:detail:{book_id}:{version}:{digest}"
+
+
+def read(key: str) -> Optional[Any]:
+    """Return cached data and count cache hit or miss"""
+    data = cache.get(key)
+    metrics.incr(MISS_COUNTER if data is None else HIT_COUNTER)
+    return data
+
+
+def write(key: str, data: Any) -> None:
+    cache.set(key, data, timeout=settings.BOOK_CACHE_TIMEOUT)
+
+
+def invalidate_book(book_id: Optional[int] = None) -> None:
+    """
+    Invalidate book detail & all list pages. Without book id invalidate all
+    books, it is used after bulk changes
+    """
+    if book_id is None:
+        versions.bump(CATALOG_SCOPE, BULK_SCOPE)
+    else:
+        versions.bump(CATALOG_SCOPE, book_scope(book_id))
+
+
+def invalidate_popularity() -> None:
+    """Invalidate book lists ordered by popularity"""
+    versions.bump(POPULARITY_SCOPE)
+
+
+def invalidate_names() -> None:
+    """Invalidate data built from book titles and authors"""
+    versions.bump(NAMES_SCOPE)
+
+
+def get_stats() -> dict:
+    counters = metrics.get_counters(HIT_COUNTER, MISS_COUNTER)
+    return {"hits": counters[HIT_COUNTER], "misses": counters[MISS_COUNTER]}
@@ -0,0 +1,61 @@
+import csv
+import json
+from typing import Iterable, Iterator
+
+from book.models import Book
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_FIELDS = ("id", "title", "author", "cover", "inventory", "daily_fee")
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+BUFFER_SIZE = 64 * 1024
+
+
+class _Echo:
+    """File-like object which returns written value instead of storing it"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _csv_lines(rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(rows: Iterable[tuple]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str) + "\n"
+
+
+def _buffered(lines: Iterable[str], size: int) -> Iterator[str]:
+    """Join small lines to chunks of about given size"""
+    buffer = []
+    buffer_size = 0
+    for line in lines:
+        buffer.append(line)
+        buffer_size += len(line)
+        if buffer_size >= size:
+            yield "".join(buffer)
+            buffer = []
+            buffer_size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def export_books(file_format: str, chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Yield all books as CSV or NDJSON text chunks. Rows are fetched by
+    server-side cursor chunks, so memory use does not depend on catalog size
+    """
+    rows = (
+        Book.objects.order_by("id")
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    lines = _csv_lines(rows) if file_format == "csv" else _ndjson_lines(rows)
+    return _buffered(lines, BUFFER_SIZE)
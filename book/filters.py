@@ -0,0 +1,155 @@
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from django.db.models import Count, F, Q, QuerySet
+from rest_framework.exceptions import ValidationError
+
+from book.models import Book
+
+AUTHOR_FACET_SIZE = 20
+POPULARITY_ORDERINGS = {
+    "popular": "popularity__total",
+    "popular_month": "popularity__month",
+    "popular_week": "popularity__week",
+}
+FEE_RANGES = (
+    ("0-1", None, Decimal("1")),
+    ("1-2", Decimal("1"), Decimal("2")),
+    ("2-5", Decimal("2"), Decimal("5")),
+    ("5+", Decimal("5"), None),
+)
+
+
+def _params_to_list(value: str) -> list[str]:
+    """Converts comma separated values to list of not empty strings"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _param_to_decimal(name: str, value: str) -> Decimal:
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "A valid number is required"})
+    if not number.is_finite():
+        raise ValidationError({name: "A valid number is required"})
+    return number
+
+
+def _fee_range(low: Optional[Decimal], high: Optional[Decimal]) -> Q:
+    """Fee range including low & excluding high bound"""
+    condition = Q()
+    if low is not None:
+        condition &= Q(daily_fee__gte=low)
+    if high is not None:
+        condition &= Q(daily_fee__lt=high)
+    return condition
+
+
+def filter_books(queryset: QuerySet, params: dict) -> QuerySet:
+    """
+    Filter books by authors (ex. ?author=Tolkien,Orwell), cover
+    (ex. ?cover=Hard), availability (ex. ?available=1) and daily fee range
+    (ex. ?min_fee=1&max_fee=2.5)
+    """
+    authors = params.get("author")
+    cover = params.get("cover")
+    available = params.get("available")
+    min_fee = params.get("min_fee")
+    max_fee = params.get("max_fee")
+
+    if authors:
+        queryset = queryset.filter(author__in=_params_to_list(authors))
+
+    if cover:
+        if cover not in Book.CoverChoices.values:
+            raise ValidationError(
+                {
+                    "cover": "Choose one of "
+                    f"{', '.join(Book.CoverChoices.values)}"
+                }
+            )
+        queryset = queryset.filter(cover=cover)
+
+    if available:
+        if available not in ("0", "1"):
+            raise ValidationError({"available": "Use 1 or 0"})
+        if available == "1":
+            queryset = queryset.filter(inventory__gt=0)
+        else:
+            queryset = queryset.filter(inventory=0)
+
+    if min_fee:
+        queryset = queryset.filter(
+            daily_fee__gte=_param_to_decimal("min_fee", min_fee)
+        )
+
+    if max_fee:
+        queryset = queryset.filter(
+            daily_fee__lte=_param_to_decimal("max_fee", max_fee)
+        )
+
+    return queryset
+
+
+def order_books(queryset: QuerySet, ordering: str) -> QuerySet:
+    """
+    Order books by precomputed popularity ranking (ex. ?ordering=popular,
+    ?ordering=popular_week). Books are ordered by raw window column and
+    book id like (window DESC, book) popularity indexes. Books without
+    popularity row are the last, ordered by id
+    """
+    if ordering not in POPULARITY_ORDERINGS:
+        raise ValidationError(
+            {"ordering": f"Choose one of {', '.join(POPULARITY_ORDERINGS)}"}
+        )
+    return queryset.order_by(
+        F(POPULARITY_ORDERINGS[ordering]).desc(nulls_last=True),
+        F("popularity__book").asc(),
+        "id",
+    )
+
+
+def get_facets(queryset: QuerySet) -> dict:
+    """
+    Count filtered books by authors (top AUTHOR_FACET_SIZE), covers,
+    availability and daily fee ranges in three grouped queries
+    """
+    queryset = queryset.order_by()
+
+    authors = (
+        queryset.values("author")
+        .annotate(count=Count("id"))
+        .order_by("-count", "author")[:AUTHOR_FACET_SIZE]
+    )
+    covers = queryset.values("cover").annotate(count=Count("id"))
+    counts = queryset.aggregate(
+        available=Count("id", filter=Q(inventory__gt=0)),
+        not_available=Count("id", filter=Q(inventory=0)),
+        **{
+            f"fee_{label}": Count("id", filter=_fee_range(low, high))
+            for label, low, high in FEE_RANGES
+        },
+    )
+
+    return {
+        "author": [
+            {"value": row["author"], "count": row["count"]} for row in authors
+        ],
+        "cover": [
+            {"value": row["cover"], "count": row["count"]}
+            for row in sorted(covers, key=lambda row: row["cover"])
+        ],
+        "available": [
+            {"value": 1, "count": counts["available"]},
+            {"value": 0, "count": counts["not_available"]},
+        ],
+        "daily_fee": [
+            {
+                "value": label,
+                "min_fee": low and str(low),
+                "max_fee": high and str(high),
+                "count": counts[f"fee_{label}"],
+            }
+            for label, low, high in FEE_RANGES
+        ],
+    }
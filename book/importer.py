@@ -0,0 +1,159 @@
+import csv
+import json
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional, TextIO
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from book import cache as book_cache
+from book.models import Book
+
+IMPORT_FORMATS = ("csv", "jsonl")
+IMPORT_FIELDS = ("title", "author", "cover", "inventory", "daily_fee")
+UNIQUE_FIELDS = ("title", "author", "cover")
+UPDATE_FIELDS = ("inventory", "daily_fee")
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class ImportResult:
+    """Progress of books import with report of invalid rows"""
+
+    processed: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line: int, errors: dict) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+
+def get_file_format(file_name: str) -> Optional[str]:
+    """Return import format by file extension"""
+    extension = file_name.rsplit(".", 1)[-1].lower()
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    return None
+
+
+def _read_rows(stream: TextIO, file_format: str) -> Iterator[tuple]:
+    """Yield (line number, row or error) pairs reading stream line by line"""
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, {"non_field_errors": [str(error)]}
+            continue
+        if not isinstance(row, dict):
+            row = {"non_field_errors": ["Row must be a JSON object"]}
+        yield line_number, row
+
+
+def _clean_row(row: dict) -> Book:
+    """Validate row by model fields and return not saved book"""
+    if "non_field_errors" in row:
+        raise ValidationError(row)
+
+    values = {}
+    errors = {}
+    for name in IMPORT_FIELDS:
+        model_field = Book._meta.get_field(name)
+        value = row.get(name)
+        if value in (None, "") and model_field.has_default():
+            value = model_field.get_default()
+        try:
+            values[name] = model_field.clean(value, None)
+        except ValidationError as error:
+            errors[name] = error.messages
+    if errors:
+        raise ValidationError(errors)
+    return Book(**values)
+
+
+def _save_batch(batch: dict) -> int:
+    """Insert new books and update inventory & fee of existing ones"""
+    with transaction.atomic():
+        Book.objects.bulk_create(
+            batch.values(),
+            update_conflicts=True,
+            unique_fields=UNIQUE_FIELDS,
+            update_fields=UPDATE_FIELDS,
+        )
+    return len(batch)
+
+
+def _get_last_id() -> Optional[int]:
+    return Book.objects.order_by("-id").values_list("id", flat=True).first()
+
+
+def import_books(
+    stream: TextIO,
+    file_format: str,
+    batch_size: int = 1000,
+    on_progress: Optional[Callable[[ImportResult], None]] = None,
+) -> ImportResult:
+    """
+    Stream CSV or JSON lines rows into books table by batches. Rows with the
+    same title, author and cover update inventory and daily fee of
+    existing book. Only current batch is kept in memory. Import stops at
+    bytes which are not UTF-8 with error for the first not read line
+    """
+    result = ImportResult()
+    batch = {}
+    line = 0
+    last_id = _get_last_id()
+
+    try:
+        try:
+            for line, row in _read_rows(stream, file_format):
+                result.processed += 1
+                try:
+                    book = _clean_row(row)
+                except ValidationError as error:
+                    result.add_error(line, error.message_dict)
+                    continue
+
+                key = tuple(getattr(book, name) for name in UNIQUE_FIELDS)
+                batch[key] = book
+                if len(batch) >= batch_size:
+                    result.imported += _save_batch(batch)
+                    batch = {}
+                    if on_progress:
+                        on_progress(result)
+        except UnicodeDecodeError as error:
+            # File is decoded by chunks, so rows after the last read one
+            # are not imported
+            result.add_error(
+                line + 1,
+                {
+                    "non_field_errors": [
+                        f"File is not UTF-8 encoded ({error}), rows from "
+                        "this line are not imported"
+                    ]
+                },
+            )
+
+        if batch:
+            result.imported += _save_batch(batch)
+        if on_progress:
+            on_progress(result)
+    finally:
+        # Batches committed before a failure are shown too. Updated books
+        # keep their names, so names are changed only by inserted books
+        book_cache.invalidate_book()
+        if _get_last_id() != last_id:
+            book_cache.invalidate_names()
+    return result
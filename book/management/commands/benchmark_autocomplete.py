@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+from book.autocomplete import get_index
+from book.models import Book
+from book.views import BookViewSet
+
+
+class Command(BaseCommand):
+    """Measure autocomplete view latency under burst of requests"""
+
+    help = (
+        "Send burst of autocomplete requests with random prefixes of book "
+        "titles and authors from parallel clients and print latency "
+        "percentiles"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--clients", type=int, default=16)
+
+    @staticmethod
+    def _send(prefixes: list[str]) -> list[float]:
+        factory = RequestFactory()
+        view = BookViewSet.as_view({"get": "autocomplete"})
+        timings = []
+        try:
+            for prefix in prefixes:
+                start = time.perf_counter()
+                view(factory.get("/api/books/autocomplete/", {"q": prefix}))
+                timings.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+        return timings
+
+    def handle(self, *args: list, **options: dict) -> None:
+        names = [
+            name
+            for pair in Book.objects.values_list("title", "author")[:10000]
+            for name in pair
+        ]
+        if not names:
+            self.stdout.write("There are no books")
+            return
+
+        prefixes = [
+            random.choice(names)[: random.randint(1, 5)]
+            for _ in range(options["requests"])
+        ]
+        # Build index of this process before burst
+        get_index()
+
+        clients = options["clients"]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            timings = sorted(
+                timing
+                for chunk in executor.map(
+                    self._send,
+                    [prefixes[i::clients] for i in range(clients)],
+                )
+                for timing in chunk
+            )
+        duration = time.perf_counter() - start
+
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f"{len(timings)} requests by {clients} clients in "
+            f"{duration:.2f} s, p50 {percentiles[49] * 1000:.2f} ms, "
+            f"p99 {percentiles[98] * 1000:.2f} ms"
+        )
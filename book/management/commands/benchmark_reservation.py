@@ -0,0 +1,123 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from book.models import Book
+from borrow.models import Borrow, Payment
+from user.models import TelegramOutbox
+
+
+class Command(BaseCommand):
+    """Check borrow creation under concurrent borrowers of a single book"""
+
+    help = (
+        "Run parallel borrowers creating borrows of one book through the "
+        "borrow create endpoint with simulated Stripe latency and check "
+        "that inventory is never oversold"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--borrowers", type=int, default=50)
+        parser.add_argument("--attempts", type=int, default=5)
+        parser.add_argument("--inventory", type=int, default=100)
+        parser.add_argument(
+            "--stripe-latency",
+            type=float,
+            default=0.3,
+            help="Seconds every Stripe checkout session call takes",
+        )
+
+    @staticmethod
+    def _fake_stripe(latency: float):
+        def create_checkout_session(**params) -> dict:
+            time.sleep(latency)
+            session_id = f"cs_benchmark_{uuid.uuid4().hex}"
+            return {"id": session_id, "url": f"https://stripe/{session_id}"}
+
+        return create_checkout_session
+
+    @staticmethod
+    def _borrower(user, book_id: int, attempts: int) -> int:
+        """Borrow the book several times & return number of borrows"""
+        client = APIClient(SERVER_NAME="localhost")
+        client.force_authenticate(user)
+        payload = {
+            "book": book_id,
+            "expected_return_date": date.today() + timedelta(days=7),
+        }
+        borrowed = 0
+        try:
+            for _ in range(attempts):
+                response = client.post(reverse("borrow:borrow-list"), payload)
+                if response.status_code == 201:
+                    borrowed += 1
+                    # Borrower with open payments can not borrow again
+                    Payment.objects.filter(user=user, status="open").update(
+                        status="success"
+                    )
+        finally:
+            connection.close()
+        return borrowed
+
+    def handle(self, *args, **options) -> None:
+        if connection.vendor == "sqlite":
+            raise CommandError("Use database with row locks, e.g. Postgres")
+
+        run = time.time()
+        book = Book.objects.create(
+            title=f"Reservation benchmark {run}",
+            author="Benchmark",
+            cover=Book.CoverChoices.HARD,
+            inventory=options["inventory"],
+            daily_fee=1,
+        )
+        borrowers = options["borrowers"]
+        attempts = options["attempts"]
+        users = [
+            get_user_model().objects.create_user(
+                f"benchmark{run}_{number}@library.com", "benchmark"
+            )
+            for number in range(borrowers)
+        ]
+        start = time.perf_counter()
+        with mock.patch(
+            "borrow.stripe_client.create_checkout_session",
+            self._fake_stripe(options["stripe_latency"]),
+        ), mock.patch("django_q.tasks.async_task"):
+            with ThreadPoolExecutor(max_workers=borrowers) as executor:
+                borrowed = sum(
+                    executor.map(
+                        self._borrower,
+                        users,
+                        [book.id] * borrowers,
+                        [attempts] * borrowers,
+                    )
+                )
+        duration = time.perf_counter() - start
+        book.refresh_from_db()
+        borrows = Borrow.objects.filter(book=book).count()
+        TelegramOutbox.objects.filter(text__contains=book.title).delete()
+        get_user_model().objects.filter(id__in=[u.id for u in users]).delete()
+        book.delete()
+
+        expected = min(options["inventory"], borrowers * attempts)
+        self.stdout.write(
+            f"{borrowers * attempts} borrow requests in {duration:.2f} s "
+            f"({borrowers * attempts / duration:.0f} per second), "
+            f"borrowed {borrowed}, left in inventory {book.inventory}"
+        )
+        if (
+            borrowed != expected
+            or borrows != borrowed
+            or book.inventory != options["inventory"] - borrowed
+        ):
+            raise CommandError("Inventory is not consistent")
+        self.stdout.write(self.style.SUCCESS("Inventory is consistent"))
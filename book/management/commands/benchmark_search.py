@@ -0,0 +1,74 @@
+import random
+import time
+
+from django.core.management import BaseCommand
+
+from book.models import Book
+from book.search import icontains_search, search_books
+
+WORDS = (
+    "war peace river night garden stone shadow king queen winter summer "
+    "ocean silent empire secret golden forest city dream fire"
+).split()
+QUERIES = ("river", "golden forest", "queen", "shadw")
+
+
+class Command(BaseCommand):
+    """Compare indexed book search with icontains scan"""
+
+    help = "Benchmark full-text book search against icontains scan"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Number of generated books to add before benchmark",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of runs for every query",
+        )
+
+    def _seed(self, count: int, batch_size: int = 10000) -> None:
+        """Create random books by batches"""
+        start_id = Book.objects.count()
+        for offset in range(0, count, batch_size):
+            Book.objects.bulk_create(
+                Book(
+                    title=" ".join(random.sample(WORDS, 3)) + f" {number}",
+                    author=" ".join(random.sample(WORDS, 2)).title(),
+                    cover=random.choice(Book.CoverChoices.values),
+                    inventory=random.randint(0, 10),
+                    daily_fee=random.randint(10, 500) / 100,
+                )
+                for number in range(
+                    start_id + offset,
+                    start_id + min(offset + batch_size, count),
+                )
+            )
+            self.stdout.write(f"Seeded {min(offset + batch_size, count)}")
+
+    def _measure(self, search, query: str, repeat: int) -> float:
+        """Return best time of first results page fetching in ms"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(search(Book.objects.all(), query)[:10])
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    def handle(self, *args: list, **options: dict) -> None:
+        if options["seed"]:
+            self._seed(options["seed"])
+
+        self.stdout.write(f"Books in catalog: {Book.objects.count()}")
+        for query in QUERIES:
+            indexed = self._measure(search_books, query, options["repeat"])
+            scan = self._measure(icontains_search, query, options["repeat"])
+            self.stdout.write(
+                f"'{query}': index {indexed:.2f} ms, "
+                f"icontains scan {scan:.2f} ms"
+            )
@@ -0,0 +1,41 @@
+import gzip
+import sys
+
+from django.core.management import BaseCommand
+
+from book.exporter import EXPORT_FORMATS, export_books
+
+
+class Command(BaseCommand):
+    """Django command to export all books to CSV or NDJSON file"""
+
+    help = "Export all books to CSV or NDJSON file"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--file-format", choices=EXPORT_FORMATS, default="csv"
+        )
+        parser.add_argument(
+            "--output",
+            help="File path. By default books are written to stdout",
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Compress output with gzip"
+        )
+
+    def handle(self, *args, **options) -> None:
+        chunks = export_books(options["file_format"])
+        output = options["output"]
+
+        if options["gzip"]:
+            stream = gzip.open(output or sys.stdout.buffer, "wt", newline="")
+        elif output:
+            stream = open(output, "w", encoding="utf-8", newline="")
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+
+        with stream:
+            for chunk in chunks:
+                stream.write(chunk)
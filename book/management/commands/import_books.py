@@ -0,0 +1,69 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from book.importer import (
+    IMPORT_FORMATS,
+    ImportResult,
+    get_file_format,
+    import_books,
+)
+
+
+class Command(BaseCommand):
+    """Django command to import books from CSV or JSON lines file"""
+
+    help = (
+        "Import books from CSV or JSON lines file. Existing books with the "
+        "same title, author and cover are updated"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("path", help="File path or - for stdin")
+        parser.add_argument(
+            "--file-format",
+            choices=IMPORT_FORMATS,
+            help="File format. By default it is taken from file extension",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def _report_progress(self, result: ImportResult) -> None:
+        for error in result.errors[self.reported_errors:]:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.reported_errors = len(result.errors)
+        self.stdout.write(
+            f"Processed {result.processed} rows, imported {result.imported}, "
+            f"failed {result.failed}"
+        )
+
+    def handle(self, *args, **options) -> None:
+        path = options["path"]
+        file_format = options["file_format"] or get_file_format(path)
+        if file_format is None:
+            raise CommandError(
+                "Can not detect file format, use --file-format option"
+            )
+
+        self.reported_errors = 0
+        if path == "-":
+            result = import_books(
+                sys.stdin,
+                file_format,
+                options["batch_size"],
+                self._report_progress,
+            )
+        else:
+            with open(path, encoding="utf-8", newline="") as stream:
+                result = import_books(
+                    stream,
+                    file_format,
+                    options["batch_size"],
+                    self._report_progress,
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.imported} books, "
+                f"{result.failed} rows failed"
+            )
+        )
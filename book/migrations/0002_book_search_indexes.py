@@ -0,0 +1,45 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple'::regconfig, COALESCE(title, '')), 'A') "
+    "|| setweight(to_tsvector('simple'::regconfig, COALESCE(author, '')), 'B')"
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS book_search_vector_idx "
+        f"ON book_book USING gin (({SEARCH_VECTOR_SQL}))"
+    )
+    for field in ("title", "author"):
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS book_{field}_trgm_idx "
+            f"ON book_book USING gin ({field} gin_trgm_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for index in (
+        "book_search_vector_idx",
+        "book_title_trgm_idx",
+        "book_author_trgm_idx",
+    ):
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("book", "0001_initial"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
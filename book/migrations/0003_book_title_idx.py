@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:06
+
+from django.db import migrations, models
+
+from Library_service.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("book", "0002_book_search_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(fields=["title", "id"], name="book_title_idx"),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:16
+
+from django.db import migrations, models
+
+from Library_service.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("book", "0003_book_title_idx"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(
+                fields=["author", "title", "id"], name="book_author_title_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(
+                fields=["cover", "title", "id"], name="book_cover_title_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(
+                condition=models.Q(("inventory__gt", 0)),
+                fields=["title", "id"],
+                name="book_available_title_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="book",
+            index=models.Index(fields=["daily_fee", "id"], name="book_daily_fee_idx"),
+        ),
+    ]
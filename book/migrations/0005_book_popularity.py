@@ -0,0 +1,96 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book", "0004_book_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookBorrowDay",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("borrows", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BookPopularity",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="popularity",
+                        serialize=False,
+                        to="book.book",
+                    ),
+                ),
+                ("week", models.PositiveIntegerField(default=0)),
+                ("month", models.PositiveIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "book popularity",
+            },
+        ),
+        migrations.CreateModel(
+            name="PopularityRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("counted_until", models.DateField(null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="bookpopularity",
+            index=models.Index(fields=["-week", "book"], name="popularity_week_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookpopularity",
+            index=models.Index(fields=["-month", "book"], name="popularity_month_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookpopularity",
+            index=models.Index(fields=["-total", "book"], name="popularity_total_idx"),
+        ),
+        migrations.AddField(
+            model_name="bookborrowday",
+            name="book",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="borrow_days",
+                to="book.book",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookborrowday",
+            index=models.Index(fields=["day"], name="book_borrow_day_idx"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="bookborrowday",
+            unique_together={("book", "day")},
+        ),
+    ]
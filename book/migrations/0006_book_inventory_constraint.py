@@ -0,0 +1,19 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book", "0005_book_popularity"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="book",
+            constraint=models.CheckConstraint(
+                check=models.Q(("inventory__gte", 0)), name="book_inventory_gte_0"
+            ),
+        ),
+    ]
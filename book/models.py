@@ -1,4 +1,66 @@
 from django.db import models
+from django.db.models import (
+    Count,
+    F,
+    IntegerField,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+)
+from django.db.models.functions import Coalesce
+
+from book import cache as book_cache
+
+
+class BookQuerySet(models.QuerySet):
+    def with_availability(self) -> "BookQuerySet":
+        """
+        Annotate books with count of not returned borrows and the nearest
+        expected return date of them by correlated subqueries. They are
+        evaluated only for rows of the page, and count of pages does not
+        read borrows
+        """
+        borrow_model = self.model._meta.get_field("borrows").related_model
+        active_borrows = (
+            borrow_model.objects.filter(
+                book=OuterRef("pk"), actual_return_date__isnull=True
+            )
+            .order_by()
+            .values("book")
+        )
+        return self.annotate(
+            active_borrows=Coalesce(
+                Subquery(
+                    active_borrows.annotate(count=Count("pk")).values("count"),
+                    output_field=IntegerField(),
+                ),
+                0,
+            ),
+            next_return_date=Subquery(
+                active_borrows.annotate(
+                    date=Min("expected_return_date")
+                ).values("date")
+            ),
+        )
+
+    def reserve(self, book_id: int) -> bool:
+        """
+        Take one copy of the book from inventory by single conditional
+        UPDATE, so concurrent borrowers can not oversell the book. Return
+        False if there are no copies left
+        """
+        reserved = self.filter(pk=book_id, inventory__gt=0).update(
+            inventory=F("inventory") - 1
+        )
+        if reserved:
+            book_cache.invalidate_book(book_id)
+        return bool(reserved)
+
+    def release(self, book_id: int) -> None:
+        """Put one copy of the book back to inventory"""
+        self.filter(pk=book_id).update(inventory=F("inventory") + 1)
+        book_cache.invalidate_book(book_id)
 
 
 class Book(models.Model):
@@ -14,9 +76,85 @@ class Book(models.Model):
     inventory = models.PositiveIntegerField(default=1)
     daily_fee = models.DecimalField(max_digits=5, decimal_places=2)
 
+    objects = BookQuerySet.as_manager()
+
     class Meta:
         unique_together = ["title", "author", "cover"]
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title", "id"], name="book_title_idx"),
+            models.Index(
+                fields=["author", "title", "id"], name="book_author_title_idx"
+            ),
+            models.Index(
+                fields=["cover", "title", "id"], name="book_cover_title_idx"
+            ),
+            models.Index(
+                fields=["title", "id"],
+                name="book_available_title_idx",
+                condition=Q(inventory__gt=0),
+            ),
+            models.Index(
+                fields=["daily_fee", "id"], name="book_daily_fee_idx"
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(inventory__gte=0), name="book_inventory_gte_0"
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.title
+
+
+class BookBorrowDay(models.Model):
+    """Number of borrows of the book made in a day"""
+
+    book = models.ForeignKey(
+        to=Book, on_delete=models.CASCADE, related_name="borrow_days"
+    )
+    day = models.DateField()
+    borrows = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["book", "day"]
+        indexes = [
+            models.Index(fields=["day"], name="book_borrow_day_idx"),
+        ]
+
+
+class BookPopularity(models.Model):
+    """
+    Ranking of the book by borrows of last week, month and all time. Rows
+    are rolled up from borrows by scheduled task
+    """
+
+    book = models.OneToOneField(
+        to=Book,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="popularity",
+    )
+    week = models.PositiveIntegerField(default=0)
+    month = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "book popularity"
+        indexes = [
+            models.Index(fields=["-week", "book"], name="popularity_week_idx"),
+            models.Index(
+                fields=["-month", "book"], name="popularity_month_idx"
+            ),
+            models.Index(
+                fields=["-total", "book"], name="popularity_total_idx"
+            ),
+        ]
+
+
+class PopularityRollup(models.Model):
+    """The last day which borrows are counted in book popularity"""
+
+    counted_until = models.DateField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
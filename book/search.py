@@ -0,0 +1,150 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db import connection, connections
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    FloatField,
+    Q,
+    QuerySet,
+    When,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+SEARCH_CONFIG = "simple"
+FTS_TABLE = "book_book_fts"
+
+SQLITE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, author, content='book_book', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS book_book_fts_ai AFTER INSERT ON book_book "
+    f"BEGIN INSERT INTO {FTS_TABLE}(rowid, title, author) "
+    "VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_book_fts_ad AFTER DELETE ON book_book "
+    f"BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS book_book_fts_au AFTER UPDATE ON book_book "
+    f"BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, author) "
+    "VALUES (new.id, new.title, new.author); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+
+def create_sqlite_fts_index(using: str) -> None:
+    """
+    Create FTS5 table with triggers keeping it in sync with book table.
+    Used for SQLite databases (test settings) instead of Postgres indexes
+    """
+    with connections[using].cursor() as cursor:
+        for sql in SQLITE_FTS_SQL:
+            cursor.execute(sql)
+
+
+def _tsquery(query: str) -> str:
+    """Convert user input to tsquery of quoted prefix terms like FTS5 query"""
+    return " & ".join(
+        "'{}':*".format(term.replace("\\", "\\\\").replace("'", "''"))
+        for term in query.split()
+    )
+
+
+def _postgres_search(queryset: QuerySet, query: str) -> QuerySet:
+    """
+    Ranked full-text search of prefix terms by tsvector index. If nothing
+    found fall back to trigram similarity for misspelled queries, both are
+    made by one query
+    """
+    tsquery = _tsquery(query)
+    if not tsquery:
+        return queryset.none()
+    vector = SearchVector(
+        "title", weight="A", config=SEARCH_CONFIG
+    ) + SearchVector("author", weight="B", config=SEARCH_CONFIG)
+    search_query = SearchQuery(
+        tsquery, config=SEARCH_CONFIG, search_type="raw"
+    )
+    found = Exists(
+        queryset.annotate(document=vector).filter(document=search_query)
+    )
+    return (
+        queryset.annotate(document=vector)
+        .filter(
+            Q(document=search_query)
+            | (
+                ~found
+                & (
+                    Q(title__trigram_similar=query)
+                    | Q(author__trigram_similar=query)
+                )
+            )
+        )
+        .annotate(
+            rank=Case(
+                When(
+                    document=search_query,
+                    then=SearchRank(F("document"), search_query),
+                ),
+                default=Greatest(
+                    TrigramSimilarity("title", query),
+                    TrigramSimilarity("author", query),
+                ),
+                output_field=FloatField(),
+            )
+        )
+        .order_by("-rank", "id")
+    )
+
+
+def _fts5_query(query: str) -> str:
+    """Convert user input to FTS5 query of quoted prefix terms"""
+    return " ".join(
+        '"{}"*'.format(term.replace('"', '""')) for term in query.split()
+    )
+
+
+def _sqlite_search(queryset: QuerySet, query: str) -> QuerySet:
+    """Ranked full-text search by FTS5 table"""
+    match = _fts5_query(query)
+    if not match:
+        return queryset.none()
+    rank = RawSQL(
+        f"SELECT -bm25({FTS_TABLE}, 10.0, 5.0) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = book_book.id",
+        (match,),
+        output_field=FloatField(),
+    )
+    return (
+        queryset.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                (match,),
+            )
+        )
+        .annotate(rank=rank)
+        .order_by("-rank", "id")
+    )
+
+
+def icontains_search(queryset: QuerySet, query: str) -> QuerySet:
+    """Unindexed substring scan. Used for other databases & benchmarks"""
+    return queryset.filter(
+        Q(title__icontains=query) | Q(author__icontains=query)
+    )
+
+
+def search_books(queryset: QuerySet, query: str) -> QuerySet:
+    """Return books matched query ordered by rank with database index"""
+    query = query.strip()
+    if connection.vendor == "postgresql":
+        return _postgres_search(queryset, query)
+    if connection.vendor == "sqlite":
+        return _sqlite_search(queryset, query)
+    return icontains_search(queryset, query)
@@ -1,15 +1,59 @@
 from rest_framework import serializers
 
+from Library_service.fieldsets import SparseFieldsetsMixin
+from book.importer import IMPORT_FORMATS, get_file_format
 from book.models import Book
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    active_borrows = serializers.IntegerField(read_only=True)
+    next_return_date = serializers.DateField(read_only=True)
+
     class Meta:
         model = Book
-        fields = ("id", "title", "author", "cover", "inventory", "daily_fee")
+        fields = (
+            "id",
+            "title",
+            "author",
+            "cover",
+            "inventory",
+            "daily_fee",
+            "active_borrows",
+            "next_return_date",
+        )
 
 
 class BookTelegramSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ("title", "author", "cover")
+
+
+class BookAutocompleteSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    label = serializers.CharField()
+
+
+class BookImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(
+        choices=IMPORT_FORMATS, required=False
+    )
+
+    def validate(self, attrs: dict) -> dict:
+        """Take file format from file extension if it is not given"""
+        data = super().validate(attrs)
+        if "file_format" not in data:
+            data["file_format"] = get_file_format(data["file"].name)
+        if data["file_format"] is None:
+            raise serializers.ValidationError(
+                {"file_format": "Can not detect file format by file name"}
+            )
+        return data
+
+
+class BookImportResultSerializer(serializers.Serializer):
+    processed = serializers.IntegerField()
+    imported = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    errors = serializers.ListField(child=serializers.DictField())
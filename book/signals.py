@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from book import cache as book_cache
+from book.models import Book
+
+NAME_FIELDS = ("title", "author")
+
+
+def _get_names(instance: Book) -> tuple:
+    """Return loaded title & author, deferred fields are not loaded"""
+    return tuple(instance.__dict__.get(name) for name in NAME_FIELDS)
+
+
+@receiver(post_init, sender=Book)
+def remember_names(sender, instance: Book, **kwargs) -> None:
+    instance._saved_names = _get_names(instance)
+
+
+@receiver(post_save, sender=Book)
+def invalidate_book_cache(
+    sender, instance: Book, created: bool, update_fields=None, **kwargs
+) -> None:
+    """
+    Drop cached book list & detail when book is saved. Data built from
+    names is dropped only when title or author is changed
+    """
+    book_cache.invalidate_book(instance.pk)
+
+    names = _get_names(instance)
+    if update_fields is not None and not set(NAME_FIELDS) & update_fields:
+        return
+    if created or names != instance._saved_names:
+        book_cache.invalidate_names()
+    instance._saved_names = names
+
+
+@receiver(post_delete, sender=Book)
+def invalidate_deleted_book_cache(sender, instance: Book, **kwargs) -> None:
+    """Drop cached book list, detail & names when book is deleted"""
+    book_cache.invalidate_book(instance.pk)
+    book_cache.invalidate_names()
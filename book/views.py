@@ -1,16 +1,153 @@
-from drf_spectacular.utils import extend_schema_view, extend_schema
-from rest_framework import viewsets
+import io
+import re
+from typing import Type
 
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import (
+    extend_schema_view,
+    extend_schema,
+    OpenApiParameter,
+)
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from Library_service.conditional import ConditionalGetMixin
+from Library_service.fast_serializers import FastReadMixin
+from Library_service.fieldsets import get_fieldsets, is_field_requested
+from Library_service.pagination import KeysetPagination
+from book import cache as book_cache
+from book.autocomplete import get_index
+from book.exporter import CONTENT_TYPES, EXPORT_FORMATS, export_books
+from book.filters import (
+    POPULARITY_ORDERINGS,
+    filter_books,
+    get_facets,
+    order_books,
+)
+from book.importer import import_books
 from book.models import Book
 from book.permissions import IsAdminOrAnyReadOnly
-from book.serializers import BookSerializer
+from book.search import search_books
+from book.serializers import (
+    BookAutocompleteSerializer,
+    BookSerializer,
+    BookImportSerializer,
+    BookImportResultSerializer,
+)
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+
+class CachedListRetrieveMixin:
+    """Read book list and detail responses through book cache"""
+
+    def is_ordered_by_popularity(self) -> bool:
+        return (
+            self.request.query_params.get("ordering") in POPULARITY_ORDERINGS
+        )
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        """Return books list page from cache or put it there"""
+        key = book_cache.list_key(
+            request.build_absolute_uri(), self.is_ordered_by_popularity()
+        )
+        data = book_cache.read(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        book_cache.write(key, response.data)
+        return response
+
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        """Return book detail from cache or put it there"""
+        key = book_cache.detail_key(
+            kwargs[self.lookup_field], request.build_absolute_uri()
+        )
+        data = book_cache.read(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().retrieve(request, *args, **kwargs)
+        book_cache.write(key, response.data)
+        return response
 
 
 @extend_schema_view(
     create=extend_schema(
         description="Crate new book. Only staff user can create"
     ),
-    list=extend_schema(description="Return list of all books"),
+    list=extend_schema(
+        description="Return list of all books. Can search books by title "
+        "and author and filter them by author, cover, availability and "
+        "daily fee. Can return facet counts of filtered books",
+        parameters=[
+            OpenApiParameter(
+                "search",
+                type=str,
+                description=(
+                    "Full-text search by title and author, results are "
+                    "ordered by rank (ex. ?search=tolkien)"
+                ),
+            ),
+            OpenApiParameter(
+                "ordering",
+                type=str,
+                enum=list(POPULARITY_ORDERINGS),
+                description=(
+                    "Order by number of borrows of all time, last month or "
+                    "last week (ex. ?ordering=popular_week)"
+                ),
+            ),
+            OpenApiParameter(
+                "author",
+                type={"type": "list", "items": {"type": "string"}},
+                description="Filter by authors (ex. ?author=Tolkien,Orwell)",
+            ),
+            OpenApiParameter(
+                "cover",
+                type=str,
+                enum=Book.CoverChoices.values,
+                description="Filter by cover (ex. ?cover=Hard)",
+            ),
+            OpenApiParameter(
+                "available",
+                type={"type": "number"},
+                description=(
+                    "Filter by book is in inventory or no "
+                    "(ex. ?available=1). 1 == True, 0 == False"
+                ),
+            ),
+            OpenApiParameter(
+                "min_fee",
+                type={"type": "number"},
+                description="Minimal daily fee (ex. ?min_fee=0.5)",
+            ),
+            OpenApiParameter(
+                "max_fee",
+                type={"type": "number"},
+                description="Maximal daily fee (ex. ?max_fee=2)",
+            ),
+            OpenApiParameter(
+                "facets",
+                type={"type": "number"},
+                description=(
+                    "Add counts of filtered books by author, cover, "
+                    "availability & daily fee range to response "
+                    "(ex. ?facets=1)"
+                ),
+            ),
+        ],
+    ),
     retrieve=extend_schema(description="Return book detail information"),
     update=extend_schema(
         description="Update book. Only staff user can update"
@@ -21,10 +158,190 @@ from book.serializers import BookSerializer
     destroy=extend_schema(
         description="Delete book. Only staff user can delete"
     ),
+    autocomplete=extend_schema(
+        description="Return ids and labels of books which title or author "
+        "words start with query. Books matched by title are the first",
+        parameters=[
+            OpenApiParameter(
+                "q", type=str, description="Typed text (ex. ?q=tolk)"
+            ),
+            OpenApiParameter(
+                "limit",
+                type=int,
+                description=(
+                    f"Number of suggestions, {AUTOCOMPLETE_LIMIT} by "
+                    f"default & {AUTOCOMPLETE_MAX_LIMIT} at most"
+                ),
+            ),
+        ],
+        responses=BookAutocompleteSerializer(many=True),
+    ),
+    cache_stats=extend_schema(
+        description="Return book cache hits and misses. Only staff user "
+        "can see it",
+        responses=OpenApiTypes.OBJECT,
+    ),
+    export_books=extend_schema(
+        description="Stream all books as CSV or NDJSON file. Response is "
+        "compressed with gzip if client accepts it",
+        parameters=[
+            OpenApiParameter(
+                "file_format",
+                type=str,
+                enum=EXPORT_FORMATS,
+                description="Export file format, csv by default",
+            ),
+        ],
+        responses=OpenApiTypes.BINARY,
+    ),
+    import_books=extend_schema(
+        description="Import books from CSV or JSON lines file. Books with "
+        "the same title, author and cover are updated. Only staff user can "
+        "import",
+        responses=BookImportResultSerializer,
+    ),
 )
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(
+    ConditionalGetMixin,
+    CachedListRetrieveMixin,
+    FastReadMixin,
+    viewsets.ModelViewSet,
+):
     """Book CRUD endpoints"""
 
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = (IsAdminOrAnyReadOnly,)
+    pagination_class = KeysetPagination
+
+    def get_catalog_queryset(self) -> QuerySet:
+        """
+        Return filtered books ranked by search query or ordered by
+        popularity if they are given
+        """
+        queryset = self.queryset
+
+        if self.action != "list":
+            return queryset
+
+        search = self.request.query_params.get("search")
+
+        ordering = self.request.query_params.get("ordering")
+
+        if search:
+            queryset = search_books(queryset, search)
+
+        if ordering:
+            queryset = order_books(queryset, ordering)
+
+        return filter_books(queryset, self.request.query_params)
+
+    def get_queryset(self) -> QuerySet:
+        """
+        Return filtered books with availability counters if they are not
+        omitted by sparse fieldsets
+        """
+        queryset = self.get_catalog_queryset()
+        fieldsets = get_fieldsets(self.request)
+        if any(
+            is_field_requested(fieldsets, name)
+            for name in ("active_borrows", "next_return_date")
+        ):
+            queryset = queryset.with_availability()
+        return queryset
+
+    def get_paginated_response(self, data: list) -> Response:
+        """Add facet counts of filtered books to page if they are asked"""
+        response = super().get_paginated_response(data)
+        if self.request.query_params.get("facets") == "1":
+            response.data["facets"] = get_facets(self.get_catalog_queryset())
+        return response
+
+    def get_serializer_class(self) -> Type[BookSerializer]:
+        if self.action == "import_books":
+            return BookImportSerializer
+        return BookSerializer
+
+    def get_version_scopes(self) -> tuple[str, ...]:
+        """
+        Book list depends on all books (and popularity it is ordered by) &
+        book detail only on itself
+        """
+        if self.action == "retrieve":
+            return book_cache.detail_scopes(self.kwargs[self.lookup_field])
+        return book_cache.list_scopes(self.is_ordered_by_popularity())
+
+    @action(methods=["GET"], detail=False)
+    def autocomplete(self, request: Request) -> Response:
+        """Return books matched by typed prefix from in-memory index"""
+        try:
+            limit = min(
+                int(request.query_params.get("limit", AUTOCOMPLETE_LIMIT)),
+                AUTOCOMPLETE_MAX_LIMIT,
+            )
+        except ValueError:
+            return Response(
+                {"limit": "A valid integer is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            get_index().search(request.query_params.get("q", ""), limit)
+        )
+
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="cache-stats",
+        permission_classes=(IsAdminUser,),
+    )
+    def cache_stats(self, request: Request) -> Response:
+        """Return hit and miss counters of book cache"""
+        return Response(book_cache.get_stats())
+
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="import",
+        permission_classes=(IsAdminUser,),
+        parser_classes=(MultiPartParser,),
+    )
+    def import_books(self, request: Request) -> Response:
+        """Stream uploaded file rows into books by batches"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        stream = io.TextIOWrapper(
+            serializer.validated_data["file"].file,
+            encoding="utf-8",
+            newline="",
+        )
+        result = import_books(stream, serializer.validated_data["file_format"])
+
+        return Response(
+            BookImportResultSerializer(result).data, status=status.HTTP_200_OK
+        )
+
+    @action(methods=["GET"], detail=False, url_path="export")
+    def export_books(self, request: Request) -> StreamingHttpResponse:
+        """Stream all books without loading them into memory"""
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {"file_format": f"Choose one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        chunks = (chunk.encode() for chunk in export_books(file_format))
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+        compress = bool(re.search(r"\bgzip\b", accept_encoding))
+        response = StreamingHttpResponse(
+            compress_sequence(chunks) if compress else chunks,
+            content_type=CONTENT_TYPES[file_format],
+        )
+        if compress:
+            response.headers["Content-Encoding"] = "gzip"
+        response.headers["Content-Disposition"] = (
+            f'attachment; filename="books.{file_format}"'
+        )
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
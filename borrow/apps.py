@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BorrowConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "borrow"
+
+    def ready(self) -> None:
+        from borrow import signals  # noqa: F401
@@ -0,0 +1,128 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from book.models import Book
+from borrow.models import Borrow, Payment
+
+HOT_QUERY_INDEXES = (
+    "borrow_user_date_idx",
+    "borrow_active_user_date_idx",
+    "borrow_active_expected_idx",
+    "payment_open_user_idx",
+    "payment_open_created_at_idx",
+)
+
+
+class Command(BaseCommand):
+    """Show plans and timings of borrow & payment hot queries"""
+
+    help = (
+        "Seed borrows and payments, then print query plans and timings of "
+        "hot queries with and without their indexes. Everything is rolled "
+        "back"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--borrows", type=int, default=200000)
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def _seed(self, borrows: int, users: int):
+        stamp = time.time()
+        readers = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"reader{stamp}-{i}@library.com")
+            for i in range(users)
+        )
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Benchmark book {stamp} {i}",
+                author="Benchmark",
+                cover=Book.CoverChoices.HARD,
+                daily_fee="1.00",
+            )
+            for i in range(1000)
+        )
+        today = date.today()
+        for offset in range(0, borrows, 10000):
+            created = Borrow.objects.bulk_create(
+                Borrow(
+                    book=random.choice(books),
+                    user=random.choice(readers),
+                    borrow_date=today - timedelta(days=days_ago),
+                    expected_return_date=today
+                    - timedelta(days=days_ago - 14),
+                    # Most borrows of history are returned
+                    actual_return_date=(
+                        today - timedelta(days=days_ago - 10)
+                        if days_ago > 20 or random.random() < 0.5
+                        else None
+                    ),
+                )
+                for days_ago in (
+                    random.randint(1, 1000)
+                    for _ in range(min(10000, borrows - offset))
+                )
+            )
+            Payment.objects.bulk_create(
+                Payment(
+                    user_id=borrow.user_id,
+                    borrow=borrow,
+                    status="open" if random.random() < 0.01 else "paid",
+                )
+                for borrow in created
+            )
+        return readers[0]
+
+    @staticmethod
+    def _hot_queries(user) -> dict:
+        tomorrow = date.today() + timedelta(days=1)
+        return {
+            "user borrows": Borrow.objects.filter(user=user)[:10],
+            "user active borrows": Borrow.objects.filter(
+                user=user, actual_return_date__isnull=True
+            )[:10],
+            "overdue borrows": Borrow.objects.filter(
+                Q(expected_return_date__lte=tomorrow)
+                & Q(actual_return_date=None)
+            ),
+            "user open payments": Payment.objects.filter(
+                Q(user=user) & Q(status="open")
+            ),
+            "open payments": Payment.objects.filter(status="open"),
+        }
+
+    def _report(self, title: str, user, repeat: int) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in self._hot_queries(user).items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(
+                f"{name}: {min(timings) * 1000:.2f} ms\n"
+                f"{queryset.explain()}\n"
+            )
+
+    def handle(self, *args: list, **options: dict) -> None:
+        with transaction.atomic():
+            user = self._seed(options["borrows"], options["users"])
+            self._report("With indexes", user, options["repeat"])
+
+            # Dropped indexes are restored by the rollback
+            with connection.cursor() as cursor:
+                for name in HOT_QUERY_INDEXES:
+                    cursor.execute(
+                        f"DROP INDEX {connection.ops.quote_name(name)}"
+                    )
+            self._report("Without indexes", user, options["repeat"])
+
+            transaction.set_rollback(True)
@@ -0,0 +1,96 @@
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from Library_service.renderers import MessagePackRenderer, ORJSONRenderer
+from book.models import Book
+from borrow.models import Borrow, Payment
+from borrow.serializers import BorrowDetailSerializer, PaymentListSerializer
+
+RENDERERS = (
+    ("json (stdlib)", JSONRenderer()),
+    ("json (orjson)", ORJSONRenderer()),
+    ("msgpack", MessagePackRenderer()),
+)
+
+
+class Command(BaseCommand):
+    """Compare response renderers on large borrow and payment lists"""
+
+    help = (
+        "Benchmark stdlib JSON, orjson and MessagePack renderers on "
+        "serialized borrows and payments. Generated rows are rolled back"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=5000,
+            help="Number of generated borrows and payments",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of runs for every renderer",
+        )
+
+    def _seed(self, count: int) -> None:
+        user = get_user_model().objects.create_user(
+            f"benchmark{time.time()}@library.com", "benchmark"
+        )
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Benchmark book {time.time()} {number}",
+                author="Benchmark",
+                cover=Book.CoverChoices.SOFT,
+                inventory=number % 10,
+                daily_fee="0.75",
+            )
+            for number in range(count)
+        )
+        borrows = Borrow.objects.bulk_create(
+            Borrow(
+                book=book,
+                user=user,
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+            for book in books
+        )
+        Payment.objects.bulk_create(
+            Payment(user=user, borrow=borrow) for borrow in borrows
+        )
+
+    def _compare(self, name: str, data: list, repeat: int) -> None:
+        for renderer_name, renderer in RENDERERS:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                content = renderer.render(data)
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(
+                f"{name} ({len(data)}) {renderer_name}: "
+                f"{min(timings) * 1000:.2f} ms, {len(content)} bytes"
+            )
+
+    def handle(self, *args: list, **options: dict) -> None:
+        with transaction.atomic():
+            self._seed(options["size"])
+            borrows = BorrowDetailSerializer(
+                Borrow.objects.select_related("book", "user")
+                .prefetch_related("payments")
+                .order_by("-id")[: options["size"]],
+                many=True,
+            ).data
+            payments = PaymentListSerializer(
+                Payment.objects.order_by("-id")[: options["size"]], many=True
+            ).data
+            transaction.set_rollback(True)
+
+        self._compare("Borrows", borrows, options["repeat"])
+        self._compare("Payments", payments, options["repeat"])
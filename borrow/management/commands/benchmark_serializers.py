@@ -0,0 +1,106 @@
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from Library_service.fast_serializers import FastSerializer
+from book.models import Book
+from book.serializers import BookSerializer
+from borrow.models import Borrow, Payment
+from borrow.serializers import BorrowListSerializer, PaymentListSerializer
+
+PAGE_SIZES = (10, 100, 1000)
+
+
+class Command(BaseCommand):
+    """Compare DRF serializers with compiled fast serializers"""
+
+    help = (
+        "Benchmark list serialization of books, borrows and payments by DRF "
+        "serializers and by compiled serializers over .values() rows. "
+        "Generated rows are rolled back"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of runs for every page size",
+        )
+
+    def _seed(self, count: int) -> None:
+        """Create books, borrows and payments for the biggest page"""
+        user = get_user_model().objects.create_user(
+            f"benchmark{time.time()}@library.com", "benchmark"
+        )
+        books = Book.objects.bulk_create(
+            Book(
+                title=f"Benchmark book {time.time()} {number}",
+                author="Benchmark",
+                cover=Book.CoverChoices.HARD,
+                inventory=number % 10,
+                daily_fee="1.25",
+            )
+            for number in range(count)
+        )
+        borrows = Borrow.objects.bulk_create(
+            Borrow(
+                book=book,
+                user=user,
+                expected_return_date=date.today() + timedelta(days=7),
+            )
+            for book in books
+        )
+        Payment.objects.bulk_create(
+            Payment(user=user, borrow=borrow, status="paid")
+            for borrow in borrows
+        )
+
+    @staticmethod
+    def _measure(serialize, repeat: int) -> float:
+        """Return best time of page reading and serialization in ms"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    def _compare(self, serializer_class, queryset, repeat: int) -> None:
+        fast_serializer = FastSerializer(serializer_class)
+        for size in PAGE_SIZES:
+            drf = self._measure(
+                lambda: serializer_class(queryset[:size], many=True).data,
+                repeat,
+            )
+            fast = self._measure(
+                lambda: fast_serializer.serialize(
+                    fast_serializer.values(queryset)[:size], queryset
+                ),
+                repeat,
+            )
+            self.stdout.write(
+                f"{serializer_class.__name__} page of {size}: "
+                f"DRF {drf:.2f} ms, fast {fast:.2f} ms, "
+                f"speedup x{drf / fast:.1f}"
+            )
+
+    def handle(self, *args: list, **options: dict) -> None:
+        repeat = options["repeat"]
+        with transaction.atomic():
+            self._seed(max(PAGE_SIZES))
+            self._compare(BookSerializer, Book.objects.all(), repeat)
+            self._compare(
+                BorrowListSerializer,
+                Borrow.objects.select_related("book").prefetch_related(
+                    "payments"
+                ),
+                repeat,
+            )
+            self._compare(
+                PaymentListSerializer, Payment.objects.all(), repeat
+            )
+            transaction.set_rollback(True)
@@ -1,11 +1,19 @@
 # Generated by Django 4.1.7 on 2023-03-11 10:57
 
 from django.core.management import call_command
+from django.core.serializers import python as python_serializer
 from django.db import migrations
 
 
 def func(apps, schema_editor):
-    call_command("loaddata", "data_fixture.json")
+    # Fixture is loaded by models of this migration state, fields added to
+    # models later do not exist yet
+    global_apps = python_serializer.apps
+    python_serializer.apps = apps
+    try:
+        call_command("loaddata", "data_fixture.json")
+    finally:
+        python_serializer.apps = global_apps
 
 
 class Migration(migrations.Migration):
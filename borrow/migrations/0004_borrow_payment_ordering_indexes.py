@@ -0,0 +1,32 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:06
+
+from django.db import migrations, models
+
+from Library_service.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrow", "0003_auto_20230424_1911"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="borrow",
+            options={"ordering": ["-borrow_date", "id"]},
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                fields=["-borrow_date", "id"], name="borrow_borrow_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="payment_created_at_idx"
+            ),
+        ),
+    ]
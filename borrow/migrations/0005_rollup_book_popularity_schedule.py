@@ -0,0 +1,31 @@
+from django.db import migrations
+
+SCHEDULE_NAME = "Book popularity rollup"
+
+
+def create_schedule(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={
+            "func": "borrow.tasks.rollup_book_popularity",
+            "schedule_type": "I",
+            "minutes": 10,
+            "repeats": -1,
+        },
+    )
+
+
+def delete_schedule(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrow", "0004_borrow_payment_ordering_indexes"),
+        ("book", "0005_book_popularity"),
+        ("django_q", "0014_schedule_cluster"),
+    ]
+
+    operations = [migrations.RunPython(create_schedule, delete_schedule)]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+from Library_service.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrow", "0005_rollup_book_popularity_schedule"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                fields=["user", "-borrow_date", "id"], name="borrow_user_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["user", "-borrow_date", "id"],
+                name="borrow_active_user_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["expected_return_date"],
+                name="borrow_active_expected_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status", "open")),
+                fields=["user"],
+                name="payment_open_user_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("status", "open")),
+                fields=["created_at"],
+                name="payment_open_created_at_idx",
+            ),
+        ),
+    ]
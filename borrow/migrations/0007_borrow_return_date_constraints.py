@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrow", "0006_borrow_payment_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="borrow",
+            constraint=models.CheckConstraint(
+                check=models.Q(("expected_return_date__gt", models.F("borrow_date"))),
+                name="borrow_expected_return_after_borrow_date",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="borrow",
+            constraint=models.CheckConstraint(
+                check=models.Q(
+                    ("actual_return_date__isnull", True),
+                    ("actual_return_date__gt", models.F("borrow_date")),
+                    _connector="OR",
+                ),
+                name="borrow_actual_return_after_borrow_date",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+SCHEDULE_NAME = "Send telegram outbox"
+
+
+def create_schedule(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={
+            "func": "borrow.tasks.send_telegram_outbox",
+            "schedule_type": "I",
+            "minutes": 1,
+            "repeats": -1,
+        },
+    )
+
+
+def delete_schedule(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrow", "0007_borrow_return_date_constraints"),
+        ("user", "0002_telegram_outbox"),
+        ("django_q", "0014_schedule_cluster"),
+    ]
+
+    operations = [migrations.RunPython(create_schedule, delete_schedule)]
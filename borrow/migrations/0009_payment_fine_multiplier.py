@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrow", "0008_send_telegram_outbox_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="fine_multiplier",
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
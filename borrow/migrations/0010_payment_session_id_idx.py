@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:44
+
+from django.db import migrations, models
+
+from Library_service.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrow", "0009_payment_fine_multiplier"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(fields=["session_id"], name="payment_session_id_idx"),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+SCHEDULE_NAME = "Reconcile payments with Stripe"
+
+
+def create_schedule(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.update_or_create(
+        name=SCHEDULE_NAME,
+        defaults={
+            "func": "borrow.tasks.reconcile_payments",
+            "schedule_type": "I",
+            "minutes": 10,
+            "repeats": -1,
+        },
+    )
+
+
+def delete_schedule(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.filter(name=SCHEDULE_NAME).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("borrow", "0010_payment_session_id_idx"),
+        ("django_q", "0014_schedule_cluster"),
+    ]
+
+    operations = [migrations.RunPython(create_schedule, delete_schedule)]
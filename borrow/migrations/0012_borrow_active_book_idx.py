@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-17 05:38
+
+from django.db import migrations, models
+
+from Library_service.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("borrow", "0011_reconcile_payments_schedule"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="borrow",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["book", "expected_return_date"],
+                name="borrow_active_book_idx",
+            ),
+        ),
+    ]
@@ -4,10 +4,29 @@ from typing import Optional
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F, Q
 
 from book.models import Book
 
 
+def validate_return_dates(
+    borrow_date: date, **return_dates: Optional[date]
+) -> None:
+    """
+    Validate that return dates are later than the borrow date. The same
+    rules are kept by check constraints of Borrow table
+    """
+    for name, return_date in return_dates.items():
+        if return_date and return_date <= borrow_date:
+            raise ValidationError(
+                {
+                    name: "You should take "
+                    f"{name.replace('_', ' ')} later than "
+                    f"borrow date: {borrow_date}"
+                }
+            )
+
+
 class Borrow(models.Model):
     """Borrow model."""
 
@@ -22,43 +41,50 @@ class Borrow(models.Model):
     )
 
     class Meta:
-        ordering = ["-borrow_date"]
-
-    def _validate_return_dates(
-        self,
-        expected_return_date: str,
-        actual_return_date: str,
-        borrow_date: date,
-    ) -> None:
-        """Validate that return dates is later than the borrow date"""
-        for return_date_attr in (expected_return_date, actual_return_date):
-            return_date_value = getattr(self, return_date_attr)
-            if return_date_value and return_date_value <= borrow_date:
-                raise ValidationError(
-                    {
-                        return_date_attr: "You should take "
-                        f"{return_date_attr.replace('_', ' ')} later than "
-                        f"borrow date: {borrow_date}"
-                    }
-                )
+        ordering = ["-borrow_date", "id"]
+        indexes = [
+            models.Index(
+                fields=["-borrow_date", "id"], name="borrow_borrow_date_idx"
+            ),
+            models.Index(
+                fields=["user", "-borrow_date", "id"],
+                name="borrow_user_date_idx",
+            ),
+            models.Index(
+                fields=["user", "-borrow_date", "id"],
+                name="borrow_active_user_date_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+            models.Index(
+                fields=["expected_return_date"],
+                name="borrow_active_expected_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+            models.Index(
+                fields=["book", "expected_return_date"],
+                name="borrow_active_book_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(expected_return_date__gt=F("borrow_date")),
+                name="borrow_expected_return_after_borrow_date",
+            ),
+            models.CheckConstraint(
+                check=Q(actual_return_date__isnull=True)
+                | Q(actual_return_date__gt=F("borrow_date")),
+                name="borrow_actual_return_after_borrow_date",
+            ),
+        ]
 
     def clean(self) -> None:
-        self._validate_return_dates(
-            "expected_return_date",
-            "actual_return_date",
+        validate_return_dates(
             self.borrow_date,
+            expected_return_date=self.expected_return_date,
+            actual_return_date=self.actual_return_date,
         )
 
-    def save(
-        self,
-        force_insert: bool = False,
-        force_update: bool = False,
-        using: Optional[str] = None,
-        update_fields: Optional[list[str]] = None,
-    ) -> None:
-        self.full_clean()
-        return super().save(force_insert, force_update, using, update_fields)
-
     def __str__(self) -> str:
         return str(self.borrow_date) + " " + self.book.title
 
@@ -73,6 +99,8 @@ class Payment(models.Model):
     session_url = models.TextField(max_length=255, blank=True)
     session_id = models.TextField(max_length=255, blank=True)
     status = models.TextField(max_length=20, default="open")
+    # Fine of late return is paid by multiplied daily fee
+    fine_multiplier = models.PositiveSmallIntegerField(default=1)
     borrow = models.ForeignKey(
         to=Borrow,
         on_delete=models.CASCADE,
@@ -83,3 +111,19 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"], name="payment_created_at_idx"
+            ),
+            models.Index(
+                fields=["user"],
+                name="payment_open_user_idx",
+                condition=Q(status="open"),
+            ),
+            models.Index(
+                fields=["created_at"],
+                name="payment_open_created_at_idx",
+                condition=Q(status="open"),
+            ),
+            models.Index(fields=["session_id"], name="payment_session_id_idx"),
+        ]
@@ -1,17 +1,30 @@
+from datetime import date
+
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from rest_framework import serializers
 
+from Library_service import versions
+from Library_service.fieldsets import SparseFieldsetsMixin
 from book.serializers import (
     BookSerializer,
     BookTelegramSerializer,
 )
+from book.models import Book
 from borrow import utils
-from borrow.models import Borrow, Payment
+from borrow.models import Borrow, Payment, validate_return_dates
 from user.serializers import UserSerializer, UserTelegramSerializer
 
 
-class BorrowSerializer(serializers.ModelSerializer):
+def check_return_dates(borrow_date: date, **return_dates: date) -> None:
+    """Raise API validation error of return dates of the borrow"""
+    try:
+        validate_return_dates(borrow_date, **return_dates)
+    except ValidationError as error:
+        raise serializers.ValidationError(error.message_dict)
+
+
+class BorrowSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     borrow_date = serializers.DateField(
         default=timezone.now().date(), read_only=True
     )
@@ -28,12 +41,16 @@ class BorrowSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, attrs: dict) -> dict:
-        """Validation return dates from model class"""
+        """
+        Validate return dates by model rules without building a borrow,
+        database keeps them by check constraints
+        """
         data = super().validate(attrs)
-        try:
-            Borrow(**data).clean()
-        except ValidationError as error:
-            raise serializers.ValidationError(error.message_dict)
+        if "expected_return_date" in data:
+            check_return_dates(
+                self.instance.borrow_date if self.instance else date.today(),
+                expected_return_date=data["expected_return_date"],
+            )
         return data
 
 
@@ -61,28 +78,22 @@ class BorrowCreateSerializer(BorrowSerializer):
         many=True, read_only=True, slug_field="id"
     )
 
-    def validate(self, attrs: dict) -> dict:
-        """Validate borrow book inventory"""
-        data = super().validate(attrs)
-        book = data["book"]
-        if book.inventory <= 0:
+    def reserve_book(self, borrow: Borrow) -> None:
+        """
+        Reserve 1 book from book inventory when book is borrowed. Book row
+        is locked by reservation until commit, so it is called as the last
+        statement of borrow transaction
+        """
+        if not Book.objects.reserve(borrow.book_id):
             raise serializers.ValidationError(
                 {
                     "book": "There are no left book: "
-                    f"{book.title} in the library"
+                    f"{borrow.book.title} in the library"
                 }
             )
-        return data
 
-    def create(self, validated_data: dict) -> Borrow:
-        """Remove 1 book from book inventory when book is borrowed"""
-        book = validated_data["book"]
-        book.inventory -= 1
-        book.save()
-        return super().create(validated_data)
 
-
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = (
@@ -157,32 +168,39 @@ class BorrowReturnBookSerializer(BorrowSerializer):
         data = super().validate(attrs)
 
         borrow = self.instance
-        book = borrow.book
+        return_date = timezone.now().date()
+        check_return_dates(borrow.borrow_date, actual_return_date=return_date)
 
-        if borrow.actual_return_date:
+        closed = Borrow.objects.filter(
+            pk=borrow.pk, actual_return_date__isnull=True
+        ).update(actual_return_date=return_date)
+        if not closed:
             raise serializers.ValidationError(
                 {
                     "actual_return_date": "The Borrow already closed and book "
                     "returned to library"
                 }
             )
-        borrow.actual_return_date = timezone.now().date()
-        book.inventory += 1
-        book.save()
+        borrow.actual_return_date = return_date
 
         if borrow.actual_return_date > borrow.expected_return_date:
-            payment = Payment.objects.create(user=borrow.user)
-
-            checkout_session = utils.start_checkout_session(borrow, payment, 2)
-
-            payment.session_id = checkout_session["id"]
-            payment.session_url = checkout_session["url"]
-            payment.save()
-
-            borrow.payments.add(payment)
+            payment = Payment.objects.create(
+                user_id=borrow.user_id, borrow=borrow, fine_multiplier=2
+            )
+            utils.request_checkout_session(payment)
+        # Book row is locked until commit, so it is updated the last
+        Book.objects.release(borrow.book_id)
 
         return data
 
+    def update(self, instance: Borrow, validated_data: dict) -> Borrow:
+        """
+        Borrow is already closed by conditional UPDATE of validation, which
+        does not send post_save signal
+        """
+        versions.bump("borrow", f"borrow:user:{instance.user_id}")
+        return instance
+
 
 class PaymentIsSuccessSerializer(PaymentSerializer):
     status = serializers.CharField(read_only=True)
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Library_service import versions
+from borrow.models import Borrow, Payment
+
+
+@receiver(post_save, sender=Borrow)
+@receiver(post_delete, sender=Borrow)
+def bump_borrow_version(sender, instance: Borrow, **kwargs) -> None:
+    """Change version of all borrows and borrows of the borrow's user"""
+    versions.bump("borrow", f"borrow:user:{instance.user_id}")
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def bump_payment_version(sender, instance: Payment, **kwargs) -> None:
+    """Change version of all payments and payments of the payment's user"""
+    versions.bump("payment", f"payment:user:{instance.user_id}")
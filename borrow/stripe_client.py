@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Iterator
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
+
+from Library_service import metrics
+from Library_service.ratelimit import RateLimitExceeded, TokenBucket
+
+# Stripe operations called by the service, latency is measured for every one
+OPERATIONS = (
+    "checkout.session.create",
+    "checkout.session.expire",
+    "checkout.session.retrieve",
+    "checkout.session.list",
+)
+LATENCY_METRIC = "stripe:{operation}"
+# Backoff of retries (seconds) before jitter
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 2
+# The biggest page of Stripe list API
+LIST_PAGE_SIZE = 100
+
+_configure_lock = threading.Lock()
+_configured = False
+
+
+def _configure() -> None:
+    """
+    Make stripe library send requests through a pool of persistent
+    connections with timeouts. Library retries are disabled, they are made
+    by call() with rate limit
+    """
+    global _configured
+    if _configured:
+        return
+    with _configure_lock:
+        if _configured:
+            return
+        session = requests.Session()
+        session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE
+            ),
+        )
+        stripe.default_http_client = RequestsClient(
+            timeout=(
+                settings.STRIPE_CONNECT_TIMEOUT,
+                settings.STRIPE_READ_TIMEOUT,
+            ),
+            session=session,
+        )
+        stripe.max_network_retries = 0
+        if settings.STRIPE_API_BASE:
+            # Local fake of Stripe API (ex. stripe-mock) for development
+            stripe.api_base = settings.STRIPE_API_BASE
+        _configured = True
+
+
+def _get_bucket() -> TokenBucket:
+    return TokenBucket(
+        "stripe", settings.STRIPE_RATE_LIMIT, settings.STRIPE_RATE_LIMIT_WAIT
+    )
+
+
+def _is_retryable(error: stripe.error.StripeError) -> bool:
+    """Network errors, rate limits & Stripe server errors can be retried"""
+    if isinstance(
+        error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)
+    ):
+        return True
+    return isinstance(error, stripe.error.APIError) and (
+        error.http_status is None or error.http_status >= 500
+    )
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential delay with jitter, so workers do not retry at once"""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)
+    return delay * random.uniform(0.5, 1)
+
+
+def call(
+    operation: str, method: Callable, idempotent: bool = False, **params
+) -> Any:
+    """
+    Call Stripe API method under shared rate limit with bounded retries.
+    POST operations are called with idempotency key, so retried requests
+    do not create objects twice. Latency of every attempt is measured
+    """
+    _configure()
+    params.setdefault("api_key", settings.STRIPE_API_KEY)
+    if idempotent:
+        params.setdefault("idempotency_key", str(uuid.uuid4()))
+
+    bucket = _get_bucket()
+    for attempt in range(settings.STRIPE_MAX_RETRIES + 1):
+        try:
+            bucket.acquire()
+        except RateLimitExceeded as error:
+            raise stripe.error.RateLimitError(str(error))
+
+        start = time.perf_counter()
+        try:
+            return method(**params)
+        except stripe.error.StripeError as error:
+            if attempt == settings.STRIPE_MAX_RETRIES or not _is_retryable(
+                error
+            ):
+                raise
+        finally:
+            metrics.observe(
+                LATENCY_METRIC.format(operation=operation),
+                time.perf_counter() - start,
+            )
+        time.sleep(_backoff(attempt))
+
+
+def create_checkout_session(**params) -> stripe.checkout.Session:
+    return call(
+        "checkout.session.create",
+        stripe.checkout.Session.create,
+        idempotent=True,
+        **params,
+    )
+
+
+def expire_checkout_session(session_id: str) -> stripe.checkout.Session:
+    return call(
+        "checkout.session.expire",
+        stripe.checkout.Session.expire,
+        idempotent=True,
+        session=session_id,
+    )
+
+
+def retrieve_checkout_session(session_id: str) -> stripe.checkout.Session:
+    return call(
+        "checkout.session.retrieve",
+        stripe.checkout.Session.retrieve,
+        id=session_id,
+    )
+
+
+def list_checkout_sessions(**params) -> Iterator[list]:
+    """Yield pages of checkout sessions found by params"""
+    page_params = {}
+    while True:
+        page = call(
+            "checkout.session.list",
+            stripe.checkout.Session.list,
+            limit=LIST_PAGE_SIZE,
+            **page_params,
+            **params,
+        )
+        if page["data"]:
+            yield page["data"]
+        if not page["has_more"]:
+            return
+        page_params["starting_after"] = page["data"][-1]["id"]
+
+
+def get_latency_stats() -> dict:
+    """Return latency histograms of Stripe operations"""
+    return {
+        operation: metrics.get_histogram(
+            LATENCY_METRIC.format(operation=operation)
+        )
+        for operation in OPERATIONS
+    }
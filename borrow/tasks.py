@@ -1,16 +1,35 @@
-from datetime import timedelta
+import logging
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from functools import partial
 
+import stripe
 from asgiref.sync import async_to_sync
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Sum
 from django.utils import timezone
 from rest_framework.utils import json
 
+from Library_service import metrics, versions
+from book import cache as book_cache
+from book.models import BookBorrowDay, BookPopularity, PopularityRollup
+from borrow import stripe_client, utils, webhooks
 from borrow.models import Borrow, Payment
 from borrow.serializers import (
     BorrowTelegramSerializer,
 )
 from user.management.commands import t_bot
-from user.models import TelegramChat
+from user.models import TelegramChat, TelegramOutbox
+
+logger = logging.getLogger(__name__)
+
+# Popularity windows in days
+POPULARITY_WINDOWS = {"week": 7, "month": 30}
+# Metrics of open payments expiry
+EXPIRED_PAYMENTS_METRIC = "payments:expired"
+EXPIRY_BATCH_METRIC = "payments:expiry_batch"
 
 
 def inform_borrowing_overdue() -> None:
@@ -46,9 +65,315 @@ def inform_borrowing_overdue() -> None:
             async_to_sync(t_bot.send_msg)(text=text, chat_user_id=chat_user_id)
 
 
-def check_payment_session_duration() -> None:
-    payments = Payment.objects.filter(status="open")
-    for payment in payments:
-        if timezone.now() - payment.created_at >= timedelta(days=1):
-            payment.status = "expired"
-            payment.save()
+def _retry_delay(attempts: int) -> timedelta:
+    """Delay before next attempt of message, doubled by every attempt"""
+    return timedelta(
+        seconds=settings.TELEGRAM_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    )
+
+
+def send_telegram_outbox() -> int:
+    """
+    Task in Django-Q witch sends a batch of queued telegram messages to
+    chats through one bot session. Batch is claimed by short transaction
+    before sending, so rows are not locked while Telegram is called. Chats
+    which did not get a message are retried later with growing delay.
+    Return number of handled messages
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Locked messages are being claimed by another worker
+        messages = list(
+            TelegramOutbox.objects.select_for_update(skip_locked=True).due(
+                settings.TELEGRAM_OUTBOX_MAX_ATTEMPTS
+            )[: settings.TELEGRAM_OUTBOX_BATCH_SIZE]
+        )
+        if not messages:
+            return 0
+
+        chat_user_ids = None
+        for message in messages:
+            if message.chat_user_ids is None:
+                if chat_user_ids is None:
+                    chat_user_ids = list(
+                        TelegramChat.objects.values_list(
+                            "chat_user_id", flat=True
+                        )
+                    )
+                message.chat_user_ids = chat_user_ids
+            # Attempt is counted when it starts, its retry delay is the
+            # lease of claimed message, so it is retried if worker dies
+            message.attempts += 1
+            message.next_attempt_at = now + _retry_delay(message.attempts)
+        TelegramOutbox.objects.bulk_update(
+            messages, ["chat_user_ids", "attempts", "next_attempt_at"]
+        )
+
+    deliveries = [
+        (message, chat_user_id)
+        for message in messages
+        for chat_user_id in message.chat_user_ids
+    ]
+    results = []
+    if deliveries:
+        try:
+            results = async_to_sync(t_bot.send_msgs)(
+                [(message.text, chat) for message, chat in deliveries]
+            )
+        except Exception as error:
+            # Bot session is not opened, every delivery is retried
+            results = [error] * len(deliveries)
+
+    failed = defaultdict(list)
+    for (message, chat_user_id), result in zip(deliveries, results):
+        if isinstance(result, Exception):
+            logger.warning(
+                "Telegram message %s is not sent to %s: %s",
+                message.id,
+                chat_user_id,
+                result,
+            )
+            failed[message.id].append(chat_user_id)
+
+    retried = []
+    for message in messages:
+        if failed[message.id] and failed[message.id] != message.chat_user_ids:
+            message.chat_user_ids = failed[message.id]
+            retried.append(message)
+    with transaction.atomic():
+        TelegramOutbox.objects.bulk_update(retried, ["chat_user_ids"])
+        TelegramOutbox.objects.filter(
+            id__in=[m.id for m in messages if not failed[m.id]]
+        ).delete()
+    return len(messages)
+
+
+def create_payment_checkout_session(payment_id: int) -> None:
+    """
+    Task in Django-Q witch starts checkout session of new payment unless
+    it was started by "pay" endpoint before
+    """
+    payment = (
+        Payment.objects.select_related("borrow__book")
+        .filter(pk=payment_id, status="open", session_id="")
+        .exclude(borrow=None)
+        .first()
+    )
+    if payment is not None:
+        utils.create_checkout_session(payment)
+
+
+def expire_checkout_sessions(session_ids: list[str]) -> None:
+    """
+    Task in Django-Q witch expires checkout sessions superseded by
+    consolidated checkout, so payments can not be paid twice
+    """
+    for session_id in session_ids:
+        try:
+            stripe_client.expire_checkout_session(session_id)
+        except stripe.error.StripeError:
+            # Session is already completed or expired
+            logger.warning(
+                "Checkout session %s is not expired", session_id, exc_info=True
+            )
+
+
+def reconcile_payments() -> int:
+    """
+    Task in Django-Q witch applies checkout sessions completed or expired
+    since the oldest open payment was created, so payments are settled
+    even if webhook events are lost. Sessions are read by pages of Stripe
+    list API & every page is applied with one bulk write. Return number of
+    changed payments
+    """
+    oldest = (
+        Payment.objects.filter(status="open")
+        .exclude(session_id="")
+        .aggregate(oldest=Min("created_at"))["oldest"]
+    )
+    if oldest is None:
+        return 0
+
+    changed = 0
+    for session_status, event_type in webhooks.SESSION_STATUS_EVENTS.items():
+        for sessions in stripe_client.list_checkout_sessions(
+            status=session_status, created={"gte": int(oldest.timestamp())}
+        ):
+            changed += len(
+                webhooks.apply_sessions(
+                    [(event_type, session) for session in sessions]
+                )
+            )
+    return changed
+
+
+def check_payment_session_duration() -> int:
+    """
+    Task in Django-Q witch expires open payments older than session
+    duration. Payments are taken by bounded batches from partial index of
+    open payments & every batch is expired by one UPDATE. Return number of
+    expired payments
+    """
+    cutoff = timezone.now() - timedelta(
+        hours=settings.PAYMENT_SESSION_DURATION
+    )
+    batch_size = settings.PAYMENT_EXPIRY_BATCH_SIZE
+    total = 0
+    while True:
+        start = time.perf_counter()
+        with transaction.atomic():
+            # Payments locked by webhook are expired by the next run
+            rows = list(
+                Payment.objects.select_for_update(skip_locked=True)
+                .filter(status="open", created_at__lt=cutoff)
+                .order_by("created_at")
+                .values_list("id", "user_id", "session_id")[:batch_size]
+            )
+            if not rows:
+                break
+
+            ids, user_ids, session_ids = zip(*rows)
+            expired = Payment.objects.filter(id__in=ids, status="open").update(
+                status="expired"
+            )
+            # UPDATE does not send post_save, versions are bumped by hand
+            versions.bump(
+                "payment",
+                *{f"payment:user:{user_id}" for user_id in user_ids},
+            )
+            sessions = sorted(set(session_ids) - {""})
+            if settings.PAYMENT_EXPIRY_STRIPE_SESSIONS and sessions:
+                transaction.on_commit(
+                    partial(utils.queue_expire_checkout_sessions, sessions)
+                )
+
+        total += expired
+        metrics.incr(EXPIRED_PAYMENTS_METRIC, expired)
+        metrics.observe(EXPIRY_BATCH_METRIC, time.perf_counter() - start)
+        if len(rows) < batch_size:
+            break
+
+    logger.info("%s open payments are expired", total)
+    return total
+
+
+def _count_borrow_days(since: date) -> dict:
+    """Return borrows count by (book id, day) pairs of days since given"""
+    return {
+        (row["book_id"], row["borrow_date"]): row["borrows"]
+        for row in Borrow.objects.filter(borrow_date__gte=since)
+        .values("book_id", "borrow_date")
+        .annotate(borrows=Count("id"))
+        .order_by()
+    }
+
+
+def rollup_book_popularity() -> None:
+    """
+    Task in Django-Q witch rolls up borrows of the days since the last run
+    into daily borrow counters of books & updates book popularity ranking.
+    Only borrows of recounted days are read, so the task cost does not
+    depend on size of borrow history. The last counted day is recounted to
+    include borrows committed after the previous run
+    """
+    today = timezone.now().date()
+
+    with transaction.atomic():
+        rollup, _ = PopularityRollup.objects.select_for_update().get_or_create(
+            pk=1
+        )
+        since = rollup.counted_until
+        if since is None:
+            since = (
+                Borrow.objects.aggregate(first=Min("borrow_date"))["first"]
+                or today
+            )
+
+        days = _count_borrow_days(since)
+        old_days = BookBorrowDay.objects.filter(day__gte=since)
+        deltas = defaultdict(int)
+        for book_id, day, borrows in old_days.values_list(
+            "book_id", "day", "borrows"
+        ):
+            deltas[book_id] -= borrows
+        for (book_id, _), borrows in days.items():
+            deltas[book_id] += borrows
+
+        old_days.delete()
+        BookBorrowDay.objects.bulk_create(
+            BookBorrowDay(book_id=book_id, day=day, borrows=borrows)
+            for (book_id, day), borrows in days.items()
+        )
+
+        windows = {
+            row["book_id"]: row
+            for row in BookBorrowDay.objects.filter(
+                day__gt=today - timedelta(days=POPULARITY_WINDOWS["month"])
+            )
+            .values("book_id")
+            .annotate(
+                week=Sum(
+                    "borrows",
+                    filter=Q(
+                        day__gt=today
+                        - timedelta(days=POPULARITY_WINDOWS["week"])
+                    ),
+                    default=0,
+                ),
+                month=Sum("borrows"),
+            )
+            .order_by()
+        }
+
+        # Totals are changed only by this task, which holds rollup lock
+        deltas = {book_id: delta for book_id, delta in deltas.items() if delta}
+        totals = dict(
+            BookPopularity.objects.filter(book_id__in=deltas).values_list(
+                "book_id", "total"
+            )
+        )
+        BookPopularity.objects.bulk_create(
+            (
+                BookPopularity(
+                    book_id=book_id, total=totals.get(book_id, 0) + delta
+                )
+                for book_id, delta in deltas.items()
+            ),
+            update_conflicts=True,
+            unique_fields=["book"],
+            update_fields=["total"],
+        )
+
+        # Only windows which are changed are written
+        counted = {
+            book_id: {"week": week, "month": month}
+            for book_id, week, month in BookPopularity.objects.filter(
+                Q(week__gt=0) | Q(month__gt=0)
+            ).values_list("book_id", "week", "month")
+        }
+        changed_windows = {
+            book_id: row
+            for book_id, row in windows.items()
+            if counted.get(book_id, {"week": 0, "month": 0})
+            != {"week": row["week"], "month": row["month"]}
+        }
+        cleared = BookPopularity.objects.filter(
+            book_id__in=set(counted) - set(windows)
+        ).update(week=0, month=0)
+        BookPopularity.objects.bulk_create(
+            (
+                BookPopularity(
+                    book_id=book_id, week=row["week"], month=row["month"]
+                )
+                for book_id, row in changed_windows.items()
+            ),
+            update_conflicts=True,
+            unique_fields=["book"],
+            update_fields=["week", "month"],
+        )
+
+        rollup.counted_until = today
+        rollup.save()
+
+    if deltas or changed_windows or cleared:
+        book_cache.invalidate_popularity()
@@ -1,27 +1,28 @@
+import logging
 from datetime import timedelta
 from decimal import Decimal
+from typing import Optional
 
 import stripe
 from django.conf import settings
+from django.db import transaction
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.response import Response
 
+from Library_service import versions
+from borrow import stripe_client, webhooks
 from borrow.models import Borrow, Payment
 
+logger = logging.getLogger(__name__)
 
-def start_checkout_session(
-    borrow: Borrow, payment: Payment, fine_multiplier: int = 1
-) -> dict | Response:
+
+def get_line_item(borrow: Borrow, fine_multiplier: int = 1) -> dict:
     """
-    Start checkout session for payment at borrow with fine multiplier.
+    Return Stripe line item of borrow payment with fine multiplier.
     If fine multiplier == 1 borrow is created or payment is renewed, else
     borrow is returned
     """
-    stripe.api_key = settings.STRIPE_API_KEY
-    action_url = reverse("borrow:payment-is-success", args=[payment.id])
-    cancel_url = reverse("borrow:payment-cancel-payment", args=[payment.id])
-    host = settings.HOST
     if fine_multiplier == 1:
         days_count = borrow.expected_return_date - borrow.borrow_date
     else:
@@ -32,22 +33,30 @@ def start_checkout_session(
         * Decimal(days_count / timedelta(days=1))
     )
 
+    return {
+        "price_data": {
+            "currency": "usd",
+            "unit_amount": int(amount * 100),
+            "product_data": {
+                "name": borrow.book.title,
+                "description": f"borrowing at {borrow.borrow_date}",
+            },
+        },
+        "quantity": 1,
+    }
+
+
+def start_checkout_session(
+    borrow: Borrow, payment: Payment, fine_multiplier: int = 1
+) -> dict | Response:
+    """Start checkout session for payment at borrow with fine multiplier"""
+    action_url = reverse("borrow:payment-is-success", args=[payment.id])
+    cancel_url = reverse("borrow:payment-cancel-payment", args=[payment.id])
+    host = settings.HOST
+
     try:
-        return stripe.checkout.Session.create(
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": "usd",
-                        "unit_amount": int(amount * 100),
-                        "product_data": {
-                            "name": borrow.book.title,
-                            "description": "borrowing "
-                            f"at {borrow.borrow_date}",
-                        },
-                    },
-                    "quantity": 1,
-                },
-            ],
+        return stripe_client.create_checkout_session(
+            line_items=[get_line_item(borrow, fine_multiplier)],
             mode="payment",
             success_url=str(host + action_url),
             cancel_url=str(host + cancel_url),
@@ -55,3 +64,201 @@ def start_checkout_session(
 
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+
+def create_checkout_session(payment: Payment) -> Optional[Response]:
+    """
+    Start checkout session of payment by its fine multiplier and save it in
+    the payment. Session is saved only if payment has no session yet, a
+    session started concurrently by "pay" endpoint or worker is kept and
+    the other one is expired. Return error response if session is not
+    started
+    """
+    checkout_session = start_checkout_session(
+        payment.borrow, payment, payment.fine_multiplier
+    )
+    if isinstance(checkout_session, Response):
+        return checkout_session
+
+    saved = Payment.objects.filter(pk=payment.pk, session_id="").update(
+        session_id=checkout_session["id"],
+        session_url=checkout_session["url"],
+    )
+    if not saved:
+        payment.refresh_from_db(fields=["session_id", "session_url"])
+        transaction.on_commit(
+            lambda: queue_expire_checkout_sessions([checkout_session["id"]])
+        )
+        return None
+
+    payment.session_id = checkout_session["id"]
+    payment.session_url = checkout_session["url"]
+    # UPDATE does not send post_save, payments version is bumped by hand
+    versions.bump("payment", f"payment:user:{payment.user_id}")
+    return None
+
+
+def _queue_checkout_session(payment_id: int) -> None:
+    from django_q.tasks import async_task
+
+    try:
+        async_task("borrow.tasks.create_payment_checkout_session", payment_id)
+    except Exception:
+        # Session is started by "pay" endpoint if the broker is not available
+        logger.warning(
+            "Checkout session of payment %s is not queued",
+            payment_id,
+            exc_info=True,
+        )
+
+
+def _start_checkout_session(payment: Payment) -> None:
+    """Start checkout session of new payment or leave it to worker"""
+    error = create_checkout_session(payment)
+    if error is not None:
+        # Session is started by worker or by "pay" endpoint later
+        logger.warning(
+            "Checkout session of payment %s is not started: %s",
+            payment.id,
+            error.data["error"],
+        )
+        _queue_checkout_session(payment.id)
+
+
+def request_checkout_session(payment: Payment) -> None:
+    """
+    Start checkout session of new payment as STRIPE_CHECKOUT_MODE says:
+    in request, by worker or not until user opens "pay" endpoint. Stripe
+    is called after commit, so rows locked by the transaction are not held
+    while it answers
+    """
+    mode = settings.STRIPE_CHECKOUT_MODE
+    if mode == "eager":
+        transaction.on_commit(lambda: _start_checkout_session(payment))
+    elif mode == "background":
+        transaction.on_commit(lambda: _queue_checkout_session(payment.id))
+
+
+def queue_expire_checkout_sessions(session_ids: list[str]) -> None:
+    from django_q.tasks import async_task
+
+    try:
+        async_task("borrow.tasks.expire_checkout_sessions", session_ids)
+    except Exception:
+        # Not expired sessions are expired by Stripe in 24 hours
+        logger.warning(
+            "Expiration of checkout sessions %s is not queued",
+            session_ids,
+            exc_info=True,
+        )
+
+
+def _release_checkout_sessions(payments: list[Payment]) -> Optional[Response]:
+    """
+    Expire sessions started for payments before, so they can not be paid
+    after payments get consolidated session. Sessions which are already
+    completed are applied to their payments & they are not consolidated.
+    Return error response if sessions state is not known
+    """
+    session_ids = sorted(
+        {payment.session_id for payment in payments if payment.session_id}
+    )
+    completed = []
+    for session_id in session_ids:
+        try:
+            try:
+                session = stripe_client.expire_checkout_session(session_id)
+            except stripe.error.InvalidRequestError:
+                # Only open sessions can be expired
+                session = stripe_client.retrieve_checkout_session(session_id)
+        except stripe.error.StripeError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_403_FORBIDDEN
+            )
+        if session["status"] == "complete":
+            completed.append(session)
+
+    completed_ids = {session["id"] for session in completed}
+    with transaction.atomic():
+        webhooks.apply_sessions(
+            [("checkout.session.completed", session) for session in completed]
+        )
+        # Expired sessions are not kept, so their events do not change
+        # payments which are paid by consolidated session
+        Payment.objects.filter(
+            id__in=[payment.id for payment in payments],
+            status="open",
+            session_id__in=set(session_ids) - completed_ids,
+        ).update(session_id="", session_url="")
+    return None
+
+
+def create_consolidated_checkout_session(
+    payments: list[Payment],
+) -> str | Response:
+    """
+    Start one checkout session with line item of every open payment and
+    save it in all of them, so payments are paid & settled together.
+    Stripe is called out of transaction, session is saved by conditional
+    UPDATE of payments which are not changed meanwhile. Return url of
+    session or error response
+    """
+    error = _release_checkout_sessions(payments)
+    if error is not None:
+        return error
+
+    payments = list(
+        Payment.objects.select_related("borrow__book")
+        .filter(
+            id__in=[payment.id for payment in payments],
+            status="open",
+            session_id="",
+        )
+        .order_by("id")
+    )
+    if not payments:
+        return Response(
+            {"error": "Your payments are paid by started checkout sessions"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    host = settings.HOST
+    cancel_url = reverse(
+        "borrow:payment-cancel-payment", args=[payments[0].id]
+    )
+    try:
+        checkout_session = stripe_client.create_checkout_session(
+            line_items=[
+                get_line_item(payment.borrow, payment.fine_multiplier)
+                for payment in payments
+            ],
+            mode="payment",
+            success_url=str(host + reverse("borrow:payment-list")),
+            cancel_url=str(host + cancel_url),
+        )
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+
+    with transaction.atomic():
+        saved = Payment.objects.filter(
+            id__in=[payment.id for payment in payments],
+            status="open",
+            session_id="",
+        ).update(
+            session_id=checkout_session["id"],
+            session_url=checkout_session["url"],
+        )
+        if saved != len(payments):
+            # Payments are changed by other request, session would charge
+            # them twice
+            transaction.set_rollback(True)
+    if saved != len(payments):
+        queue_expire_checkout_sessions([checkout_session["id"]])
+        return Response(
+            {"error": "Your payments are changed, try again"},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    # UPDATE does not send post_save, payments version is bumped by hand
+    versions.bump("payment", f"payment:user:{payments[0].user_id}")
+    return checkout_session["url"]
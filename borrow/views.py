@@ -1,11 +1,10 @@
 from typing import Type
 
 import stripe
-from asgiref.sync import async_to_sync
-from django.conf import settings
-from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.db.models import QuerySet, Q
+from django.http import HttpResponse
+from django.shortcuts import redirect
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (
     extend_schema,
@@ -15,13 +14,20 @@ from drf_spectacular.utils import (
 )
 from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
-from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated,
+)
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from book.models import Book
-from borrow import utils
+from Library_service.conditional import ConditionalGetMixin, user_scope
+from Library_service.fast_serializers import FastReadMixin
+from Library_service.fieldsets import SparseFieldsetsViewMixin
+from Library_service.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from Library_service.pagination import KeysetPagination
+from borrow import stripe_client, utils, webhooks
 from borrow.models import Borrow, Payment
 from borrow.serializers import (
     BorrowListSerializer,
@@ -34,15 +40,15 @@ from borrow.serializers import (
     PaymentIsSuccessSerializer,
     PaymentSerializer,
 )
-from user.management.commands import t_bot
-from user.models import TelegramChat
+from user.models import TelegramOutbox
 
 
 @extend_schema_view(
     create=extend_schema(
         description="Create borrow and check if pending payment exist for "
         "user. Create & add payment for borrow, & send info message about it "
-        "using telegram"
+        "using telegram",
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
     ),
     list=extend_schema(
         description="Return all borrows for admin user and self borrows for "
@@ -52,12 +58,16 @@ from user.models import TelegramChat
     retrieve=extend_schema(description="Return borrow detail information"),
 )
 class BorrowViewSet(
+    ConditionalGetMixin,
+    SparseFieldsetsViewMixin,
+    FastReadMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet,
 ):
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
     @staticmethod
     def _params_to_ints(qs: str) -> list[int]:
@@ -90,6 +100,15 @@ class BorrowViewSet(
 
         return queryset
 
+    def get_version_scopes(self) -> tuple[str, ...]:
+        """Borrows show nested books, payments and users"""
+        return (
+            user_scope("borrow", self.request),
+            user_scope("payment", self.request),
+            "book",
+            "user",
+        )
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -122,6 +141,7 @@ class BorrowViewSet(
             return BorrowReturnBookSerializer
         return BorrowSerializer
 
+    @idempotent
     def create(self, request: Request, *args: list, **kwargs: dict):
         """
         Create borrow and check if pending payment exist for user
@@ -129,7 +149,7 @@ class BorrowViewSet(
         payments = Payment.objects.filter(
             Q(user=self.request.user) & Q(status="open")
         )
-        if payments:
+        if payments.exists():
             return Response(
                 {"error": "You did not pay all of your payments"},
                 status=status.HTTP_403_FORBIDDEN,
@@ -138,47 +158,30 @@ class BorrowViewSet(
 
     def perform_create(self, serializer: BorrowSerializer) -> None:
         """
-        Save borrow serializer, create & add payment for borrow, & send
-        info message about it by telegram
+        Save borrow serializer, create & add payment for borrow, & queue
+        info message about it for telegram chats
         """
         with transaction.atomic():
+            borrow = serializer.save(user=self.request.user)
             payment = Payment.objects.create(
-                user=self.request.user,
+                user=self.request.user, borrow=borrow
             )
+            utils.request_checkout_session(payment)
 
-            serializer.save(user=self.request.user, payments=[payment])
-
-            data = serializer.data
-            borrow = get_object_or_404(Borrow, id=data["id"])
-
-            checkout_session = utils.start_checkout_session(borrow, payment)
-
-            payment.session_id = checkout_session["id"]
-            payment.session_url = checkout_session["url"]
-            payment.save()
-
-            borrow.payments.add(payment)
-            borrow.save()
-
-        chat_user_id_list = TelegramChat.objects.values_list(
-            "chat_user_id", flat=True
-        )
-        book = Book.objects.get(id=data["book"])
-        user = get_user_model().objects.get(id=data["user"])
-        text = (
-            f"Book: '{book.title}' borrowing by {user.first_name} "
-            f"{user.last_name} ({user.email}) at {data['borrow_date']}. "
-            f"Expected return data is {data['expected_return_date']}."
-        )
-        if chat_user_id_list:
-            for chat_user_id in chat_user_id_list:
-                async_to_sync(t_bot.send_msg)(
-                    text=text, chat_user_id=chat_user_id
-                )
+            user = self.request.user
+            TelegramOutbox.objects.enqueue(
+                f"Book: '{borrow.book.title}' borrowing by {user.first_name} "
+                f"{user.last_name} ({user.email}) at {borrow.borrow_date}. "
+                f"Expected return data is {borrow.expected_return_date}."
+            )
+            # Concurrent borrowers of the book wait for its row lock only
+            # until commit
+            serializer.reserve_book(borrow)
 
     @extend_schema(
         request=None,
         responses=BorrowReturnBookSerializer,
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
     )
     @action(
         methods=["POST"],
@@ -186,14 +189,16 @@ class BorrowViewSet(
         url_name="book-return",
         url_path="return",
     )
+    @idempotent
     def borrow_book_return(self, request: Request, pk: int) -> Response:
         """Close borrow and grow up book inventory when it returns"""
         borrow = self.get_object()
 
         serializer = self.get_serializer(borrow, request.data)
 
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -206,11 +211,15 @@ class BorrowViewSet(
     retrieve=extend_schema(description="Return payment detail information"),
 )
 class PaymentViewSet(
+    ConditionalGetMixin,
+    SparseFieldsetsViewMixin,
+    FastReadMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet,
 ):
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
     def get_queryset(self) -> QuerySet:
         """Return all orders for admin & only self orders for non_admin user"""
@@ -220,6 +229,15 @@ class PaymentViewSet(
 
         return queryset
 
+    def get_version_scopes(self) -> tuple[str, ...]:
+        """Payments show nested borrows, books and users"""
+        return (
+            user_scope("payment", self.request),
+            user_scope("borrow", self.request),
+            "book",
+            "user",
+        )
+
     def get_serializer_class(self) -> Type[PaymentSerializer]:
         """Take different serializers for different actions"""
         if self.action == "list":
@@ -242,63 +260,72 @@ class PaymentViewSet(
     )
     def is_success(self, request: Request, pk: int = None) -> Response:
         """
-        Check session's payment status, change Payment status if it changed and
-        send message via Telegram
+        Return payment status, which is changed by Stripe webhook events of
+        its checkout session. Status of open payment is checked by cached
+        checkout session, so polls do not wait for webhook
         """
-        stripe.api_key = settings.STRIPE_API_KEY
-        payment = self.get_object()
-        session = stripe.checkout.Session.retrieve(payment.session_id)
+        payment = webhooks.sync_payment(self.get_object())
+        serializer = self.get_serializer(payment)
 
-        if session.status == "complete" and payment.status != "success":
-            payment.status = "success"
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
-            chat_user_id_list = TelegramChat.objects.values_list(
-                "chat_user_id", flat=True
+    @extend_schema(
+        request=None,
+        responses={
+            200: OpenApiResponse(description="Event is handled"),
+            400: OpenApiResponse(description="Event is not signed"),
+        },
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_name="webhook",
+        authentication_classes=(),
+        permission_classes=(AllowAny,),
+    )
+    def webhook(self, request: Request) -> Response:
+        """
+        Receive signed Stripe events & change status of payments by
+        completed or expired checkout sessions
+        """
+        try:
+            event = webhooks.construct_event(
+                request.body, request.headers.get("Stripe-Signature", "")
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response(
+                {"error": "Invalid Stripe event"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            borrow = payment.borrow
-            text = f"For borrowing {borrow} payment was paid"
-            if chat_user_id_list:
-                for chat_user_id in chat_user_id_list:
-                    async_to_sync(t_bot.send_msg)(
-                        text=text, chat_user_id=chat_user_id
-                    )
-
-        serializer = self.get_serializer(payment, request.data)
 
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        webhooks.handle_event(event)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(status=status.HTTP_200_OK)
 
     @extend_schema(
         responses=PaymentListSerializer,
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
     )
     @action(
         methods=["GET"],
         detail=True,
         url_name="renew-payment",
     )
+    @idempotent
     def renew_payment(self, request: Request, pk: int = None) -> Response:
         """Renew payment"""
         payment = self.get_object()
 
         if payment.status == "expired":
-            borrow = payment.borrow
-            new_payment = Payment.objects.create(user=request.user)
-
-            checkout_session = utils.start_checkout_session(
-                borrow, new_payment
-            )
-
-            new_payment.session_id = checkout_session["id"]
-            new_payment.session_url = checkout_session["url"]
-
-            borrow.payments.add(new_payment)
-            borrow.save()
+            with transaction.atomic():
+                new_payment = Payment.objects.create(
+                    user=request.user,
+                    borrow=payment.borrow,
+                    fine_multiplier=payment.fine_multiplier,
+                )
+                utils.request_checkout_session(new_payment)
 
-            serializer = PaymentDetailSerializer(new_payment, request.data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            serializer = PaymentDetailSerializer(new_payment)
 
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -309,6 +336,92 @@ class PaymentViewSet(
 
         return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        responses={
+            302: OpenApiResponse(description="Redirect to Stripe checkout"),
+            400: OpenApiResponse(description="Payment can not be paid"),
+        },
+    )
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_name="pay",
+    )
+    def pay(self, request: Request, pk: int = None) -> HttpResponse:
+        """
+        Redirect to Stripe checkout of open payment. Checkout session is
+        started on the first visit if it was not started before
+        """
+        payment = self.get_object()
+
+        if payment.status != "open" or payment.borrow is None:
+            message = {
+                "error": f"Payment status is {payment.status}. "
+                "You can pay only open payments of borrows"
+            }
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        if not payment.session_url:
+            error = utils.create_checkout_session(payment)
+            if error is not None:
+                return error
+
+        return redirect(payment.session_url)
+
+    @extend_schema(
+        responses={
+            302: OpenApiResponse(description="Redirect to Stripe checkout"),
+            400: OpenApiResponse(description="No open payments"),
+            409: OpenApiResponse(description="Payments are changed"),
+        },
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_name="checkout",
+    )
+    def checkout(self, request: Request) -> HttpResponse:
+        """
+        Redirect to one Stripe checkout of all open payments of user.
+        Session is started again only if open payments are not in it
+        """
+        # Payments are not locked, Stripe is called out of transaction and
+        # session is saved only in payments which are not changed meanwhile
+        payments = list(
+            Payment.objects.filter(user=request.user, status="open")
+            .exclude(borrow=None)
+            .order_by("id")
+        )
+        if not payments:
+            return Response(
+                {"error": "You do not have open payments"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        session_ids = {payment.session_id for payment in payments}
+        if len(session_ids) == 1 and payments[0].session_url:
+            return redirect(payments[0].session_url)
+
+        session_url = utils.create_consolidated_checkout_session(payments)
+        if isinstance(session_url, Response):
+            return session_url
+        return redirect(session_url)
+
+    @extend_schema(
+        description="Return latency histograms of Stripe operations. Only "
+        "staff user can see it",
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="stripe-stats",
+        permission_classes=(IsAdminUser,),
+    )
+    def stripe_stats(self, request: Request) -> Response:
+        """Return latency histograms of Stripe operations"""
+        return Response(stripe_client.get_latency_stats())
+
     @extend_schema(
         responses=OpenApiResponse(OpenApiTypes.STR),
     )
@@ -0,0 +1,179 @@
+import logging
+from typing import Optional
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from Library_service import versions
+from borrow import stripe_client
+from borrow.models import Payment
+from user.models import TelegramOutbox
+
+# Checkout session event: (new payment status, statuses it can be set from)
+SESSION_TRANSITIONS = {
+    "checkout.session.completed": ("success", ("open", "expired")),
+    "checkout.session.async_payment_succeeded": (
+        "success",
+        ("open", "expired"),
+    ),
+    "checkout.session.expired": ("expired", ("open",)),
+}
+PAID_STATUSES = ("paid", "no_payment_required")
+# Checkout session status: event which is applied to its payments
+SESSION_STATUS_EVENTS = {
+    "complete": "checkout.session.completed",
+    "expired": "checkout.session.expired",
+}
+SESSION_KEY = "stripe:session:{session_id}"
+SESSION_LOCK_KEY = "stripe:session:{session_id}:lock"
+# Lock is released by its request, timeout only saves from dead workers
+SESSION_LOCK_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+
+
+def construct_event(payload: bytes, signature: str) -> stripe.Event:
+    """
+    Return Stripe event of webhook request. Raise ValueError if payload is
+    not valid or stripe.error.SignatureVerificationError if request is not
+    signed by endpoint secret
+    """
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        raise stripe.error.SignatureVerificationError(
+            "Webhook secret is not set", signature
+        )
+    return stripe.Webhook.construct_event(
+        payload, signature, settings.STRIPE_WEBHOOK_SECRET
+    )
+
+
+def get_transition(
+    event_type: str, session: dict
+) -> Optional[tuple[str, tuple[str, ...]]]:
+    """
+    Return new status of payments by checkout session event & statuses it
+    can be set from, or None if payments are not changed by event
+    """
+    if event_type not in SESSION_TRANSITIONS:
+        return None
+
+    status, from_statuses = SESSION_TRANSITIONS[event_type]
+    if status == "success" and session["payment_status"] not in PAID_STATUSES:
+        # Delayed payment methods are paid by async_payment_succeeded
+        return None
+    return status, from_statuses
+
+
+def apply_sessions(events: list[tuple[str, dict]]) -> list[Payment]:
+    """
+    Change status of payments by (event type, checkout session) pairs with
+    one bulk write. Consolidated checkout session settles all payments it
+    was started for. Events can be delivered many times & in any order, so
+    status is changed only by allowed transitions. Return changed payments
+    """
+    transitions = {}
+    for event_type, session in events:
+        transition = get_transition(event_type, session)
+        if transition is not None:
+            transitions[session["id"]] = transition
+    if not transitions:
+        return []
+
+    with transaction.atomic():
+        payments = (
+            Payment.objects.select_for_update(of=("self",))
+            .select_related("borrow__book")
+            .filter(session_id__in=transitions, status__in=("open", "expired"))
+        )
+        changed = []
+        for payment in payments:
+            status, from_statuses = transitions[payment.session_id]
+            if payment.status in from_statuses:
+                payment.status = status
+                changed.append(payment)
+        if not changed:
+            return []
+
+        Payment.objects.bulk_update(changed, ["status"])
+        # Bulk UPDATE does not send post_save, versions are bumped by hand
+        versions.bump(
+            "payment",
+            *{f"payment:user:{payment.user_id}" for payment in changed},
+        )
+        TelegramOutbox.objects.enqueue_many(
+            [
+                f"For borrowing {payment.borrow} payment was paid"
+                for payment in changed
+                if payment.status == "success"
+            ]
+        )
+    return changed
+
+
+def handle_event(event: stripe.Event) -> list[Payment]:
+    """Change status of payments by checkout session event"""
+    return apply_sessions([(event["type"], event["data"]["object"])])
+
+
+def _retrieve_session(session_id: str) -> dict:
+    """Return checkout session fields used by payments or empty dict"""
+    try:
+        session = stripe_client.retrieve_checkout_session(session_id)
+    except stripe.error.StripeError:
+        logger.warning(
+            "Checkout session %s is not retrieved", session_id, exc_info=True
+        )
+        return {}
+    return {
+        "id": session["id"],
+        "status": session["status"],
+        "payment_status": session["payment_status"],
+    }
+
+
+def get_session(session_id: str) -> Optional[dict]:
+    """
+    Return cached checkout session. Only one request retrieves session from
+    Stripe and caches it for the next polls. Return None without waiting
+    while session is retrieved by other request
+    """
+    key = SESSION_KEY.format(session_id=session_id)
+    session = cache.get(key)
+    if session is not None:
+        return session
+
+    lock_key = SESSION_LOCK_KEY.format(session_id=session_id)
+    if not cache.add(lock_key, 1, timeout=SESSION_LOCK_TIMEOUT):
+        return None
+    try:
+        # Session could be cached by the previous lock owner
+        session = cache.get(key)
+        if session is None:
+            session = _retrieve_session(session_id)
+            cache.set(key, session, settings.STRIPE_SESSION_STATUS_TTL)
+    finally:
+        cache.delete(lock_key)
+    return session
+
+
+def sync_payment(payment: Payment) -> Payment:
+    """
+    Apply status of open payment checkout session before its webhook event
+    is delivered. Not open payments are returned without Stripe calls
+    """
+    if payment.status != "open" or not payment.session_id:
+        return payment
+
+    session = get_session(payment.session_id)
+    if not session or session["status"] not in SESSION_STATUS_EVENTS:
+        return payment
+
+    event = {
+        "type": SESSION_STATUS_EVENTS[session["status"]],
+        "data": {"object": session},
+    }
+    if handle_event(event):
+        payment.refresh_from_db(fields=["status"])
+    return payment
@@ -1,14 +1,36 @@
+import base64
+import datetime
+import gzip
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APIClient
-
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from Library_service import versions
+from book import autocomplete
+from book import cache as book_cache
+from book.filters import filter_books
+from book.importer import import_books
 from book.models import Book
 from book.serializers import BookSerializer
+from book.views import BookViewSet
+from borrow.models import Borrow
 
 BOOK_URL = reverse("book:book-list")
 PAGINATION_SIZE = 10
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
 
 
 def sample_book(**params) -> Book:
@@ -33,7 +55,7 @@ class UnauthenticatedBookApiTests(TestCase):
 
     def test_list_book(self) -> None:
         sample_book()
-        books = Book.objects.all()[:10]
+        books = Book.objects.with_availability()[:10]
 
         response = self.client.get(BOOK_URL)
         serializer = BookSerializer(books, many=True)
@@ -43,7 +65,7 @@ class UnauthenticatedBookApiTests(TestCase):
     def test_list_book_is_paginated(self) -> None:
         for i in range(25):
             sample_book(title=f"Test{i}")
-        books = Book.objects.all()
+        books = Book.objects.with_availability()
 
         response = self.client.get(BOOK_URL)
         serializer = BookSerializer(books[:PAGINATION_SIZE], many=True)
@@ -64,7 +86,9 @@ class UnauthenticatedBookApiTests(TestCase):
         book = sample_book()
 
         response = self.client.get(detail_book_url(book.id))
-        serializer = BookSerializer(book)
+        serializer = BookSerializer(
+            Book.objects.with_availability().get(id=book.id)
+        )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, serializer.data)
@@ -182,7 +206,7 @@ class AdminBookApiTests(TestCase):
 
     def test_list_book(self) -> None:
         sample_book()
-        books = Book.objects.all()[:10]
+        books = Book.objects.with_availability()[:10]
 
         response = self.client.get(BOOK_URL)
         serializer = BookSerializer(books, many=True)
@@ -193,7 +217,9 @@ class AdminBookApiTests(TestCase):
         book = sample_book()
 
         response = self.client.get(detail_book_url(book.id))
-        serializer = BookSerializer(book)
+        serializer = BookSerializer(
+            Book.objects.with_availability().get(id=book.id)
+        )
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, serializer.data)
@@ -242,3 +268,851 @@ class AdminBookApiTests(TestCase):
         response = self.client.delete(detail_book_url(book.id))
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class SearchBookApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.hobbit = sample_book(
+            title="The Hobbit", author="J. R. R. Tolkien"
+        )
+        self.silmarillion = sample_book(
+            title="The Silmarillion", author="J. R. R. Tolkien"
+        )
+        self.dune = sample_book(title="Dune", author="Frank Herbert")
+
+    def test_search_by_title(self) -> None:
+        response = self.client.get(BOOK_URL, {"search": "hobbit"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [self.hobbit.id],
+        )
+
+    def test_search_by_author_prefix(self) -> None:
+        response = self.client.get(BOOK_URL, {"search": "tolk"})
+
+        self.assertEqual(
+            {book["id"] for book in response.data["results"]},
+            {self.hobbit.id, self.silmarillion.id},
+        )
+
+    def test_search_ranks_title_match_higher_than_author_match(self) -> None:
+        herbert = sample_book(title="Herbert", author="Unknown")
+
+        response = self.client.get(BOOK_URL, {"search": "herbert"})
+
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [herbert.id, self.dune.id],
+        )
+
+    def test_search_index_follows_book_changes(self) -> None:
+        self.dune.title = "Children of Dune"
+        self.dune.save()
+        self.hobbit.delete()
+
+        response_children = self.client.get(BOOK_URL, {"search": "children"})
+        response_hobbit = self.client.get(BOOK_URL, {"search": "hobbit"})
+
+        self.assertEqual(
+            [book["id"] for book in response_children.data["results"]],
+            [self.dune.id],
+        )
+        self.assertEqual(response_hobbit.data["results"], [])
+
+    def test_search_with_cursor_pagination(self) -> None:
+        for i in range(15):
+            sample_book(title=f"Tolkien reader {i}", author="Unknown")
+
+        response = self.client.get(BOOK_URL, {"search": "tolk", "cursor": ""})
+        results = response.data["results"]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results += response.data["results"]
+
+        ids = [book["id"] for book in results]
+        self.assertEqual(len(ids), 17)
+        self.assertEqual(len(set(ids)), 17)
+
+
+class KeysetPaginationBookApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        for i in range(25):
+            sample_book(title=f"Test{i % 5}", author=f"Author{i}")
+
+    def test_cursor_pages_return_all_books_in_order_once(self) -> None:
+        books = BookSerializer(
+            Book.objects.with_availability().order_by("title", "id"),
+            many=True,
+        )
+
+        response = self.client.get(BOOK_URL, {"cursor": ""})
+        results = response.data["results"]
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["previous"])
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            results += response.data["results"]
+
+        self.assertEqual(results, books.data)
+
+    def test_cursor_previous_link_return_previous_page(self) -> None:
+        first_page = self.client.get(BOOK_URL, {"cursor": ""})
+        second_page = self.client.get(first_page.data["next"])
+
+        response = self.client.get(second_page.data["previous"])
+
+        self.assertEqual(response.data["results"], first_page.data["results"])
+        self.assertEqual(response.data["next"], first_page.data["next"])
+
+    def test_cursor_page_is_stable_when_books_added_before_it(self) -> None:
+        first_page = self.client.get(BOOK_URL, {"cursor": ""})
+        last_book_id = first_page.data["results"][-1]["id"]
+        sample_book(title="A new book")
+
+        response = self.client.get(first_page.data["next"])
+
+        self.assertNotIn(
+            last_book_id, [book["id"] for book in response.data["results"]]
+        )
+        self.assertEqual(len(response.data["results"]), PAGINATION_SIZE)
+
+    def test_invalid_cursor(self) -> None:
+        response = self.client.get(BOOK_URL, {"cursor": "invalid"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_values_of_other_type(self) -> None:
+        cursor = base64.urlsafe_b64encode(
+            json.dumps({"p": ["x", "abc"], "r": False}).encode()
+        ).decode()
+
+        response = self.client.get(BOOK_URL, {"cursor": cursor})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_of_expression_ordering_gives_offset_links(self) -> None:
+        response = self.client.get(
+            BOOK_URL, {"cursor": "", "ordering": "popular"}
+        )
+
+        self.assertIn("offset=", response.data["next"])
+        self.assertNotIn("cursor=", response.data["next"])
+
+
+class BookCacheApiTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.book = sample_book(inventory=3)
+
+    def test_list_book_is_served_from_cache(self) -> None:
+        response = self.client.get(BOOK_URL)
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(BOOK_URL)
+
+        self.assertEqual(cached_response.data, response.data)
+
+    def test_retrieve_book_is_served_from_cache(self) -> None:
+        response = self.client.get(detail_book_url(self.book.id))
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(detail_book_url(self.book.id))
+
+        self.assertEqual(cached_response.data, response.data)
+
+    def test_book_save_invalidate_list_and_detail(self) -> None:
+        self.client.get(BOOK_URL)
+        self.client.get(detail_book_url(self.book.id))
+        self.book.title = "New Title"
+        self.book.save()
+
+        list_response = self.client.get(BOOK_URL)
+        detail_response = self.client.get(detail_book_url(self.book.id))
+
+        self.assertEqual(
+            list_response.data["results"][0]["title"], "New Title"
+        )
+        self.assertEqual(detail_response.data["title"], "New Title")
+
+    def test_book_delete_invalidate_list(self) -> None:
+        self.client.get(BOOK_URL)
+        self.book.delete()
+
+        response = self.client.get(BOOK_URL)
+
+        self.assertEqual(response.data["results"], [])
+
+    def test_cache_stats_count_hits_and_misses(self) -> None:
+        admin = get_user_model().objects.create_user(
+            email="admin@test.com", password="test12345", is_staff=True
+        )
+        self.client.get(BOOK_URL)
+        self.client.get(BOOK_URL)
+        self.client.force_authenticate(admin)
+
+        response = self.client.get(reverse("book:book-cache-stats"))
+
+        self.assertEqual(response.data, {"hits": 1, "misses": 1})
+
+    def test_cache_stats_not_allowed_for_non_staff(self) -> None:
+        response = self.client.get(reverse("book:book-cache-stats"))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ConditionalGetBookApiTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.book = sample_book()
+
+    def test_list_book_return_validators(self) -> None:
+        response = self.client.get(BOOK_URL)
+
+        self.assertIn("ETag", response.headers)
+        self.assertIn("Last-Modified", response.headers)
+
+    def test_list_book_not_modified_without_queries(self) -> None:
+        etag = self.client.get(BOOK_URL).headers["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_retrieve_book_not_modified_by_last_modified(self) -> None:
+        url = detail_book_url(self.book.id)
+        last_modified = self.client.get(url).headers["Last-Modified"]
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_retrieve_missing_book_with_any_etag(self) -> None:
+        response = self.client.get(
+            detail_book_url(99999), HTTP_IF_NONE_MATCH="*"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieve_existing_book_with_any_etag(self) -> None:
+        response = self.client.get(
+            detail_book_url(self.book.id), HTTP_IF_NONE_MATCH="*"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_book_change_make_etag_invalid(self) -> None:
+        etag = self.client.get(BOOK_URL).headers["ETag"]
+        self.book.inventory = 5
+        self.book.save()
+
+        response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_etag_of_changed_book_invalid_after_cache_flush(self) -> None:
+        etag = self.client.get(BOOK_URL).headers["ETag"]
+        self.book.inventory = 5
+        self.book.save()
+        cache.clear()
+
+        response = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_depends_on_query_params(self) -> None:
+        etag = self.client.get(BOOK_URL).headers["ETag"]
+
+        response = self.client.get(
+            BOOK_URL, {"limit": 1}, HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ImportBookApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="admin@test.com", password="test12345", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+        self.url = reverse("book:book-import-books")
+
+    def _upload(self, name: str, content: str, **params):
+        return self.client.post(
+            self.url,
+            {"file": SimpleUploadedFile(name, content.encode()), **params},
+            format="multipart",
+        )
+
+    def test_import_csv_create_and_update_books(self) -> None:
+        book = sample_book(inventory=1, daily_fee=1)
+        content = (
+            "title,author,cover,inventory,daily_fee\n"
+            f"{book.title},{book.author},{book.cover},7,2.50\n"
+            "New Book,New Author,Soft,3,0.99\n"
+        )
+
+        response = self._upload("books.csv", content)
+        book.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["imported"], 2)
+        self.assertEqual(book.inventory, 7)
+        self.assertEqual(str(book.daily_fee), "2.50")
+        self.assertTrue(Book.objects.filter(title="New Book").exists())
+
+    def test_import_jsonl_report_invalid_rows(self) -> None:
+        content = (
+            '{"title": "Book", "author": "Author", "cover": "Hard", '
+            '"daily_fee": "1.00"}\n'
+            '{"title": "Book 2", "author": "Author", "cover": "Paper", '
+            '"daily_fee": "1.00"}\n'
+            "not json\n"
+        )
+
+        response = self._upload("books.jsonl", content)
+
+        self.assertEqual(response.data["processed"], 3)
+        self.assertEqual(response.data["imported"], 1)
+        self.assertEqual(response.data["failed"], 2)
+        self.assertEqual(
+            [error["line"] for error in response.data["errors"]], [2, 3]
+        )
+        self.assertIn("cover", response.data["errors"][0]["errors"])
+        self.assertEqual(Book.objects.get(title="Book").inventory, 1)
+
+    def test_import_stops_at_not_utf8_bytes(self) -> None:
+        rows = "".join(f"Book {i},Author,Hard,1,1.00\n" for i in range(400))
+        version = versions.get_version(book_cache.CATALOG_SCOPE)
+
+        response = self.client.post(
+            self.url,
+            {
+                "file": SimpleUploadedFile(
+                    "books.csv",
+                    b"title,author,cover,inventory,daily_fee\n"
+                    + rows.encode()
+                    + "Книга,Author,Hard,1,1.00\n".encode("cp1251"),
+                )
+            },
+            format="multipart",
+        )
+
+        imported = response.data["imported"]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(imported, 0)
+        self.assertEqual(response.data["processed"], imported)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertEqual(response.data["errors"][0]["line"], imported + 2)
+        self.assertEqual(Book.objects.count(), imported)
+        self.assertGreater(
+            versions.get_version(book_cache.CATALOG_SCOPE), version
+        )
+
+    def test_import_unknown_file_format(self) -> None:
+        response = self._upload("books.txt", "title\n")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_not_allowed_for_non_staff(self) -> None:
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                email="test@test.com", password="test12345"
+            )
+        )
+
+        response = self._upload("books.csv", "title\n")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_import_books_command(self) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(
+                "title,author,cover,inventory,daily_fee\n"
+                "Book,Author,Hard,2,1.00\n"
+                "Book,Author,Hard,4,1.00\n"
+            )
+            file.flush()
+            out = StringIO()
+
+            call_command("import_books", file.name, stdout=out)
+
+        self.assertEqual(Book.objects.get(title="Book").inventory, 4)
+        self.assertIn("Imported 1 books", out.getvalue())
+
+
+class ExportBookApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.url = reverse("book:book-export-books")
+        self.books = [sample_book(title=f"Test{i}") for i in range(3)]
+
+    def test_export_csv(self) -> None:
+        response = self.client.get(self.url)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Content-Type"], CSV_CONTENT_TYPE)
+        self.assertEqual(lines[0], "id,title,author,cover,inventory,daily_fee")
+        self.assertEqual(
+            lines[1],
+            f"{self.books[0].id},Test0,Test Author,Hard,25,1.45",
+        )
+        self.assertEqual(len(lines), 4)
+
+    def test_export_ndjson(self) -> None:
+        response = self.client.get(self.url, {"file_format": "ndjson"})
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+
+        self.assertEqual(
+            rows[0],
+            {
+                "id": self.books[0].id,
+                "title": "Test0",
+                "author": "Test Author",
+                "cover": "Hard",
+                "inventory": 25,
+                "daily_fee": "1.45",
+            },
+        )
+        self.assertEqual(len(rows), 3)
+
+    def test_export_gzip(self) -> None:
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        content = gzip.decompress(b"".join(response.streaming_content))
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(content.decode().splitlines()), 4)
+
+    def test_export_unknown_format(self) -> None:
+        response = self.client.get(self.url, {"file_format": "xml"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_books_command(self) -> None:
+        out = StringIO()
+
+        call_command("export_books", "--file-format", "ndjson", stdout=out)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+class BookAvailabilityApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "reader@test.com", "testpass"
+        )
+        cache.clear()
+
+    def _borrow(self, book: Book, days: int, returned: bool = False):
+        today = datetime.date.today()
+        return Borrow.objects.create(
+            book=book,
+            user=self.user,
+            expected_return_date=today + datetime.timedelta(days=days),
+            actual_return_date=(
+                today + datetime.timedelta(days=1) if returned else None
+            ),
+        )
+
+    def test_list_book_show_active_borrows_and_next_return_date(self):
+        book = sample_book()
+        self._borrow(book, days=10)
+        nearest = self._borrow(book, days=3)
+        self._borrow(book, days=1, returned=True)
+        sample_book(title="Not borrowed")
+
+        response = self.client.get(BOOK_URL)
+        results = {row["title"]: row for row in response.data["results"]}
+
+        self.assertEqual(results["Test Book"]["active_borrows"], 2)
+        self.assertEqual(
+            results["Test Book"]["next_return_date"],
+            str(nearest.expected_return_date),
+        )
+        self.assertEqual(results["Not borrowed"]["active_borrows"], 0)
+        self.assertIsNone(results["Not borrowed"]["next_return_date"])
+
+    def test_retrieve_book_show_active_borrows(self) -> None:
+        book = sample_book()
+        self._borrow(book, days=5)
+
+        response = self.client.get(detail_book_url(book.id))
+
+        self.assertEqual(response.data["active_borrows"], 1)
+
+    def test_list_book_is_one_query_per_page(self) -> None:
+        for i in range(PAGINATION_SIZE):
+            book = sample_book(title=f"Test{i}")
+            self._borrow(book, days=i + 2)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(BOOK_URL)
+
+        self.assertEqual(len(response.data["results"]), PAGINATION_SIZE)
+
+    def test_availability_is_counted_only_for_page_rows(self) -> None:
+        self._borrow(sample_book(), days=3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(BOOK_URL)
+        count_sql, page_sql = (query["sql"] for query in queries)
+
+        self.assertIn("COUNT(*)", count_sql)
+        self.assertNotIn("borrow_borrow", count_sql)
+        # Borrows are read by subqueries of page rows, books are not grouped
+        self.assertNotIn('GROUP BY "book_book"', page_sql)
+        self.assertNotIn("LEFT OUTER JOIN", page_sql)
+
+
+class SparseFieldsetsBookApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        cache.clear()
+        self.book = sample_book()
+
+    def test_list_book_with_fields(self) -> None:
+        response = self.client.get(BOOK_URL, {"fields": "id,title"})
+
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.book.id, "title": self.book.title}],
+        )
+
+    def test_retrieve_book_with_omit(self) -> None:
+        response = self.client.get(
+            detail_book_url(self.book.id), {"omit": "daily_fee,inventory"}
+        )
+
+        self.assertNotIn("daily_fee", response.data)
+        self.assertNotIn("inventory", response.data)
+        self.assertIn("title", response.data)
+
+    def test_omitted_availability_is_not_counted(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(
+                BOOK_URL, {"omit": "active_borrows,next_return_date"}
+            )
+
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("borrow_borrow", sql)
+
+
+AUTOCOMPLETE_URL = reverse("book:book-autocomplete")
+
+
+@override_settings(
+    AUTOCOMPLETE_CHECK_INTERVAL=0, AUTOCOMPLETE_REBUILD_IN_BACKGROUND=False
+)
+class AutocompleteBookApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        cache.clear()
+        self.hobbit = sample_book(
+            title="The Hobbit", author="J. R. R. Tolkien"
+        )
+        self.rings = sample_book(
+            title="The Lord of the Rings", author="J. R. R. Tolkien"
+        )
+        self.tolstoy = sample_book(title="War and Peace", author="Leo Tolstoy")
+
+    def _ids(self, **params) -> list[int]:
+        response = self.client.get(AUTOCOMPLETE_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [suggestion["id"] for suggestion in response.data]
+
+    def test_autocomplete_by_title_prefix(self) -> None:
+        response = self.client.get(AUTOCOMPLETE_URL, {"q": "hob"})
+
+        self.assertEqual(
+            response.data,
+            [{"id": self.hobbit.id, "label": "The Hobbit (J. R. R. Tolkien)"}],
+        )
+
+    def test_autocomplete_by_any_word_prefix(self) -> None:
+        self.assertEqual(self._ids(q="RIN"), [self.rings.id])
+        self.assertEqual(self._ids(q="lord of"), [self.rings.id])
+
+    def test_autocomplete_title_matches_go_before_author_matches(self):
+        war = sample_book(title="Tolstoy letters", author="Unknown")
+
+        self.assertEqual(
+            self._ids(q="tol"),
+            [war.id, self.hobbit.id, self.rings.id, self.tolstoy.id],
+        )
+
+    def test_autocomplete_limit(self) -> None:
+        self.assertEqual(len(self._ids(q="t", limit=2)), 2)
+        self.assertEqual(self._ids(q=""), [])
+
+    def test_autocomplete_index_follows_book_changes(self) -> None:
+        self._ids(q="war")
+        self.tolstoy.title = "Anna Karenina"
+        self.tolstoy.save()
+
+        self.assertEqual(self._ids(q="war"), [])
+        self.assertEqual(self._ids(q="anna"), [self.tolstoy.id])
+
+    def test_autocomplete_does_not_query_database_when_index_is_fresh(
+        self,
+    ) -> None:
+        self._ids(q="war")
+
+        with self.assertNumQueries(0):
+            self._ids(q="peace")
+
+    def test_book_save_without_names_change_keeps_index(self) -> None:
+        version = versions.get_version(book_cache.NAMES_SCOPE)
+        self.tolstoy.inventory = 0
+        self.tolstoy.save()
+        book = Book.objects.get(id=self.hobbit.id)
+        book.daily_fee = 5
+        book.save()
+
+        self.assertEqual(versions.get_version(book_cache.NAMES_SCOPE), version)
+
+    def test_import_of_existing_books_keeps_index(self) -> None:
+        version = versions.get_version(book_cache.NAMES_SCOPE)
+        import_books(
+            StringIO(
+                "title,author,cover,inventory,daily_fee\n"
+                f"The Hobbit,J. R. R. Tolkien,{self.hobbit.cover},3,1.00\n"
+            ),
+            "csv",
+        )
+        self.assertEqual(versions.get_version(book_cache.NAMES_SCOPE), version)
+
+        import_books(
+            StringIO(
+                "title,author,cover,inventory,daily_fee\n"
+                "New,Author,Hard,1,1.00\n"
+            ),
+            "csv",
+        )
+        self.assertGreater(
+            versions.get_version(book_cache.NAMES_SCOPE), version
+        )
+
+    def test_changed_index_is_rebuilt_in_background(self) -> None:
+        self._ids(q="war")
+        self.tolstoy.title = "Anna Karenina"
+        self.tolstoy.save()
+
+        with self.settings(
+            AUTOCOMPLETE_REBUILD_IN_BACKGROUND=True
+        ), mock.patch("book.autocomplete.threading.Thread") as thread:
+            self.assertEqual(self._ids(q="war"), [self.tolstoy.id])
+        thread.assert_called_once_with(
+            target=autocomplete._rebuild_index, daemon=True
+        )
+        thread.return_value.start.assert_called_once()
+
+        # Run the rebuild of the mocked thread without closing connection
+        autocomplete._build_index()
+        autocomplete._lock.release()
+        self.assertEqual(self._ids(q="anna"), [self.tolstoy.id])
+
+
+class BookReservationTests(TestCase):
+    def test_reserve_take_one_copy(self) -> None:
+        book = sample_book(inventory=2)
+
+        reserved = Book.objects.reserve(book.id)
+        book.refresh_from_db()
+
+        self.assertTrue(reserved)
+        self.assertEqual(book.inventory, 1)
+
+    def test_reserve_never_make_inventory_negative(self) -> None:
+        book = sample_book(inventory=1)
+
+        results = [Book.objects.reserve(book.id) for _ in range(3)]
+        book.refresh_from_db()
+
+        self.assertEqual(results, [True, False, False])
+        self.assertEqual(book.inventory, 0)
+
+    def test_reserve_is_single_query(self) -> None:
+        book = sample_book(inventory=1)
+
+        with self.assertNumQueries(1):
+            Book.objects.reserve(book.id)
+
+    def test_release_return_one_copy(self) -> None:
+        book = sample_book(inventory=0)
+
+        Book.objects.release(book.id)
+        book.refresh_from_db()
+
+        self.assertEqual(book.inventory, 1)
+
+
+class FilterBookApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        cache.clear()
+        sample_book(title="Hobbit", author="Tolkien", daily_fee=0.5)
+        sample_book(
+            title="Silmarillion",
+            author="Tolkien",
+            cover=Book.CoverChoices.SOFT,
+            inventory=0,
+            daily_fee=1.5,
+        )
+        sample_book(title="1984", author="Orwell", daily_fee=3)
+
+    def _titles(self, **params) -> list[str]:
+        response = self.client.get(BOOK_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book["title"] for book in response.data["results"]]
+
+    def test_filter_by_authors(self) -> None:
+        self.assertEqual(
+            self._titles(author="Tolkien"), ["Hobbit", "Silmarillion"]
+        )
+        self.assertEqual(
+            self._titles(author="Orwell,Tolkien"),
+            ["1984", "Hobbit", "Silmarillion"],
+        )
+
+    def test_filter_by_cover(self) -> None:
+        self.assertEqual(self._titles(cover="Soft"), ["Silmarillion"])
+
+    def test_filter_by_availability(self) -> None:
+        self.assertEqual(self._titles(available=1), ["1984", "Hobbit"])
+        self.assertEqual(self._titles(available=0), ["Silmarillion"])
+
+    def test_filter_by_daily_fee_range(self) -> None:
+        self.assertEqual(
+            self._titles(min_fee=1, max_fee=3), ["1984", "Silmarillion"]
+        )
+
+    def test_filters_are_combined(self) -> None:
+        self.assertEqual(
+            self._titles(author="Tolkien", available=1, max_fee=1),
+            ["Hobbit"],
+        )
+
+    def test_invalid_filters(self) -> None:
+        for params in ({"cover": "Paper"}, {"available": "yes"}):
+            response = self.client.get(BOOK_URL, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BOOK_URL, {"min_fee": "cheap"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facets_count_filtered_books(self) -> None:
+        response = self.client.get(
+            BOOK_URL, {"facets": 1, "author": "Tolkien"}
+        )
+        facets = response.data["facets"]
+
+        self.assertEqual(facets["author"], [{"value": "Tolkien", "count": 2}])
+        self.assertEqual(
+            facets["cover"],
+            [{"value": "Hard", "count": 1}, {"value": "Soft", "count": 1}],
+        )
+        self.assertEqual(
+            facets["available"],
+            [{"value": 1, "count": 1}, {"value": 0, "count": 1}],
+        )
+        self.assertEqual(
+            [fee["count"] for fee in facets["daily_fee"]], [1, 1, 0, 0]
+        )
+
+    def test_facets_are_not_returned_by_default(self) -> None:
+        response = self.client.get(BOOK_URL)
+
+        self.assertNotIn("facets", response.data)
+
+
+class FilterBookQueryPlanTests(TestCase):
+    """
+    Count & page queries of filtered big catalog list are served by
+    indexes, not by table scans
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        Book.objects.bulk_create(
+            Book(
+                title=f"Book {i}",
+                author=f"Author {i % 500}",
+                cover=Book.CoverChoices.values[i % 2],
+                inventory=int(i % 50 == 0),
+                daily_fee=i % 1000 / 100,
+            )
+            for i in range(5000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def _plan(self, **params) -> str:
+        """
+        Explain count and page queries which list action runs for
+        queryset of the view
+        """
+        view = BookViewSet(
+            action="list",
+            request=Request(
+                APIRequestFactory().get(
+                    BOOK_URL, {key: str(v) for key, v in params.items()}
+                )
+            ),
+            format_kwarg=None,
+            kwargs={},
+        )
+        with CaptureQueriesContext(connection) as queries:
+            view.paginator.paginate_queryset(
+                view.get_queryset(), view.request, view=view
+            )
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append(
+                    "\n".join(str(row[-1]) for row in cursor.fetchall())
+                )
+        self.assertEqual(len(plans), 2)
+        return "\n".join(plans)
+
+    def assertUsesIndex(self, plan: str, index_name: str) -> None:
+        self.assertIn(index_name, plan)
+        self.assertNotIn("Seq Scan", plan)
+        self.assertNotRegex(plan, r"SCAN book_book(?! USING)")
+
+    def test_author_filter_use_index(self) -> None:
+        self.assertUsesIndex(
+            self._plan(author="Author 7"), "book_author_title_idx"
+        )
+
+    def test_cover_filter_use_index(self) -> None:
+        self.assertUsesIndex(self._plan(cover="Soft"), "book_cover_title_idx")
+
+    def test_available_filter_use_index(self) -> None:
+        self.assertUsesIndex(
+            self._plan(available=1), "book_available_title_idx"
+        )
+
+    def test_daily_fee_filter_use_index(self) -> None:
+        self.assertUsesIndex(
+            self._plan(min_fee=9.9, max_fee=9.95), "book_daily_fee_idx"
+        )
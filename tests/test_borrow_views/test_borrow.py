@@ -2,20 +2,27 @@ from datetime import timedelta
 from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from Library_service import versions
+from book.models import Book
 from borrow.models import Borrow, Payment
 from borrow.serializers import (
     BorrowListSerializer,
     BorrowDetailSerializer,
     BorrowCreateSerializer,
 )
+from borrow.tasks import send_telegram_outbox
 from tests.test_book_views import sample_book
-from user.models import TelegramChat
+from user.models import TelegramChat, TelegramOutbox
 
 BORROW_URL = reverse("borrow:borrow-list")
 PAGINATION_SIZE = 10
@@ -105,6 +112,46 @@ class AuthenticatedBorrowTests(TestCase):
             )
             next_borrows = next_borrows[PAGINATION_SIZE:]
 
+    def test_list_borrow_cursor_pagination(self) -> None:
+        for i in range(25):
+            book = sample_book(title=f"Test{i}")
+            sample_borrow(
+                user=self.user,
+                book=book,
+                borrow_date=timezone.now().date() - timedelta(days=i % 3),
+            )
+        borrows = Borrow.objects.filter(user=self.user)
+
+        response = self.client.get(BORROW_URL, {"cursor": ""})
+        results = response.data["results"]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            results += response.data["results"]
+
+        self.assertEqual(
+            results, BorrowListSerializer(borrows, many=True).data
+        )
+
+    def test_list_borrow_not_modified_if_etag_match(self) -> None:
+        cache.clear()
+        sample_borrow(user=self.user, book=sample_book())
+        etag = self.client.get(BORROW_URL).headers["ETag"]
+
+        response = self.client.get(BORROW_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_borrow_etag_changes_after_own_borrow_changed(self) -> None:
+        cache.clear()
+        borrow = sample_borrow(user=self.user, book=sample_book())
+        etag = self.client.get(BORROW_URL).headers["ETag"]
+        borrow.expected_return_date += timedelta(days=1)
+        borrow.save()
+
+        response = self.client.get(BORROW_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_detail_borrow(self) -> None:
         borrow = sample_borrow(user=self.user, book=sample_book())
 
@@ -248,6 +295,45 @@ class AuthenticatedBorrowTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(borrow.book.inventory, book_inventory - 1)
 
+    @mock.patch("user.management.commands.t_bot.send_msg")
+    @mock.patch("borrow.utils.start_checkout_session")
+    def test_create_borrow_invalidate_cached_book_inventory(
+        self, start_checkout_session_mock, send_msg_mock
+    ):
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        book = sample_book(inventory=3)
+        book_url = reverse("book:book-detail", args=[book.id])
+        self.client.get(book_url)
+        payload = {
+            "book": book.id,
+            "expected_return_date": timezone.now().date() + timedelta(days=10),
+        }
+
+        self.client.post(BORROW_URL, data=payload)
+        response = self.client.get(book_url)
+
+        self.assertEqual(response.data["inventory"], 2)
+
+    @mock.patch("user.management.commands.t_bot.send_msg")
+    @mock.patch("borrow.utils.start_checkout_session")
+    def test_can_not_create_borrow_if_book_inventory_is_empty(
+        self, start_checkout_session_mock, send_msg_mock
+    ):
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        book = sample_book(inventory=0)
+        payload = {
+            "book": book.id,
+            "expected_return_date": timezone.now().date() + timedelta(days=10),
+        }
+
+        response = self.client.post(BORROW_URL, data=payload)
+        book.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(book.inventory, 0)
+        self.assertFalse(Payment.objects.exists())
+        start_checkout_session_mock.assert_not_called()
+
     @mock.patch("user.management.commands.t_bot.send_msg")
     @mock.patch("borrow.utils.start_checkout_session")
     def test_create_payment_and_payment_session_when_borrow_created(
@@ -261,7 +347,10 @@ class AuthenticatedBorrowTests(TestCase):
             "expected_return_date": timezone.now().date() + timedelta(days=10),
         }
 
-        response = self.client.post(BORROW_URL, data=payload)
+        # Stripe is called after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(BORROW_URL, data=payload)
+            start_checkout_session_mock.assert_not_called()
         payment = Payment.objects.get(id=response.data["payments"][0])
 
         start_checkout_session_mock.assert_called_once()
@@ -274,12 +363,13 @@ class AuthenticatedBorrowTests(TestCase):
             start_checkout_session_mock.return_value["url"],
         )
 
-    @mock.patch("user.management.commands.t_bot.send_msg")
+    @mock.patch("user.management.commands.t_bot.send_msgs")
     @mock.patch("borrow.utils.start_checkout_session")
     def test_send_message_via_telegram_when_borrow_created(
-        self, start_checkout_session_mock, send_msg_mock
+        self, start_checkout_session_mock, send_msgs_mock
     ):
         start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        send_msgs_mock.return_value = [None]
         book = sample_book()
         payload = {
             "book": book.id,
@@ -295,8 +385,10 @@ class AuthenticatedBorrowTests(TestCase):
             f"{payload['expected_return_date']}."
         )
 
-        send_msg_mock.assert_called_once_with(
-            text=text, chat_user_id=telegram_chat.chat_user_id
+        send_msgs_mock.assert_not_called()
+        send_telegram_outbox()
+        send_msgs_mock.assert_called_once_with(
+            [(text, telegram_chat.chat_user_id)]
         )
 
     @mock.patch("user.management.commands.t_bot.send_msg")
@@ -319,6 +411,56 @@ class AuthenticatedBorrowTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class ConditionalGetBorrowTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_other_user_borrow_does_not_change_etag(self) -> None:
+        book = sample_book()
+        other_user = get_user_model().objects.create_user(
+            "test2@library.com", "test12345"
+        )
+        sample_borrow(user=self.user, book=book)
+        etag = self.client.get(BORROW_URL).headers["ETag"]
+        sample_borrow(user=other_user, book=book)
+
+        response = self.client.get(BORROW_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_return_borrow_changes_borrow_version(self) -> None:
+        borrow = sample_borrow(
+            user=self.user,
+            book=sample_book(),
+            borrow_date=timezone.now().date() - timedelta(days=2),
+        )
+        scope = f"borrow:user:{self.user.id}"
+        version = versions.get_version(scope)
+
+        self.client.post(
+            reverse("borrow:borrow-book-return", args=[borrow.id])
+        )
+
+        self.assertGreater(versions.get_version(scope), version)
+
+    def test_etag_is_not_shared_between_users(self) -> None:
+        etag = self.client.get(BORROW_URL).headers["ETag"]
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                "test2@library.com", "test12345"
+            )
+        )
+
+        response = self.client.get(BORROW_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
 class AdminBorrowTests(AuthenticatedBorrowTests):
     def setUp(self) -> None:
         self.client = APIClient()
@@ -345,3 +487,296 @@ class AdminBorrowTests(AuthenticatedBorrowTests):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["results"], serializer.data)
+
+
+class SparseFieldsetsBorrowTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+        cache.clear()
+        self.borrow = sample_borrow(user=self.user, book=sample_book())
+        self.borrow.payments.add(sample_payment(user=self.user))
+
+    def test_fields_keep_only_given_fields_with_nested_paths(self) -> None:
+        response = self.client.get(
+            BORROW_URL, {"fields": "id,book.title,book.author"}
+        )
+
+        self.assertEqual(
+            response.data["results"],
+            [
+                {
+                    "id": self.borrow.id,
+                    "book": {"title": "Test Book", "author": "Test Author"},
+                }
+            ],
+        )
+
+    def test_omit_drop_given_fields(self) -> None:
+        response = self.client.get(
+            detail_borrow_url(self.borrow.id),
+            {"omit": "payments,user.email,book"},
+        )
+
+        self.assertNotIn("payments", response.data)
+        self.assertNotIn("book", response.data)
+        self.assertNotIn("email", response.data["user"])
+        self.assertIn("first_name", response.data["user"])
+
+    def test_omitted_relations_are_not_fetched(self) -> None:
+        for i in range(3):
+            borrow = sample_borrow(
+                user=self.user, book=sample_book(title=f"Book {i}")
+            )
+            borrow.payments.add(sample_payment(user=self.user))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(BORROW_URL, {"fields": "id,borrow_date"})
+
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("book_book", sql)
+        self.assertNotIn("borrow_payment", sql)
+
+    @mock.patch("user.management.commands.t_bot.send_msg")
+    @mock.patch("borrow.utils.start_checkout_session")
+    def test_fields_are_ignored_for_create(
+        self, start_checkout_session_mock, send_msg_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        Payment.objects.update(status="paid")
+        payload = {
+            "book": sample_book(title="Another").id,
+            "expected_return_date": timezone.now().date() + timedelta(days=10),
+        }
+
+        response = self.client.post(f"{BORROW_URL}?fields=id", payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("book", response.data)
+
+
+class BorrowQueryPlanTests(TestCase):
+    """Hot borrow & payment queries are served by their indexes"""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"reader{i}@library.com")
+            for i in range(100)
+        )
+        book = sample_book()
+        today = timezone.now().date()
+        borrows = Borrow.objects.bulk_create(
+            Borrow(
+                book=book,
+                user=users[i % 100],
+                borrow_date=today - timedelta(days=30),
+                expected_return_date=today + timedelta(days=i % 30),
+                actual_return_date=None if i % 20 == 0 else today,
+            )
+            for i in range(5000)
+        )
+        Payment.objects.bulk_create(
+            Payment(
+                user_id=borrow.user_id,
+                borrow=borrow,
+                status="open" if i % 5 == 0 else "paid",
+            )
+            for i, borrow in enumerate(borrows)
+        )
+        cls.user = users[0]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index_name: str) -> None:
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn("Seq Scan", plan)
+        self.assertNotRegex(plan, r"SCAN borrow_\w+\b(?! USING)")
+
+    def test_user_borrows_use_index(self) -> None:
+        self.assertUsesIndex(
+            Borrow.objects.filter(user=self.user)[:10],
+            "borrow_user_date_idx",
+        )
+
+    def test_user_active_borrows_use_partial_index(self) -> None:
+        self.assertUsesIndex(
+            Borrow.objects.filter(
+                user=self.user, actual_return_date__isnull=True
+            )[:10],
+            "borrow_active_user_date_idx",
+        )
+
+    def test_overdue_borrows_use_partial_index(self) -> None:
+        self.assertUsesIndex(
+            Borrow.objects.filter(
+                expected_return_date__lte=timezone.now().date(),
+                actual_return_date=None,
+            ),
+            "borrow_active_expected_idx",
+        )
+
+    def test_user_open_payments_use_partial_index(self) -> None:
+        self.assertUsesIndex(
+            Payment.objects.filter(user=self.user, status="open"),
+            "payment_open_user_idx",
+        )
+
+    def test_open_payments_use_partial_index(self) -> None:
+        self.assertUsesIndex(
+            Payment.objects.filter(status="open"),
+            "payment_open_created_at_idx",
+        )
+
+
+class BorrowConstraintsTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+        self.today = timezone.now().date()
+
+    @mock.patch("user.management.commands.t_bot.send_msg")
+    @mock.patch("borrow.utils.start_checkout_session")
+    def test_create_borrow_queries(
+        self, start_checkout_session_mock, send_msg_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        book = sample_book()
+        payload = {
+            "book": book.id,
+            "expected_return_date": self.today + timedelta(days=10),
+        }
+
+        # open payments, book, savepoint, borrow, payment, telegram
+        # outbox, reserve, release and payments of borrow. Checkout session
+        # is saved after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(9):
+                response = self.client.post(BORROW_URL, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            Payment.objects.get(borrow_id=response.data["id"]).session_id,
+            CHECKOUT_SESSION_DATA["id"],
+        )
+
+    @mock.patch("borrow.utils.start_checkout_session")
+    def test_book_is_reserved_last_and_stripe_called_after_commit(
+        self, start_checkout_session_mock
+    ) -> None:
+        book = sample_book()
+
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        payload = {
+            "book": book.id,
+            "expected_return_date": self.today + timedelta(days=10),
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(BORROW_URL, data=payload)
+            start_checkout_session_mock.assert_not_called()
+        writes = [
+            query["sql"]
+            for query in queries
+            if not query["sql"].startswith("SELECT")
+        ]
+
+        # Book row is locked from reservation until commit only
+        self.assertTrue(writes[-2].startswith('UPDATE "book_book"'))
+        self.assertTrue(writes[-1].startswith("RELEASE SAVEPOINT"))
+        start_checkout_session_mock.assert_called_once()
+
+    @mock.patch("user.management.commands.t_bot.send_msgs")
+    @mock.patch("borrow.utils.start_checkout_session")
+    def test_create_borrow_queue_telegram_message_for_all_chats(
+        self, start_checkout_session_mock, send_msgs_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        TelegramChat.objects.bulk_create(
+            TelegramChat(chat_user_id=chat_user_id)
+            for chat_user_id in range(100)
+        )
+        payload = {
+            "book": sample_book().id,
+            "expected_return_date": self.today + timedelta(days=10),
+        }
+
+        with self.assertNumQueries(9):
+            self.client.post(BORROW_URL, data=payload)
+
+        send_msgs_mock.assert_not_called()
+        self.assertEqual(TelegramOutbox.objects.count(), 1)
+
+    @mock.patch("borrow.utils.start_checkout_session")
+    def test_return_overdue_borrow_queries(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        borrow = sample_borrow(
+            user=self.user,
+            book=sample_book(),
+            borrow_date=self.today - timedelta(days=10),
+            expected_return_date=self.today - timedelta(days=2),
+        )
+
+        # borrow, its payments, savepoint, close, fine payment, release
+        # book and release. Checkout session is saved after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(7):
+                response = self.client.post(
+                    reverse("borrow:borrow-book-return", args=[borrow.id])
+                )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            Payment.objects.get(borrow=borrow).session_id,
+            CHECKOUT_SESSION_DATA["id"],
+        )
+
+    def test_create_borrow_with_expected_return_date_not_after_borrow_date(
+        self,
+    ) -> None:
+        payload = {
+            "book": sample_book().id,
+            "expected_return_date": self.today,
+        }
+
+        response = self.client.post(BORROW_URL, data=payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data["expected_return_date"][0],
+            "You should take expected return date later than borrow date: "
+            f"{self.today}",
+        )
+
+    def test_database_rejects_return_dates_not_after_borrow_date(
+        self,
+    ) -> None:
+        book = sample_book()
+        for dates in (
+            {"expected_return_date": self.today},
+            {
+                "expected_return_date": self.today + timedelta(days=1),
+                "actual_return_date": self.today,
+            },
+        ):
+            with self.subTest(**dates), self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    Borrow.objects.create(user=self.user, book=book, **dates)
+
+    def test_database_rejects_negative_book_inventory(self) -> None:
+        book = sample_book(inventory=0)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Book.objects.filter(pk=book.pk).update(
+                inventory=F("inventory") - 1
+            )
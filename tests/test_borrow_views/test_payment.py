@@ -1,24 +1,82 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
 from unittest import mock
 
+import stripe
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.response import Response
 from rest_framework.test import APIClient
 
+from borrow import webhooks
 from borrow.models import Payment
 from borrow.serializers import (
     PaymentListSerializer,
     PaymentDetailSerializer,
 )
+from borrow.tasks import (
+    create_payment_checkout_session,
+    expire_checkout_sessions,
+    send_telegram_outbox,
+)
 from tests.test_book_views import sample_book
-from tests.test_borrow_views.test_borrow import sample_borrow, sample_payment
-from user.models import TelegramChat
+from tests.test_borrow_views.test_borrow import (
+    BORROW_URL,
+    CHECKOUT_SESSION_DATA,
+    sample_borrow,
+    sample_payment,
+)
+from user.models import TelegramChat, TelegramOutbox
 
 PAYMENT_URL = reverse("borrow:payment-list")
+WEBHOOK_URL = reverse("borrow:payment-webhook")
+WEBHOOK_SECRET = "whsec_test"
 PAGINATION_SIZE = 10
 
 
+def send_webhook(
+    client: APIClient,
+    event_type: str,
+    payment: Payment,
+    payment_status: str = "paid",
+    secret: str = WEBHOOK_SECRET,
+):
+    """Post checkout session event signed like Stripe does"""
+    payload = json.dumps(
+        {
+            "id": "evt_test",
+            "object": "event",
+            "type": event_type,
+            "data": {
+                "object": {
+                    "id": payment.session_id,
+                    "object": "checkout.session",
+                    "payment_status": payment_status,
+                }
+            },
+        }
+    )
+    timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+    ).hexdigest()
+    return client.post(
+        WEBHOOK_URL,
+        payload,
+        content_type="application/json",
+        HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+    )
+
+
 def detail_payment_url(payment_id: int) -> str:
     return reverse("borrow:payment-detail", args=(payment_id,))
 
@@ -123,26 +181,29 @@ class AuthenticatedPaymentTests(TestCase):
             )
             next_payments = next_payments[PAGINATION_SIZE:]
 
-    @mock.patch("user.management.commands.t_bot.send_msg")
+    @mock.patch("user.management.commands.t_bot.send_msgs")
     @mock.patch("stripe.checkout.Session.retrieve")
     def test_is_success_action_set_status_success_and_send_msg_via_telegram(
-        self, session_mock, send_msg_mock
+        self, session_mock, send_msgs_mock
     ) -> None:
         borrow = sample_borrow(user=self.user, book=sample_book())
         payment = sample_payment(user=self.user, borrow=borrow)
-        session_mock.return_value.status = "complete"
+        send_msgs_mock.return_value = [None]
         telegram_chat = TelegramChat.objects.create(chat_user_id=11111111)
         text = f"For borrowing {borrow} payment was paid"
 
+        with override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET):
+            send_webhook(self.client, "checkout.session.completed", payment)
         response = self.client.get(
             reverse("borrow:payment-is-success", args=[payment.id])
         )
+        send_telegram_outbox()
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["status"], "success")
-        session_mock.assert_called_once_with(payment.session_id)
-        send_msg_mock.assert_called_once_with(
-            text=text, chat_user_id=telegram_chat.chat_user_id
+        session_mock.assert_not_called()
+        send_msgs_mock.assert_called_once_with(
+            [(text, telegram_chat.chat_user_id)]
         )
 
     def test_cancel_payment_return_message(self) -> None:
@@ -208,3 +269,567 @@ class AdminPaymentTests(AuthenticatedPaymentTests):
         serializer = PaymentListSerializer(payments, many=True)
 
         self.assertEqual(response.data["results"], serializer.data)
+
+
+def pay_url(payment_id: int) -> str:
+    return reverse("borrow:payment-pay", args=[payment_id])
+
+
+@mock.patch("borrow.utils.start_checkout_session")
+class CheckoutModeTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+        self.today = timezone.now().date()
+
+    def _create_borrow(self) -> Payment:
+        payload = {
+            "book": sample_book().id,
+            "expected_return_date": self.today + timedelta(days=10),
+        }
+        response = self.client.post(BORROW_URL, data=payload)
+        return Payment.objects.get(borrow_id=response.data["id"])
+
+    def _return_late_borrow(self) -> Payment:
+        borrow = sample_borrow(
+            user=self.user,
+            book=sample_book(title="Late"),
+            borrow_date=self.today - timedelta(days=10),
+            expected_return_date=self.today - timedelta(days=2),
+        )
+        self.client.post(
+            reverse("borrow:borrow-book-return", args=[borrow.id])
+        )
+        return Payment.objects.get(borrow=borrow)
+
+    @override_settings(STRIPE_CHECKOUT_MODE="lazy")
+    def test_lazy_mode_start_session_on_first_pay_visit(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        payment = self._create_borrow()
+
+        start_checkout_session_mock.assert_not_called()
+        self.assertEqual(payment.session_url, "")
+
+        for _ in range(2):
+            response = self.client.get(pay_url(payment.id))
+
+            self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+            self.assertEqual(response.url, CHECKOUT_SESSION_DATA["url"])
+        start_checkout_session_mock.assert_called_once_with(
+            payment.borrow, payment, 1
+        )
+        payment.refresh_from_db()
+        self.assertEqual(payment.session_id, CHECKOUT_SESSION_DATA["id"])
+
+    @override_settings(STRIPE_CHECKOUT_MODE="lazy")
+    def test_lazy_mode_start_fine_session_with_fine_multiplier(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        payment = self._return_late_borrow()
+
+        start_checkout_session_mock.assert_not_called()
+        self.assertEqual(payment.fine_multiplier, 2)
+
+        self.client.get(pay_url(payment.id))
+
+        start_checkout_session_mock.assert_called_once_with(
+            payment.borrow, payment, 2
+        )
+
+    @override_settings(STRIPE_CHECKOUT_MODE="background")
+    @mock.patch("django_q.tasks.async_task")
+    def test_background_mode_queue_session_after_commit(
+        self, async_task_mock, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = self._create_borrow()
+
+        start_checkout_session_mock.assert_not_called()
+        async_task_mock.assert_any_call(
+            "borrow.tasks.create_payment_checkout_session", payment.id
+        )
+
+        for _ in range(2):
+            create_payment_checkout_session(payment.id)
+
+        start_checkout_session_mock.assert_called_once()
+        payment.refresh_from_db()
+        self.assertEqual(payment.session_url, CHECKOUT_SESSION_DATA["url"])
+
+    @mock.patch("django_q.tasks.async_task")
+    def test_eager_mode_failure_is_logged_and_queued(
+        self, async_task_mock, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = Response(
+            {"error": "Stripe is not available"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+        with self.assertLogs("borrow.utils", "WARNING") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                payment = self._create_borrow()
+
+        self.assertIn("Stripe is not available", logs.output[0])
+        async_task_mock.assert_any_call(
+            "borrow.tasks.create_payment_checkout_session", payment.id
+        )
+
+    @override_settings(STRIPE_CHECKOUT_MODE="lazy")
+    @mock.patch("django_q.tasks.async_task")
+    def test_concurrently_started_session_is_kept(
+        self, async_task_mock, start_checkout_session_mock
+    ) -> None:
+        payment = self._create_borrow()
+
+        def start_concurrently(borrow, payment, fine_multiplier):
+            # Worker saves its session while this one is started
+            Payment.objects.filter(pk=payment.pk).update(
+                session_id="cs_worker", session_url="https://worker.com"
+            )
+            return CHECKOUT_SESSION_DATA
+
+        start_checkout_session_mock.side_effect = start_concurrently
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(pay_url(payment.id))
+
+        self.assertEqual(response.url, "https://worker.com")
+        payment.refresh_from_db()
+        self.assertEqual(payment.session_id, "cs_worker")
+        async_task_mock.assert_called_once_with(
+            "borrow.tasks.expire_checkout_sessions",
+            [CHECKOUT_SESSION_DATA["id"]],
+        )
+
+    def test_pay_redirect_to_started_session(
+        self, start_checkout_session_mock
+    ) -> None:
+        payment = sample_payment(
+            user=self.user,
+            borrow=sample_borrow(user=self.user, book=sample_book()),
+        )
+
+        response = self.client.get(pay_url(payment.id))
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, payment.session_url)
+        start_checkout_session_mock.assert_not_called()
+
+    def test_pay_not_open_payment(self, start_checkout_session_mock) -> None:
+        payment = sample_payment(
+            user=self.user,
+            borrow=sample_borrow(user=self.user, book=sample_book()),
+            status="success",
+        )
+
+        response = self.client.get(pay_url(payment.id))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        start_checkout_session_mock.assert_not_called()
+
+
+CHECKOUT_URL = reverse("borrow:payment-checkout")
+
+
+def expired_session(session_id: str) -> dict:
+    return {"id": session_id, "status": "expired", "payment_status": "unpaid"}
+
+
+@mock.patch("borrow.stripe_client.retrieve_checkout_session")
+@mock.patch(
+    "borrow.stripe_client.expire_checkout_session",
+    side_effect=expired_session,
+)
+@mock.patch("borrow.stripe_client.create_checkout_session")
+class ConsolidatedCheckoutTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+        today = timezone.now().date()
+        self.borrow_payment = sample_payment(
+            user=self.user,
+            session_id="cs_borrow",
+            borrow=sample_borrow(
+                user=self.user,
+                book=sample_book(daily_fee=1),
+                expected_return_date=today + timedelta(days=3),
+            ),
+        )
+        self.fine_payment = sample_payment(
+            user=self.user,
+            session_id="cs_fine",
+            fine_multiplier=2,
+            borrow=sample_borrow(
+                user=self.user,
+                book=sample_book(title="Late", daily_fee=2),
+                borrow_date=today - timedelta(days=10),
+                expected_return_date=today - timedelta(days=2),
+                actual_return_date=today,
+            ),
+        )
+        self.payments = (self.borrow_payment, self.fine_payment)
+
+    @mock.patch("django_q.tasks.async_task")
+    def test_one_session_for_all_open_payments(
+        self,
+        async_task_mock,
+        create_checkout_session_mock,
+        expire_checkout_session_mock,
+        retrieve_checkout_session_mock,
+    ) -> None:
+        create_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        sample_payment(user=self.user, status="success")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(CHECKOUT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response.url, CHECKOUT_SESSION_DATA["url"])
+        create_checkout_session_mock.assert_called_once()
+        line_items = create_checkout_session_mock.call_args.kwargs[
+            "line_items"
+        ]
+        self.assertEqual(
+            [item["price_data"]["unit_amount"] for item in line_items],
+            [300, 800],
+        )
+        for payment in self.payments:
+            payment.refresh_from_db()
+            self.assertEqual(payment.session_id, CHECKOUT_SESSION_DATA["id"])
+        # Superseded sessions are expired before the new one is started
+        self.assertEqual(
+            [call.args for call in expire_checkout_session_mock.mock_calls],
+            [("cs_borrow",), ("cs_fine",)],
+        )
+        async_task_mock.assert_not_called()
+
+    def test_completed_superseded_session_is_applied(
+        self,
+        create_checkout_session_mock,
+        expire_checkout_session_mock,
+        retrieve_checkout_session_mock,
+    ) -> None:
+        create_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        expire_checkout_session_mock.side_effect = [
+            stripe.error.InvalidRequestError("Session is completed", None),
+            expired_session("cs_fine"),
+        ]
+        retrieve_checkout_session_mock.return_value = {
+            "id": "cs_borrow",
+            "status": "complete",
+            "payment_status": "paid",
+        }
+
+        response = self.client.get(CHECKOUT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        retrieve_checkout_session_mock.assert_called_once_with("cs_borrow")
+        self.borrow_payment.refresh_from_db()
+        self.assertEqual(self.borrow_payment.status, "success")
+        self.assertEqual(self.borrow_payment.session_id, "cs_borrow")
+        line_items = create_checkout_session_mock.call_args.kwargs[
+            "line_items"
+        ]
+        self.assertEqual(
+            [item["price_data"]["unit_amount"] for item in line_items],
+            [800],
+        )
+        self.fine_payment.refresh_from_db()
+        self.assertEqual(
+            self.fine_payment.session_id, CHECKOUT_SESSION_DATA["id"]
+        )
+
+    def test_unknown_superseded_session_stops_checkout(
+        self,
+        create_checkout_session_mock,
+        expire_checkout_session_mock,
+        retrieve_checkout_session_mock,
+    ) -> None:
+        expire_checkout_session_mock.side_effect = (
+            stripe.error.APIConnectionError("Timeout")
+        )
+
+        response = self.client.get(CHECKOUT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        create_checkout_session_mock.assert_not_called()
+        self.borrow_payment.refresh_from_db()
+        self.assertEqual(self.borrow_payment.session_id, "cs_borrow")
+
+    @mock.patch("django_q.tasks.async_task")
+    def test_session_is_not_saved_in_changed_payments(
+        self,
+        async_task_mock,
+        create_checkout_session_mock,
+        expire_checkout_session_mock,
+        retrieve_checkout_session_mock,
+    ) -> None:
+        def pay_concurrently(**kwargs) -> dict:
+            Payment.objects.filter(id=self.fine_payment.id).update(
+                session_id="cs_other"
+            )
+            return CHECKOUT_SESSION_DATA
+
+        create_checkout_session_mock.side_effect = pay_concurrently
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(CHECKOUT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.borrow_payment.refresh_from_db()
+        self.assertEqual(self.borrow_payment.session_id, "")
+        async_task_mock.assert_called_once_with(
+            "borrow.tasks.expire_checkout_sessions",
+            [CHECKOUT_SESSION_DATA["id"]],
+        )
+
+    @mock.patch("django_q.tasks.async_task")
+    def test_started_session_is_reused(
+        self, async_task_mock, create_checkout_session_mock, *mocks
+    ) -> None:
+        create_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+
+        for _ in range(2):
+            response = self.client.get(CHECKOUT_URL)
+
+            self.assertEqual(response.url, CHECKOUT_SESSION_DATA["url"])
+        create_checkout_session_mock.assert_called_once()
+
+    def test_no_open_payments(
+        self, create_checkout_session_mock, *mocks
+    ) -> None:
+        Payment.objects.update(status="success")
+
+        response = self.client.get(CHECKOUT_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        create_checkout_session_mock.assert_not_called()
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+    @mock.patch("django_q.tasks.async_task")
+    def test_paid_session_settles_all_payments(
+        self, async_task_mock, create_checkout_session_mock, *mocks
+    ) -> None:
+        create_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        self.client.get(CHECKOUT_URL)
+        self.borrow_payment.refresh_from_db()
+
+        send_webhook(
+            self.client, "checkout.session.completed", self.borrow_payment
+        )
+
+        self.assertFalse(Payment.objects.filter(status="open").exists())
+        self.assertEqual(TelegramOutbox.objects.count(), 2)
+
+    def test_superseded_sessions_are_expired(
+        self,
+        create_checkout_session_mock,
+        expire_checkout_session_mock,
+        retrieve_checkout_session_mock,
+    ) -> None:
+        expire_checkout_session_mock.side_effect = [
+            stripe.error.InvalidRequestError("Session is completed", None),
+            None,
+        ]
+
+        expire_checkout_sessions(["cs_borrow", "cs_fine"])
+
+        self.assertEqual(expire_checkout_session_mock.call_count, 2)
+
+
+def is_success_url(payment_id: int) -> str:
+    return reverse("borrow:payment-is-success", args=[payment_id])
+
+
+def checkout_session(status: str, payment_status: str = "unpaid") -> dict:
+    return {
+        "id": "test_id",
+        "object": "checkout.session",
+        "status": status,
+        "payment_status": payment_status,
+    }
+
+
+@mock.patch("stripe.checkout.Session.retrieve")
+class IsSuccessPollingTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+        self.payment = sample_payment(
+            user=self.user,
+            borrow=sample_borrow(user=self.user, book=sample_book()),
+        )
+
+    def test_success_payment_without_stripe_call_and_writes(
+        self, retrieve_mock
+    ) -> None:
+        Payment.objects.update(status="success")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(is_success_url(self.payment.id))
+
+        self.assertEqual(response.data["status"], "success")
+        retrieve_mock.assert_not_called()
+        self.assertFalse(
+            [
+                query
+                for query in queries.captured_queries
+                if not query["sql"].startswith("SELECT")
+            ]
+        )
+
+    def test_polls_share_one_stripe_call(self, retrieve_mock) -> None:
+        retrieve_mock.return_value = checkout_session("open")
+
+        for _ in range(3):
+            response = self.client.get(is_success_url(self.payment.id))
+
+            self.assertEqual(response.data["status"], "open")
+        retrieve_mock.assert_called_once()
+
+    def test_completed_session_is_applied_before_webhook(
+        self, retrieve_mock
+    ) -> None:
+        retrieve_mock.return_value = checkout_session("complete", "paid")
+
+        for _ in range(3):
+            response = self.client.get(is_success_url(self.payment.id))
+
+            self.assertEqual(response.data["status"], "success")
+        retrieve_mock.assert_called_once()
+        self.assertEqual(TelegramOutbox.objects.count(), 1)
+
+    def test_stripe_error_is_cached(self, retrieve_mock) -> None:
+        retrieve_mock.side_effect = stripe.error.InvalidRequestError(
+            "No such checkout session", "id"
+        )
+
+        for _ in range(2):
+            response = self.client.get(is_success_url(self.payment.id))
+
+            self.assertEqual(response.data["status"], "open")
+        retrieve_mock.assert_called_once()
+
+    def test_concurrent_poll_returns_saved_status(self, retrieve_mock) -> None:
+        cache.add(webhooks.SESSION_LOCK_KEY.format(session_id="test_id"), 1)
+
+        with mock.patch("time.sleep") as sleep_mock:
+            response = self.client.get(is_success_url(self.payment.id))
+
+        self.assertEqual(response.data["status"], "open")
+        retrieve_mock.assert_not_called()
+        sleep_mock.assert_not_called()
+
+    def test_next_poll_gets_session_cached_by_lock_owner(
+        self, retrieve_mock
+    ) -> None:
+        lock_key = webhooks.SESSION_LOCK_KEY.format(session_id="test_id")
+        cache.add(lock_key, 1)
+        self.client.get(is_success_url(self.payment.id))
+        # Request holding the lock caches session & releases the lock
+        cache.set(
+            webhooks.SESSION_KEY.format(session_id="test_id"),
+            checkout_session("complete", "paid"),
+        )
+        cache.delete(lock_key)
+
+        response = self.client.get(is_success_url(self.payment.id))
+
+        self.assertEqual(response.data["status"], "success")
+        retrieve_mock.assert_not_called()
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self) -> None:
+        # Stripe calls webhook without authentication
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.payment = sample_payment(
+            user=self.user,
+            borrow=sample_borrow(user=self.user, book=sample_book()),
+        )
+
+    def assertStatus(self, payment_status: str) -> None:
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, payment_status)
+
+    def test_completed_session_set_payment_success_once(self) -> None:
+        for _ in range(2):
+            response = send_webhook(
+                self.client, "checkout.session.completed", self.payment
+            )
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertStatus("success")
+        self.assertEqual(TelegramOutbox.objects.count(), 1)
+
+    def test_expired_session_set_open_payment_expired(self) -> None:
+        send_webhook(self.client, "checkout.session.expired", self.payment)
+
+        self.assertStatus("expired")
+
+    def test_late_expired_event_does_not_change_paid_payment(self) -> None:
+        send_webhook(self.client, "checkout.session.completed", self.payment)
+        send_webhook(self.client, "checkout.session.expired", self.payment)
+
+        self.assertStatus("success")
+
+    def test_completed_session_not_paid_yet(self) -> None:
+        send_webhook(
+            self.client,
+            "checkout.session.completed",
+            self.payment,
+            payment_status="unpaid",
+        )
+        self.assertStatus("open")
+
+        send_webhook(
+            self.client,
+            "checkout.session.async_payment_succeeded",
+            self.payment,
+        )
+        self.assertStatus("success")
+
+    def test_event_with_invalid_signature_is_rejected(self) -> None:
+        response = send_webhook(
+            self.client,
+            "checkout.session.completed",
+            self.payment,
+            secret="whsec_other",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertStatus("open")
+
+    def test_events_are_rejected_without_secret(self) -> None:
+        with override_settings(STRIPE_WEBHOOK_SECRET=None):
+            response = send_webhook(
+                self.client, "checkout.session.completed", self.payment
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_events_are_accepted(self) -> None:
+        response = send_webhook(
+            self.client, "payment_intent.created", self.payment
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertStatus("open")
@@ -0,0 +1,155 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from Library_service.fast_serializers import (
+    FastSerializer,
+    get_fast_serializer,
+)
+from book.models import Book
+from book.serializers import BookSerializer
+from borrow.models import Borrow, Payment
+from borrow.serializers import (
+    BorrowDetailSerializer,
+    BorrowListSerializer,
+    PaymentDetailSerializer,
+    PaymentListSerializer,
+)
+from borrow.views import BorrowViewSet
+from tests.test_book_views import sample_book
+from tests.test_borrow_views.test_borrow import sample_borrow, sample_payment
+
+
+def render(data) -> bytes:
+    return JSONRenderer().render(data)
+
+
+class FastSerializerParityTests(TestCase):
+    """Compiled serializers give the same JSON as DRF serializers"""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = get_user_model().objects.create_user(
+            "test@library.com", "test12345", first_name="Test"
+        )
+        today = timezone.now().date()
+        for i in range(5):
+            book = sample_book(
+                title=f"Book {i}",
+                cover=Book.CoverChoices.values[i % 2],
+                inventory=i,
+                daily_fee=f"{i}.05",
+            )
+            borrow = sample_borrow(
+                user=user,
+                book=book,
+                expected_return_date=today + timedelta(days=i + 1),
+                actual_return_date=(
+                    today + timedelta(days=2) if i % 2 else None
+                ),
+            )
+            for status in ("paid", "open")[: i % 3]:
+                borrow.payments.add(sample_payment(user=user, status=status))
+        sample_payment(user=user)
+
+    def assertSameJSON(
+        self, serializer_class, queryset: QuerySet, many: bool = True
+    ) -> None:
+        fast_serializer = FastSerializer(serializer_class)
+        rows = fast_serializer.values(queryset)
+        if many:
+            fast = fast_serializer.serialize(rows, queryset)
+            expected = serializer_class(queryset, many=True).data
+        else:
+            fast = fast_serializer.serialize([rows.first()], queryset)[0]
+            expected = serializer_class(queryset.first()).data
+        self.assertEqual(render(fast), render(expected))
+
+    def test_book_serializer(self) -> None:
+        self.assertSameJSON(BookSerializer, Book.objects.all())
+
+    def test_book_serializer_with_availability(self) -> None:
+        self.assertSameJSON(BookSerializer, Book.objects.with_availability())
+
+    def test_borrow_list_serializer(self) -> None:
+        self.assertSameJSON(BorrowListSerializer, Borrow.objects.all())
+
+    def test_borrow_detail_serializer(self) -> None:
+        self.assertSameJSON(BorrowDetailSerializer, Borrow.objects.all())
+        self.assertSameJSON(
+            BorrowDetailSerializer, Borrow.objects.all(), many=False
+        )
+
+    def test_payment_list_serializer(self) -> None:
+        self.assertSameJSON(PaymentListSerializer, Payment.objects.all())
+
+    def test_payment_detail_serializer(self) -> None:
+        self.assertSameJSON(PaymentDetailSerializer, Payment.objects.all())
+
+    def test_serializer_with_unsupported_field_is_not_compiled(self) -> None:
+        class BookTitleSerializer(serializers.ModelSerializer):
+            upper_title = serializers.SerializerMethodField()
+
+            class Meta:
+                model = Book
+                fields = ("id", "upper_title")
+
+            def get_upper_title(self, book: Book) -> str:
+                return book.title.upper()
+
+        self.assertIsNone(get_fast_serializer(BookTitleSerializer))
+
+
+class FastSerializerApiTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+        cache.clear()
+
+    def test_borrow_list_use_constant_number_of_queries(self) -> None:
+        for i in range(10):
+            borrow = sample_borrow(
+                user=self.user, book=sample_book(title=f"Book {i}")
+            )
+            borrow.payments.add(sample_payment(user=self.user))
+
+        # count, page and payments of page
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("borrow:borrow-list"))
+
+        self.assertEqual(
+            response.data["results"],
+            BorrowListSerializer(Borrow.objects.all(), many=True).data,
+        )
+
+    def test_retrieve_missing_borrow(self) -> None:
+        response = self.client.get(reverse("borrow:borrow-detail", args=[0]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_retrieve_check_object_permissions_of_model_instance(
+        self,
+    ) -> None:
+        borrow = sample_borrow(user=self.user, book=sample_book())
+
+        with mock.patch.object(
+            BorrowViewSet, "check_object_permissions"
+        ) as check_mock:
+            self.client.get(reverse("borrow:borrow-detail", args=[borrow.id]))
+
+        instance = check_mock.call_args.args[1]
+        self.assertIsInstance(instance, Borrow)
+        self.assertEqual(instance.pk, borrow.pk)
+        self.assertEqual(instance.user_id, self.user.id)
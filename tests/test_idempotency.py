@@ -0,0 +1,204 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from Library_service import idempotency
+from book.models import Book
+from borrow import stripe_client
+from borrow.models import Borrow, Payment
+from tests.test_book_views import sample_book
+from tests.test_borrow_views.test_borrow import (
+    BORROW_URL,
+    CHECKOUT_SESSION_DATA,
+    sample_borrow,
+    sample_payment,
+)
+from user.models import TelegramOutbox
+
+
+def lock_key(user, method: str, path: str, key: str) -> str:
+    request = SimpleNamespace(user=user, method=method, path=path)
+    return idempotency.LOCK_KEY.format(
+        key=idempotency._scope_key(request, key)
+    )
+
+
+@mock.patch("borrow.utils.start_checkout_session")
+class IdempotencyKeyTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = sample_book(inventory=3)
+        self.payload = {
+            "book": self.book.id,
+            "expected_return_date": timezone.now().date() + timedelta(days=10),
+        }
+
+    def _create_borrow(self, key: str = "key-1", **payload):
+        return self.client.post(
+            BORROW_URL,
+            data={**self.payload, **payload},
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retried_borrow_creation_is_replayed(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._create_borrow()
+        with self.captureOnCommitCallbacks(execute=True):
+            retry = self._create_borrow()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], "true")
+        self.assertEqual(Borrow.objects.count(), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(Book.objects.get(id=self.book.id).inventory, 2)
+        self.assertEqual(TelegramOutbox.objects.count(), 1)
+        start_checkout_session_mock.assert_called_once()
+
+    def test_key_of_other_request_is_rejected(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        self._create_borrow()
+
+        response = self._create_borrow(book=sample_book(title="Other").id)
+
+        self.assertEqual(
+            response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        self.assertEqual(Borrow.objects.count(), 1)
+
+    def test_keys_are_separated_by_users(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        self._create_borrow()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                "other@library.com", "test12345"
+            )
+        )
+
+        response = self._create_borrow()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn(idempotency.REPLAYED_HEADER, response)
+        self.assertEqual(Borrow.objects.count(), 2)
+
+    def test_failed_request_is_not_stored(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+
+        failed = self._create_borrow(expected_return_date="")
+        retry = self._create_borrow(expected_return_date="")
+
+        self.assertEqual(failed.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(idempotency.REPLAYED_HEADER, retry)
+
+    def test_retried_return_is_replayed(
+        self, start_checkout_session_mock
+    ) -> None:
+        borrow = sample_borrow(
+            user=self.user,
+            book=self.book,
+            borrow_date=timezone.now().date() - timedelta(days=5),
+        )
+        url = reverse("borrow:borrow-book-return", args=[borrow.id])
+
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+        retry = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Book.objects.get(id=self.book.id).inventory, 4)
+
+    def test_retried_renewal_is_replayed(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        payment = sample_payment(
+            user=self.user,
+            borrow=sample_borrow(user=self.user, book=self.book),
+            status="expired",
+        )
+        url = reverse("borrow:payment-renew-payment", args=[payment.id])
+
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(url, HTTP_IDEMPOTENCY_KEY="renew-1")
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Payment.objects.count(), 2)
+        start_checkout_session_mock.assert_called_once()
+
+    def test_concurrent_retry_is_conflict_without_wait(
+        self, start_checkout_session_mock
+    ) -> None:
+        cache.add(lock_key(self.user, "POST", BORROW_URL, "key-1"), 1)
+
+        with mock.patch("time.sleep") as sleep_mock:
+            response = self._create_borrow()
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Borrow.objects.count(), 0)
+        sleep_mock.assert_not_called()
+
+    def test_retry_after_first_response_is_replayed(
+        self, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        key = lock_key(self.user, "POST", BORROW_URL, "key-1")
+        cache.add(key, 1)
+        self._create_borrow()
+        # First request stores its response & releases the lock
+        cache.delete(key)
+        first = self._create_borrow()
+
+        retry = self._create_borrow()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], "true")
+        self.assertEqual(Borrow.objects.count(), 1)
+
+    @mock.patch("Library_service.idempotency.cache.add")
+    def test_lock_outlives_request_with_stripe_retries(
+        self, add_mock, start_checkout_session_mock
+    ) -> None:
+        start_checkout_session_mock.return_value = CHECKOUT_SESSION_DATA
+        add_mock.return_value = True
+
+        self._create_borrow()
+
+        key = lock_key(self.user, "POST", BORROW_URL, "key-1")
+        timeout = next(
+            call.kwargs["timeout"]
+            for call in add_mock.call_args_list
+            if call.args[0] == key
+        )
+        stripe_call = (settings.STRIPE_MAX_RETRIES + 1) * (
+            settings.STRIPE_CONNECT_TIMEOUT
+            + settings.STRIPE_READ_TIMEOUT
+            + settings.STRIPE_RATE_LIMIT_WAIT
+        ) + settings.STRIPE_MAX_RETRIES * stripe_client.RETRY_MAX_DELAY
+        self.assertGreater(timeout, stripe_call)
@@ -0,0 +1,143 @@
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from Library_service.renderers import MessagePackRenderer, ORJSONRenderer
+from borrow.models import Borrow, Payment
+from borrow.serializers import BorrowDetailSerializer, PaymentListSerializer
+from tests.test_book_views import BOOK_URL, sample_book
+from tests.test_borrow_views.test_borrow import (
+    BORROW_URL,
+    sample_borrow,
+    sample_payment,
+)
+
+MSGPACK = "application/msgpack"
+
+
+class RenderersCompatibilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        user = get_user_model().objects.create_user(
+            "test@library.com", "test12345", first_name="Тест"
+        )
+        for i in range(3):
+            borrow = sample_borrow(
+                user=user, book=sample_book(title=f"Книга {i}")
+            )
+            borrow.payments.add(sample_payment(user=user))
+
+    def assertSameJSON(self, data) -> None:
+        self.assertEqual(
+            ORJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+
+    def test_orjson_render_serializers_data_as_json_renderer(self) -> None:
+        self.assertSameJSON(
+            BorrowDetailSerializer(Borrow.objects.all(), many=True).data
+        )
+        self.assertSameJSON(
+            PaymentListSerializer(Payment.objects.all(), many=True).data
+        )
+
+    def test_orjson_render_raw_values_as_json_renderer(self) -> None:
+        self.assertSameJSON(
+            {
+                "fee": Decimal("1.45"),
+                "date": datetime.date(2023, 4, 1),
+                "created_at": datetime.datetime(
+                    2023, 4, 1, 10, 30, 15, 1234, tzinfo=datetime.timezone.utc
+                ),
+                "time": datetime.time(10, 30),
+                "duration": datetime.timedelta(days=1),
+                "id": uuid.UUID(int=1),
+                1: None,
+            }
+        )
+
+    def test_msgpack_render_the_same_values_as_json(self) -> None:
+        data = BorrowDetailSerializer(Borrow.objects.all(), many=True).data
+        data[0]["raw_fee"] = Decimal("2.50")
+        data[0]["raw_date"] = timezone.now()
+
+        self.assertEqual(
+            msgpack.unpackb(MessagePackRenderer().render(data)),
+            json.loads(JSONRenderer().render(data)),
+        )
+
+
+class ContentNegotiationTests(TestCase):
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@library.com", "test12345", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+        cache.clear()
+
+    def test_json_is_default(self) -> None:
+        sample_book()
+
+        response = self.client.get(BOOK_URL)
+
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(
+            json.loads(response.content)["results"][0]["daily_fee"], "1.45"
+        )
+
+    def test_msgpack_by_accept_header(self) -> None:
+        sample_borrow(user=self.user, book=sample_book())
+
+        response = self.client.get(BORROW_URL, HTTP_ACCEPT=MSGPACK)
+        data = msgpack.unpackb(response.content)
+
+        self.assertEqual(response["Content-Type"], MSGPACK)
+        self.assertEqual(data["results"][0]["book"]["daily_fee"], "1.45")
+        self.assertEqual(
+            data["results"][0]["borrow_date"],
+            str(timezone.now().date()),
+        )
+
+    def test_parse_json_request(self) -> None:
+        payload = {
+            "title": "JSON Book",
+            "author": "Author",
+            "cover": "Soft",
+            "inventory": 2,
+            "daily_fee": "0.50",
+        }
+
+        response = self.client.post(BOOK_URL, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_parse_msgpack_request(self) -> None:
+        payload = {
+            "title": "MessagePack Book",
+            "author": "Author",
+            "cover": "Hard",
+            "daily_fee": "0.50",
+        }
+
+        response = self.client.post(
+            BOOK_URL, msgpack.packb(payload), content_type=MSGPACK
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_invalid_json_request(self) -> None:
+        response = self.client.post(
+            BOOK_URL, "{invalid", content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
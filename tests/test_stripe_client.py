@@ -0,0 +1,187 @@
+from unittest import mock
+
+import stripe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from Library_service import metrics
+from Library_service.ratelimit import RateLimitExceeded, TokenBucket
+from borrow import stripe_client
+
+STRIPE_STATS_URL = reverse("borrow:payment-stripe-stats")
+
+
+@override_settings(STRIPE_MAX_RETRIES=2, STRIPE_RATE_LIMIT=100)
+@mock.patch("borrow.stripe_client.time.sleep")
+@mock.patch("stripe.checkout.Session.create")
+class StripeClientTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_call_with_api_key_and_idempotency_key(
+        self, create_mock, sleep_mock
+    ) -> None:
+        create_mock.return_value = {"id": "cs_test"}
+
+        session = stripe_client.create_checkout_session(mode="payment")
+
+        self.assertEqual(session, {"id": "cs_test"})
+        create_mock.assert_called_once_with(
+            mode="payment",
+            api_key=settings.STRIPE_API_KEY,
+            idempotency_key=mock.ANY,
+        )
+        self.assertIsInstance(
+            stripe.default_http_client, stripe.http_client.RequestsClient
+        )
+        self.assertEqual(stripe.max_network_retries, 0)
+
+    def test_retry_network_errors_with_the_same_idempotency_key(
+        self, create_mock, sleep_mock
+    ) -> None:
+        create_mock.side_effect = [
+            stripe.error.APIConnectionError("Timeout"),
+            stripe.error.APIError("Server error", http_status=503),
+            {"id": "cs_test"},
+        ]
+
+        stripe_client.create_checkout_session(mode="payment")
+
+        self.assertEqual(create_mock.call_count, 3)
+        self.assertEqual(sleep_mock.call_count, 2)
+        keys = {
+            call.kwargs["idempotency_key"]
+            for call in create_mock.call_args_list
+        }
+        self.assertEqual(len(keys), 1)
+
+    def test_retries_are_bounded(self, create_mock, sleep_mock) -> None:
+        create_mock.side_effect = stripe.error.APIConnectionError("Timeout")
+
+        with self.assertRaises(stripe.error.APIConnectionError):
+            stripe_client.create_checkout_session(mode="payment")
+
+        self.assertEqual(create_mock.call_count, 3)
+        for call in sleep_mock.call_args_list:
+            self.assertLessEqual(call.args[0], stripe_client.RETRY_MAX_DELAY)
+
+    def test_request_errors_are_not_retried(
+        self, create_mock, sleep_mock
+    ) -> None:
+        create_mock.side_effect = stripe.error.InvalidRequestError(
+            "Invalid amount", "amount"
+        )
+
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            stripe_client.create_checkout_session(mode="payment")
+
+        create_mock.assert_called_once()
+        sleep_mock.assert_not_called()
+
+    @override_settings(STRIPE_RATE_LIMIT=1, STRIPE_RATE_LIMIT_WAIT=0)
+    def test_rate_limit_is_raised_as_stripe_error(
+        self, create_mock, sleep_mock
+    ) -> None:
+        with mock.patch("time.time", return_value=1000.5):
+            stripe_client.create_checkout_session(mode="payment")
+            with self.assertRaises(stripe.error.RateLimitError):
+                stripe_client.create_checkout_session(mode="payment")
+
+        create_mock.assert_called_once()
+
+    def test_latency_of_every_attempt_is_measured(
+        self, create_mock, sleep_mock
+    ) -> None:
+        create_mock.side_effect = [
+            stripe.error.APIConnectionError("Timeout"),
+            {"id": "cs_test"},
+        ]
+
+        stripe_client.create_checkout_session(mode="payment")
+        stats = stripe_client.get_latency_stats()["checkout.session.create"]
+
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["buckets"]["+Inf"], 2)
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    @mock.patch("Library_service.ratelimit.time.sleep")
+    @mock.patch("Library_service.ratelimit.time.time", return_value=10.75)
+    def test_wait_for_refill_of_next_second(self, time_mock, sleep_mock):
+        sleep_mock.side_effect = lambda seconds: setattr(
+            time_mock, "return_value", time_mock.return_value + seconds
+        )
+        bucket = TokenBucket("test", rate=1, max_wait=1)
+
+        bucket.acquire()
+        bucket.acquire()
+
+        sleep_mock.assert_called_once_with(0.25)
+
+    @mock.patch("Library_service.ratelimit.time.time", return_value=10.5)
+    def test_raise_if_wait_is_too_long(self, time_mock) -> None:
+        bucket = TokenBucket("test", rate=2, max_wait=0.1)
+
+        bucket.acquire()
+        bucket.acquire()
+        with self.assertRaises(RateLimitExceeded):
+            bucket.acquire()
+
+
+class HistogramTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        for seconds in (0.01, 0.3, 0.4, 20):
+            metrics.observe("test", seconds)
+
+        histogram = metrics.get_histogram("test")
+
+        self.assertEqual(histogram["count"], 4)
+        self.assertAlmostEqual(histogram["sum"], 20.71)
+        self.assertEqual(histogram["buckets"]["0.05"], 1)
+        self.assertEqual(histogram["buckets"]["0.25"], 1)
+        self.assertEqual(histogram["buckets"]["0.5"], 3)
+        self.assertEqual(histogram["buckets"]["10"], 3)
+        self.assertEqual(histogram["buckets"]["+Inf"], 4)
+
+
+class StripeStatsApiTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+
+    def test_stripe_stats_for_staff(self) -> None:
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                "admin@library.com", "test12345", is_staff=True
+            )
+        )
+        metrics.observe("stripe:checkout.session.create", 0.2)
+
+        response = self.client.get(STRIPE_STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["checkout.session.create"]["buckets"]["0.25"], 1
+        )
+
+    def test_stripe_stats_not_allowed_for_non_staff(self) -> None:
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(
+                "test@library.com", "test12345"
+            )
+        )
+
+        response = self.client.get(STRIPE_STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
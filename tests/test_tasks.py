@@ -1,20 +1,39 @@
+import asyncio
 from datetime import timedelta
 from unittest import mock
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.utils import json
 
+from Library_service import metrics, versions
+from book import cache as book_cache
+from book.models import (
+    Book,
+    BookBorrowDay,
+    BookPopularity,
+    PopularityRollup,
+)
 from borrow.models import Payment
 from borrow.serializers import BorrowTelegramSerializer
 from borrow.tasks import (
+    EXPIRED_PAYMENTS_METRIC,
+    EXPIRY_BATCH_METRIC,
     inform_borrowing_overdue,
     check_payment_session_duration,
+    reconcile_payments,
+    rollup_book_popularity,
+    send_telegram_outbox,
 )
-from tests.test_book_views import sample_book
+from tests.test_book_views import BOOK_URL, sample_book
 from tests.test_borrow_views.test_borrow import sample_borrow, sample_payment
-from user.models import TelegramChat
+from user.management.commands import t_bot
+from user.models import TelegramChat, TelegramOutbox
 
 
 class InformBorrowingOverdueUtilTests(TestCase):
@@ -119,3 +138,507 @@ class CheckPaymentSessionDurationUtilTests(TestCase):
         expired_payment = Payment.objects.get(id=payment.id)
 
         self.assertEqual(expired_payment.status, "expired")
+
+
+class ExpirePaymentsBatchTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        payments = Payment.objects.bulk_create(
+            Payment(user=self.user, session_id=f"cs_{i % 3}") for i in range(5)
+        )
+        Payment.objects.filter(id__in=[p.id for p in payments]).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        self.fresh_payment = sample_payment(user=self.user)
+        self.paid_payment = sample_payment(user=self.user, status="success")
+        Payment.objects.filter(pk=self.paid_payment.pk).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+    @override_settings(PAYMENT_EXPIRY_BATCH_SIZE=2)
+    def test_expire_old_open_payments_by_batches(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            expired = check_payment_session_duration()
+
+        self.assertEqual(expired, 5)
+        self.assertEqual(Payment.objects.filter(status="expired").count(), 5)
+        self.fresh_payment.refresh_from_db()
+        self.paid_payment.refresh_from_db()
+        self.assertEqual(self.fresh_payment.status, "open")
+        self.assertEqual(self.paid_payment.status, "success")
+        updates = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith("UPDATE")
+        ]
+        self.assertEqual(len(updates), 3)
+
+    @override_settings(PAYMENT_EXPIRY_BATCH_SIZE=2)
+    def test_expiry_metrics(self) -> None:
+        check_payment_session_duration()
+
+        self.assertEqual(
+            metrics.get_counters(EXPIRED_PAYMENTS_METRIC),
+            {EXPIRED_PAYMENTS_METRIC: 5},
+        )
+        self.assertEqual(
+            metrics.get_histogram(EXPIRY_BATCH_METRIC)["count"], 3
+        )
+
+    @mock.patch("django_q.tasks.async_task")
+    def test_stripe_sessions_are_not_expired_by_default(
+        self, async_task_mock
+    ) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            check_payment_session_duration()
+
+        async_task_mock.assert_not_called()
+
+    @override_settings(PAYMENT_EXPIRY_STRIPE_SESSIONS=True)
+    @mock.patch("django_q.tasks.async_task")
+    def test_stripe_sessions_are_expired_after_commit(
+        self, async_task_mock
+    ) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            check_payment_session_duration()
+
+        async_task_mock.assert_called_once_with(
+            "borrow.tasks.expire_checkout_sessions", ["cs_0", "cs_1", "cs_2"]
+        )
+
+    def test_expiry_changes_user_payments_version(self) -> None:
+        version = versions.get_version(f"payment:user:{self.user.id}")
+
+        check_payment_session_duration()
+
+        self.assertGreater(
+            versions.get_version(f"payment:user:{self.user.id}"), version
+        )
+
+
+class RollupBookPopularityTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+        self.today = timezone.now().date()
+        self.book = sample_book(title="Popular")
+        self.old_book = sample_book(title="Was popular")
+        cache.clear()
+
+    def _borrow(self, book: Book, days_ago: int) -> None:
+        borrow_date = self.today - timedelta(days=days_ago)
+        sample_borrow(
+            user=self.user,
+            book=book,
+            borrow_date=borrow_date,
+            expected_return_date=borrow_date + timedelta(days=10),
+        )
+
+    def test_rollup_count_borrows_by_windows(self) -> None:
+        self._borrow(self.book, days_ago=0)
+        self._borrow(self.book, days_ago=10)
+        self._borrow(self.old_book, days_ago=60)
+        self._borrow(self.old_book, days_ago=40)
+
+        rollup_book_popularity()
+        popularity = BookPopularity.objects.get(book=self.book)
+        old_popularity = BookPopularity.objects.get(book=self.old_book)
+
+        self.assertEqual(
+            (popularity.week, popularity.month, popularity.total), (1, 2, 2)
+        )
+        self.assertEqual(
+            (old_popularity.week, old_popularity.month, old_popularity.total),
+            (0, 0, 2),
+        )
+
+    def test_rollup_is_incremental_and_not_count_borrows_twice(self) -> None:
+        self._borrow(self.book, days_ago=100)
+        rollup_book_popularity()
+        self._borrow(self.book, days_ago=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            rollup_book_popularity()
+        rollup_book_popularity()
+        popularity = BookPopularity.objects.get(book=self.book)
+
+        self.assertEqual(popularity.total, 2)
+        self.assertEqual(popularity.week, 1)
+        self.assertNotIn(
+            str(self.today - timedelta(days=100)),
+            " ".join(query["sql"] for query in queries),
+        )
+
+    def test_rollup_writes_totals_of_all_books_by_one_query(self) -> None:
+        books = [sample_book(title=f"Book {i}") for i in range(5)]
+        for book in books:
+            self._borrow(book, days_ago=100)
+        rollup_book_popularity()
+        for book in books:
+            self._borrow(book, days_ago=100)
+        PopularityRollup.objects.update(
+            counted_until=self.today - timedelta(days=100)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            rollup_book_popularity()
+
+        self.assertEqual(
+            [
+                popularity.total
+                for popularity in BookPopularity.objects.filter(book__in=books)
+            ],
+            [2] * len(books),
+        )
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in queries
+                    if '"total"' in query["sql"]
+                    and not query["sql"].startswith("SELECT")
+                ]
+            ),
+            1,
+        )
+
+    def test_rollup_move_borrows_out_of_windows(self) -> None:
+        self._borrow(self.book, days_ago=5)
+        rollup_book_popularity()
+        BookBorrowDay.objects.update(day=self.today - timedelta(days=20))
+
+        rollup_book_popularity()
+        popularity = BookPopularity.objects.get(book=self.book)
+
+        self.assertEqual((popularity.week, popularity.month), (0, 1))
+
+    def test_rollup_invalidates_only_changed_popularity(self) -> None:
+        self._borrow(self.book, days_ago=1)
+        rollup_book_popularity()
+        scopes = (
+            book_cache.POPULARITY_SCOPE,
+            book_cache.CATALOG_SCOPE,
+            book_cache.BULK_SCOPE,
+        )
+        before = versions.get_versions(*scopes)
+
+        rollup_book_popularity()
+        self.assertEqual(versions.get_versions(*scopes), before)
+
+        self._borrow(self.old_book, days_ago=0)
+        rollup_book_popularity()
+        after = versions.get_versions(*scopes)
+
+        self.assertGreater(
+            after[book_cache.POPULARITY_SCOPE][0],
+            before[book_cache.POPULARITY_SCOPE][0],
+        )
+        self.assertEqual(
+            after[book_cache.BULK_SCOPE], before[book_cache.BULK_SCOPE]
+        )
+
+    def test_cached_popular_books_are_updated_by_rollup(self) -> None:
+        self._borrow(self.book, days_ago=1)
+        rollup_book_popularity()
+
+        def titles() -> list[str]:
+            response = self.client.get(BOOK_URL, {"ordering": "popular"})
+            return [book["title"] for book in response.data["results"]][:2]
+
+        self.assertEqual(titles(), [self.book.title, self.old_book.title])
+        self._borrow(self.old_book, days_ago=0)
+        self._borrow(self.old_book, days_ago=0)
+        rollup_book_popularity()
+
+        self.assertEqual(titles(), [self.old_book.title, self.book.title])
+
+    def test_books_ordering_by_popularity(self) -> None:
+        unpopular = sample_book(title="A never borrowed")
+        self._borrow(self.old_book, days_ago=60)
+        self._borrow(self.old_book, days_ago=50)
+        self._borrow(self.book, days_ago=1)
+        rollup_book_popularity()
+
+        def titles(ordering: str) -> list[str]:
+            response = self.client.get(BOOK_URL, {"ordering": ordering})
+            return [book["title"] for book in response.data["results"]]
+
+        self.assertEqual(
+            titles("popular"),
+            [self.old_book.title, self.book.title, unpopular.title],
+        )
+        self.assertEqual(
+            titles("popular_week"),
+            [self.book.title, self.old_book.title, unpopular.title],
+        )
+
+    def test_books_with_same_popularity_ordered_by_id(self) -> None:
+        later = sample_book(title="A borrowed later")
+        self._borrow(later, days_ago=1)
+        self._borrow(self.book, days_ago=1)
+        rollup_book_popularity()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(BOOK_URL, {"ordering": "popular"})
+
+        self.assertEqual(
+            [book["title"] for book in response.data["results"]],
+            [self.book.title, later.title, self.old_book.title],
+        )
+        self.assertIn(
+            'ORDER BY "book_bookpopularity"."total" DESC NULLS LAST, '
+            '"book_bookpopularity"."book_id" ASC',
+            queries[-1]["sql"],
+        )
+
+    def test_books_ordering_by_popularity_not_read_borrows(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(
+                BOOK_URL,
+                {
+                    "ordering": "popular_month",
+                    "omit": "active_borrows,next_return_date",
+                },
+            )
+
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertIn("book_bookpopularity", sql)
+        self.assertNotIn("borrow_borrow", sql)
+
+    def test_books_invalid_ordering(self) -> None:
+        response = self.client.get(BOOK_URL, {"ordering": "unknown"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    TELEGRAM_OUTBOX_BATCH_SIZE=2,
+    TELEGRAM_OUTBOX_MAX_ATTEMPTS=2,
+    TELEGRAM_OUTBOX_RETRY_DELAY=60,
+)
+class SendTelegramOutboxTests(TestCase):
+    def setUp(self) -> None:
+        for chat_user_id in (1, 2):
+            TelegramChat.objects.create(chat_user_id=chat_user_id)
+
+    @mock.patch("user.management.commands.t_bot.send_msgs")
+    def test_send_batch_of_messages_to_all_chats(self, send_msgs_mock) -> None:
+        send_msgs_mock.return_value = [None] * 4
+        for text in ("First", "Second", "Third"):
+            TelegramOutbox.objects.enqueue(text)
+
+        self.assertEqual(send_telegram_outbox(), 2)
+
+        send_msgs_mock.assert_called_once_with(
+            [("First", 1), ("First", 2), ("Second", 1), ("Second", 2)]
+        )
+        self.assertEqual(
+            list(TelegramOutbox.objects.values_list("text", flat=True)),
+            ["Third"],
+        )
+
+    @mock.patch("user.management.commands.t_bot.send_msgs")
+    def test_retry_only_failed_chats_later(self, send_msgs_mock) -> None:
+        send_msgs_mock.return_value = [None, Exception("Flood control")]
+        message = TelegramOutbox.objects.enqueue("Text")
+
+        send_telegram_outbox()
+        message.refresh_from_db()
+
+        self.assertEqual(message.chat_user_ids, [2])
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(send_telegram_outbox(), 0)
+
+        send_msgs_mock.reset_mock()
+        send_msgs_mock.return_value = [None]
+        TelegramOutbox.objects.update(next_attempt_at=timezone.now())
+        send_telegram_outbox()
+
+        send_msgs_mock.assert_called_once_with([("Text", 2)])
+        self.assertFalse(TelegramOutbox.objects.exists())
+
+    @mock.patch("user.management.commands.t_bot.send_msgs")
+    def test_message_out_of_attempts_is_kept(self, send_msgs_mock) -> None:
+        send_msgs_mock.side_effect = Exception("Telegram is not available")
+        TelegramOutbox.objects.enqueue("Text")
+
+        for _ in range(2):
+            send_telegram_outbox()
+            TelegramOutbox.objects.update(next_attempt_at=timezone.now())
+
+        self.assertEqual(send_telegram_outbox(), 0)
+        self.assertEqual(send_msgs_mock.call_count, 2)
+        self.assertEqual(TelegramOutbox.objects.get().chat_user_ids, [1, 2])
+
+    @mock.patch("user.management.commands.t_bot.send_msgs")
+    def test_batch_is_claimed_before_sending(self, send_msgs_mock) -> None:
+        message = TelegramOutbox.objects.enqueue("Text")
+
+        @sync_to_async
+        def check_claim(messages: list) -> list:
+            # Other workers do not take messages while they are sent
+            message.refresh_from_db()
+            self.assertEqual(message.attempts, 1)
+            self.assertEqual(message.chat_user_ids, [1, 2])
+            self.assertFalse(TelegramOutbox.objects.due(5).exists())
+            return [None] * len(messages)
+
+        send_msgs_mock.side_effect = check_claim
+
+        self.assertEqual(send_telegram_outbox(), 1)
+        self.assertFalse(TelegramOutbox.objects.exists())
+
+    @override_settings(TELEGRAM_SEND_CONCURRENCY=2)
+    @mock.patch("telegram.Bot")
+    def test_messages_are_sent_with_bounded_concurrency(
+        self, bot_mock
+    ) -> None:
+        sending = []
+        most_sending = []
+
+        async def send_message(text: str, chat_id: int) -> int:
+            sending.append(chat_id)
+            most_sending.append(len(sending))
+            await asyncio.sleep(0)
+            sending.remove(chat_id)
+            return chat_id
+
+        bot = bot_mock.return_value
+        bot.__aenter__.return_value = bot
+        bot.send_message.side_effect = send_message
+
+        results = async_to_sync(t_bot.send_msgs)(
+            [("Text", chat_id) for chat_id in range(5)]
+        )
+
+        self.assertEqual(results, list(range(5)))
+        self.assertEqual(max(most_sending), 2)
+
+    @mock.patch("django_q.tasks.async_task")
+    def test_enqueue_wake_up_worker_after_commit(self, async_task_mock):
+        with self.captureOnCommitCallbacks(execute=True):
+            TelegramOutbox.objects.enqueue("Text")
+            async_task_mock.assert_not_called()
+
+        async_task_mock.assert_called_once_with(
+            "borrow.tasks.send_telegram_outbox"
+        )
+
+
+class FakeStripeSessions:
+    """Checkout sessions served like Stripe list API does"""
+
+    def __init__(self, sessions: list[dict]) -> None:
+        self.sessions = sessions
+        self.calls = []
+
+    def list(self, limit: int, starting_after: str = None, **params):
+        self.calls.append({"starting_after": starting_after, **params})
+        sessions = [
+            session
+            for session in self.sessions
+            if session["status"] == params["status"]
+        ]
+        if starting_after is not None:
+            ids = [session["id"] for session in sessions]
+            sessions = sessions[ids.index(starting_after) + 1 :]
+        return {"data": sessions[:limit], "has_more": len(sessions) > limit}
+
+
+class ReconcilePaymentsTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            "test@library.com", "test12345"
+        )
+
+    def _reconcile(self, sessions: list[dict]) -> FakeStripeSessions:
+        fake = FakeStripeSessions(sessions)
+        with mock.patch("stripe.checkout.Session.list", fake.list):
+            self.changed = reconcile_payments()
+        return fake
+
+    def test_sessions_are_applied_by_pages_with_bulk_writes(self) -> None:
+        Payment.objects.bulk_create(
+            Payment(user=self.user, session_id=f"cs_{i}") for i in range(250)
+        )
+        sessions = [
+            {"id": f"cs_{i}", "status": "complete", "payment_status": "paid"}
+            for i in range(150)
+        ] + [
+            {"id": f"cs_{i}", "status": "expired", "payment_status": "unpaid"}
+            for i in range(150, 200)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            fake = self._reconcile(sessions)
+
+        self.assertEqual(self.changed, 200)
+        self.assertEqual(Payment.objects.filter(status="success").count(), 150)
+        self.assertEqual(Payment.objects.filter(status="expired").count(), 50)
+        self.assertEqual(Payment.objects.filter(status="open").count(), 50)
+        self.assertEqual(TelegramOutbox.objects.count(), 150)
+        # Two pages of completed sessions and one of expired
+        self.assertEqual(
+            [call["starting_after"] for call in fake.calls],
+            [None, "cs_99", None],
+        )
+        updates = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "borrow_payment"')
+        ]
+        self.assertEqual(len(updates), 3)
+
+    def test_sessions_since_the_oldest_open_payment(self) -> None:
+        payment = sample_payment(user=self.user, session_id="cs_old")
+        Payment.objects.filter(pk=payment.pk).update(
+            created_at=timezone.now() - timedelta(hours=5)
+        )
+        sample_payment(user=self.user, session_id="cs_new")
+        payment.refresh_from_db()
+
+        fake = self._reconcile([])
+
+        self.assertEqual(
+            fake.calls[0]["created"],
+            {"gte": int(payment.created_at.timestamp())},
+        )
+
+    def test_no_stripe_calls_without_open_payments(self) -> None:
+        sample_payment(user=self.user, status="success")
+
+        fake = self._reconcile([])
+
+        self.assertEqual(fake.calls, [])
+        self.assertEqual(self.changed, 0)
+
+    def test_not_paid_and_settled_payments_are_not_changed(self) -> None:
+        sample_payment(user=self.user, session_id="cs_unpaid")
+        sample_payment(user=self.user, session_id="cs_paid", status="success")
+
+        self._reconcile(
+            [
+                {
+                    "id": "cs_unpaid",
+                    "status": "complete",
+                    "payment_status": "unpaid",
+                },
+                {
+                    "id": "cs_paid",
+                    "status": "expired",
+                    "payment_status": "unpaid",
+                },
+            ]
+        )
+
+        self.assertEqual(self.changed, 0)
+        self.assertEqual(
+            list(Payment.objects.values_list("status", flat=True)),
+            ["success", "open"],
+        )
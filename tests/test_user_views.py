@@ -79,3 +79,12 @@ class AuthenticatedUserApiTests(TestCase):
         serializer = UserSerializer(another_user)
 
         self.assertNotEqual(response.data, serializer.data)
+
+    def test_manage_profile_user_with_sparse_fields(self) -> None:
+        response = self.client.get(
+            USER_RPROFILE, {"fields": "id,email,is_staff", "omit": "is_staff"}
+        )
+
+        self.assertEqual(
+            response.data, {"id": self.user.id, "email": self.user.email}
+        )
@@ -70,6 +70,8 @@ class UtilsTests(TestCase):
                 HOST + payment_is_success_url(payment_id=payment.id)
             ),
             cancel_url=str(HOST + cancel_payment_url(payment_id=payment.id)),
+            api_key=settings.STRIPE_API_KEY,
+            idempotency_key=mock.ANY,
         )
 
     @mock.patch("stripe.checkout.Session.create")
@@ -112,4 +114,6 @@ class UtilsTests(TestCase):
                 HOST + payment_is_success_url(payment_id=payment.id)
             ),
             cancel_url=str(HOST + cancel_payment_url(payment_id=payment.id)),
+            api_key=settings.STRIPE_API_KEY,
+            idempotency_key=mock.ANY,
         )
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 import telegram
@@ -22,6 +23,26 @@ async def send_msg(text: str, chat_user_id: int) -> None:
         await bot.send_message(text=text, chat_id=chat_user_id)
 
 
+async def send_msgs(messages: list[tuple[str, int]]) -> list:
+    """
+    Send (text, chat user id) messages through one telegram bot session,
+    at most TELEGRAM_SEND_CONCURRENCY at once. Return sent message or
+    exception for every message
+    """
+    semaphore = asyncio.Semaphore(settings.TELEGRAM_SEND_CONCURRENCY)
+    bot = telegram.Bot(settings.BOT_API)
+
+    async def send(text: str, chat_user_id: int):
+        async with semaphore:
+            return await bot.send_message(text=text, chat_id=chat_user_id)
+
+    async with bot:
+        return await asyncio.gather(
+            *(send(text, chat_user_id) for text, chat_user_id in messages),
+            return_exceptions=True,
+        )
+
+
 @sync_to_async
 def save_chat_id(chat_user_id: int, first_name: str) -> str:
     """
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.7 on 2026-10-17 04:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TelegramOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("text", models.TextField()),
+                ("chat_user_ids", models.JSONField(blank=True, null=True)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name_plural": "telegram outbox",
+                "ordering": ["id"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="telegramoutbox",
+            index=models.Index(
+                fields=["next_attempt_at", "id"], name="telegram_outbox_due_idx"
+            ),
+        ),
+    ]
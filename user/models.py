@@ -1,7 +1,12 @@
+import logging
+
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
+logger = logging.getLogger(__name__)
+
 
 class UserManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
@@ -51,3 +56,67 @@ class User(AbstractUser):
 
 class TelegramChat(models.Model):
     chat_user_id = models.IntegerField()
+
+
+def _wake_up_outbox_sender() -> None:
+    """Ask Django-Q worker to send queued messages right away"""
+    from django_q.tasks import async_task
+
+    try:
+        async_task("borrow.tasks.send_telegram_outbox")
+    except Exception:
+        # Scheduled task sends messages if the broker is not available
+        logger.warning("Telegram outbox sender is not queued", exc_info=True)
+
+
+class TelegramOutboxQuerySet(models.QuerySet):
+    def enqueue(self, text: str) -> "TelegramOutbox":
+        """
+        Write message for all telegram chats in the current transaction.
+        Worker is woken up after commit, so request does not wait for
+        Telegram and rolled back changes are not announced
+        """
+        message = self.create(text=text)
+        transaction.on_commit(_wake_up_outbox_sender)
+        return message
+
+    def enqueue_many(self, texts: list[str]) -> list["TelegramOutbox"]:
+        """Write messages by one INSERT like enqueue() does"""
+        if not texts:
+            return []
+        messages = self.bulk_create(self.model(text=text) for text in texts)
+        transaction.on_commit(_wake_up_outbox_sender)
+        return messages
+
+    def due(self, max_attempts: int) -> "TelegramOutboxQuerySet":
+        """Messages which can be tried now"""
+        return self.filter(
+            attempts__lt=max_attempts,
+            next_attempt_at__lte=timezone.now(),
+        )
+
+
+class TelegramOutbox(models.Model):
+    """
+    Telegram message waiting to be sent to chats by Django-Q worker. Sent
+    messages are deleted, messages out of attempts are kept for admins
+    """
+
+    text = models.TextField()
+    # Chats which did not get the message, all chats if it was not tried
+    chat_user_ids = models.JSONField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TelegramOutboxQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name_plural = "telegram outbox"
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at", "id"],
+                name="telegram_outbox_due_idx",
+            ),
+        ]
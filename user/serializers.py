@@ -3,8 +3,10 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
 
+from Library_service.fieldsets import SparseFieldsetsMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """User (customer) model."""
 
     class Meta: